@@ -28,6 +28,7 @@ from flyspeech.dataset.sampler import DistributedSampler
 from flyspeech.utils.common import IGNORE_ID, add_sos_eos, pad_sequence
 from flyspeech.utils.mask import add_optional_chunk_mask, make_pad_mask, subsequent_mask
 
+from mindaudio.data.augment import spec_augment
 from mindaudio.data.io import read
 from mindaudio.data.processing import resample
 
@@ -54,7 +55,9 @@ def speed_perturb(waveform, sample_rate):
     speed = random.choice(speeds)
 
     if speed != 1.0:
-        waveform = resample(waveform, sample_rate * speed, sample_rate)
+        waveform = resample(
+            waveform, sample_rate * speed, sample_rate, res_type="polyphase"
+        )
 
     return waveform
 
@@ -144,7 +147,7 @@ class CollateFunc:
         return sorted_uttids, sorted_feats, sorted_labels
 
     def spec_aug(self, xs, spec_aug_conf):
-        """Do specaugment. Inplace operation.
+        """Do specaugment on the whole batch at once.
 
         Args:
             xs: Iterable[{feat}]
@@ -158,33 +161,34 @@ class CollateFunc:
         Returns:
             Iterable[{feat}]
         """
-        num_t_mask = spec_aug_conf.get("num_t_mask", 0.0)
-        num_f_mask = spec_aug_conf.get("num_f_mask", 0.0)
+        num_t_mask = int(spec_aug_conf.get("num_t_mask", 0))
+        num_f_mask = int(spec_aug_conf.get("num_f_mask", 0))
         # prop_mask_t = spec_aug_conf.get('prop_mask_t', 0.0)
         # prop_mask_f = spec_aug_conf.get('prop_mask_f', 0.0)
-        max_t = spec_aug_conf.get("max_t", 0.0)
-        max_f = spec_aug_conf.get("max_f", 0.0)
-
-        for x in xs:
-            max_frames = x.shape[0]
-            max_freq = x.shape[1]
-            # time mask
-            for _ in range(num_t_mask):
-                start = random.randint(0, max_frames - 1)
-                # length = random.randint(1, int(prop_mask_t * max_frames))
-                length = random.randint(1, max_t)
-                end = min(max_frames, start + length)
-                if random.randint(1, 100) > 20:
-                    x[start:end, :] = 0
-            # freq mask
-            for _ in range(num_f_mask):
-                start = random.randint(0, max_freq - 1)
-                # length = random.randint(1, int(prop_mask_f * max_frames))
-                length = random.randint(1, max_f)
-                end = min(max_freq, start + length)
-                if random.randint(1, 100) > 20:
-                    x[:, start:end] = 0
-        return xs
+        max_t = int(spec_aug_conf.get("max_t", 0))
+        max_f = int(spec_aug_conf.get("max_f", 0))
+        max_w = 0
+        if spec_aug_conf.get("warp_for_time", False):
+            max_w = int(spec_aug_conf.get("max_w", 0))
+
+        lengths = np.array([x.shape[0] for x in xs])
+        max_frames = lengths.max()
+        feats = np.zeros((len(xs), max_frames, xs[0].shape[1]), dtype=xs[0].dtype)
+        for i, x in enumerate(xs):
+            feats[i, : lengths[i]] = x
+
+        # spec_augment expects [batch, freq, time]
+        feats = spec_augment(
+            feats.transpose(0, 2, 1),
+            lengths / max_frames,
+            num_freq_masks=num_f_mask,
+            freq_mask_width=max_f,
+            num_time_masks=num_t_mask,
+            time_mask_width=max_t,
+            time_warp=max_w,
+            mask_prob=0.8,
+        ).transpose(0, 2, 1)
+        return [feats[i, : lengths[i]] for i in range(len(xs))]
 
     def __call__(self, batch, sos=0, eos=0, max_src_len=2000, max_tgt_len=30):
         """Feature collate process, including feature extraction, data
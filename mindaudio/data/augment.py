@@ -1,30 +1,94 @@
-import random
+import functools
+import multiprocessing
+import os
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 
-import mindspore as ms
 import mindspore.dataset.audio as msaudio
+import numba
 import numpy as np
-from mindspore.nn import Conv1d
+from scipy.fft import irfft, next_fast_len, rfft
 
 from .filters import notch_filter
 from .io import read
-from .processing import resample, rescale
+from .processing import _polyphase_resample, rescale, stereo_to_mono
 from .spectrum import _pad_shape, compute_amplitude, dB_to_amplitude, istft, stft
 
 __all__ = [
+    "get_rng",
+    "worker_rng",
     "frequencymasking",
     "timemasking",
+    "spec_augment",
     "reverberate",
+    "NoiseBank",
     "add_noise",
+    "simulate_rir",
+    "RIRBank",
     "add_reverb",
     "add_babble",
+    "mix_babble",
     "drop_freq",
     "speed_perturb",
     "drop_chunk",
     "time_stretch",
     "pitch_shift",
+    "AugmentStage",
+    "AugmentPipeline",
 ]
 
 
+def get_rng(rng=None):
+    """
+    Get a random generator for the augmentation functions.
+
+    Args:
+        rng (int, np.random.SeedSequence, np.random.Generator): A seed or a
+            generator, which is returned as is (default=None, a generator
+            seeded from the global numpy random state, so `np.random.seed`
+            still makes the results reproducible).
+
+    Returns:
+        np.random.Generator, the generator.
+
+    Examples:
+        >>> import mindaudio.data.augment as augment
+        >>> rng = augment.get_rng(1234)
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng
+    if rng is None:
+        rng = np.random.randint(0, 2**63, dtype=np.int64)
+    return np.random.default_rng(rng)
+
+
+def worker_rng(seed, worker_id=0, epoch=0):
+    """
+    Get an independent random generator for a data worker in an epoch.
+
+    The generators come from a `np.random.SeedSequence` of `seed` spawned by
+    `(epoch, worker_id)`, so parallel workers never share a random stream and
+    every run with the same seed draws the same augmentations.
+
+    Args:
+        seed (int): The base seed of the run.
+        worker_id (int): The index of the worker (default=0).
+        epoch (int): The index of the epoch (default=0).
+
+    Returns:
+        np.random.Generator, the generator of the worker.
+
+    Examples:
+        >>> import mindaudio.data.augment as augment
+        >>> rng = augment.worker_rng(1234, worker_id=2, epoch=5)
+        >>> dropped = augment.drop_freq(waveforms, rng=rng)
+    """
+    return np.random.default_rng(
+        np.random.SeedSequence(seed, spawn_key=(epoch, worker_id))
+    )
+
+
 def frequencymasking(
     waveform,
     iid_masks=False,
@@ -98,6 +162,145 @@ def timemasking(
     return time_masking(waveform)
 
 
+def _time_warp(specgrams, lengths, time_warp, rng):
+    # Piecewise-linear warp of the time axis of every item: the frame at a
+    # random center moves by a random distance of at most `time_warp`
+    # frames, and the frames on both sides are linearly interpolated.
+    batch_size, _, num_frames = specgrams.shape
+    lengths = np.maximum(lengths, 1)
+    frames = np.arange(num_frames, dtype=np.float64)
+
+    low = np.minimum(time_warp + 1, lengths - 1)
+    high = np.maximum(lengths - time_warp - 1, low)
+    center = low + rng.random(batch_size) * (high - low)
+    shift = rng.uniform(-time_warp, time_warp, batch_size)
+    shift = np.clip(shift, 1 - center, lengths - center - 2)
+    warped = (center + shift)[:, None]
+    center = center[:, None]
+    lengths = lengths[:, None]
+
+    # Items too short to warp keep their frames
+    with np.errstate(divide="ignore", invalid="ignore"):
+        source = np.where(
+            frames < warped,
+            frames * center / warped,
+            center
+            + (frames - warped) * (lengths - 1 - center) / (lengths - 1 - warped),
+        )
+    source = np.where((frames < lengths) & (lengths > 3), source, frames)
+    index = np.clip(source.astype(np.int64), 0, num_frames - 2)
+    alpha = (source - index)[:, None, :].astype(specgrams.dtype)
+    left = np.take_along_axis(specgrams, index[:, None, :], axis=-1)
+    right = np.take_along_axis(specgrams, index[:, None, :] + 1, axis=-1)
+    return (1.0 - alpha) * left + alpha * right
+
+
+def _mask_intervals(num_masks, max_width, size, batch_size, mask_prob, rng):
+    # Boolean `[batch, size]` union of `num_masks` random intervals per item,
+    # each of width in [0, max_width] inside the first `size` positions.
+    shape = (batch_size, num_masks)
+    width = (rng.random(shape) * (max_width + 1)[:, None]).astype(np.int64)
+    width[rng.random(shape) >= mask_prob] = 0
+    start = (rng.random(shape) * (size[:, None] - width + 1)).astype(np.int64)
+    positions = np.arange(size.max())[None, None, :]
+    inside = (positions >= start[..., None]) & (positions < (start + width)[..., None])
+    return inside.any(axis=1)
+
+
+def spec_augment(
+    specgrams,
+    lengths=None,
+    num_freq_masks=2,
+    freq_mask_width=27,
+    num_time_masks=2,
+    time_mask_width=40,
+    time_mask_ratio=None,
+    time_warp=0,
+    mask_prob=1.0,
+    mask_value=0.0,
+    rng=None,
+):
+    """
+    Apply SpecAugment to a batch of spectrograms, with masks drawn
+    independently for every item.
+
+    Every item gets `num_freq_masks` frequency masks and `num_time_masks` time
+    masks of random widths and positions, plus an optional time warp. All
+    masks of the batch are combined into one boolean mask that is applied in
+    a single operation.
+
+    Args:
+        specgrams (np.ndarray): Spectrograms of shape `[batch, freq, time]` or
+            `[freq, time]`.
+        lengths (np.ndarray): The relative lengths of the spectrograms with
+            shape `[batch]`. Time masks and warping stay inside the valid
+            frames (default=None, all frames are valid).
+        num_freq_masks (int): Number of frequency masks per item (default=2).
+        freq_mask_width (int): Maximum width of a frequency mask (default=27).
+        num_time_masks (int): Number of time masks per item (default=2).
+        time_mask_width (int): Maximum width of a time mask (default=40).
+        time_mask_ratio (float): If given, the maximum width of the time masks
+            of an item is also limited to this fraction of its length
+            (default=None).
+        time_warp (int): Maximum distance in frames of the time warp, 0
+            disables warping (default=0).
+        mask_prob (float): The probability that each mask is applied
+            (default=1.0).
+        mask_value (float): Value of the masked bins (default=0.0).
+        rng (int, np.random.Generator): The seed or generator of the random
+            draws (default=None, see `get_rng`).
+
+    Returns:
+        np.ndarray, the augmented spectrograms with the input shape.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.augment as augment
+        >>> specgrams = np.random.rand(8, 80, 300)
+        >>> lengths = np.random.uniform(0.5, 1.0, 8)
+        >>> augmented = augment.spec_augment(specgrams, lengths, time_warp=5)
+    """
+    orig_ndim = specgrams.ndim
+    if orig_ndim == 2:
+        specgrams = specgrams[None]
+    batch_size, num_freqs, num_frames = specgrams.shape
+    rng = get_rng(rng)
+
+    if lengths is None:
+        frame_lengths = np.full(batch_size, num_frames)
+    else:
+        frame_lengths = np.round(np.asarray(lengths) * num_frames).astype(np.int64)
+
+    if time_warp > 0:
+        specgrams = _time_warp(specgrams, frame_lengths, time_warp, rng)
+
+    max_time_width = np.full(batch_size, time_mask_width, dtype=np.int64)
+    if time_mask_ratio is not None:
+        max_time_width = np.minimum(
+            max_time_width, (time_mask_ratio * frame_lengths).astype(np.int64)
+        )
+    max_time_width = np.minimum(max_time_width, frame_lengths)
+
+    freq_mask = _mask_intervals(
+        num_freq_masks,
+        np.full(batch_size, min(freq_mask_width, num_freqs)),
+        np.full(batch_size, num_freqs),
+        batch_size,
+        mask_prob,
+        rng,
+    )
+    time_mask = np.zeros((batch_size, num_frames), dtype=bool)
+    time_mask[:, : frame_lengths.max()] = _mask_intervals(
+        num_time_masks, max_time_width, frame_lengths, batch_size, mask_prob, rng
+    )
+    mask = freq_mask[:, :, None] | time_mask[:, None, :]
+    specgrams = np.where(mask, mask_value, specgrams).astype(specgrams.dtype)
+
+    if orig_ndim == 2:
+        specgrams = specgrams[0]
+    return specgrams
+
+
 def reverberate(waveforms, rir_waveform, rescale_amp="avg"):
     """
     Reverberate a given signal with given a Room Impulse Response (RIR).
@@ -174,6 +377,55 @@ def reverberate(waveforms, rir_waveform, rescale_amp="avg"):
     return waveforms
 
 
+def _linear_convolve(waveforms, kernel, method="auto"):
+    """
+    Full linear convolution of each row of `waveforms`.
+
+    Args:
+        waveforms (np.ndarray): Signals with shape `[batch, time]`.
+        kernel (np.ndarray): One kernel shared by all rows with shape
+            `[1, kernel_size]`, or one per row with shape
+            `[batch, kernel_size]`.
+        method (str): Options: ["auto", "direct", "fft", "overlap"]. "auto"
+            uses direct summation for short kernels, block convolution for
+            signals much longer than the kernel and a single FFT otherwise.
+
+    Returns:
+        np.ndarray, with shape `[batch, time + kernel_size - 1]`.
+    """
+    num_samples = waveforms.shape[-1]
+    kernel_size = kernel.shape[-1]
+    out_length = num_samples + kernel_size - 1
+
+    if method == "auto":
+        if kernel_size <= 32:
+            method = "direct"
+        elif num_samples >= 8 * kernel_size:
+            method = "overlap"
+        else:
+            method = "fft"
+
+    if method == "direct":
+        dtype = np.result_type(waveforms, kernel)
+        convolved = np.zeros((waveforms.shape[0], out_length), dtype=dtype)
+        for k in range(kernel_size):
+            convolved[:, k : k + num_samples] += kernel[:, k : k + 1] * waveforms
+    elif method == "fft":
+        n_fft = next_fast_len(out_length, real=True)
+        spectra = rfft(waveforms, n_fft, axis=-1) * rfft(kernel, n_fft, axis=-1)
+        convolved = irfft(spectra, n_fft, axis=-1)[:, :out_length]
+    elif method == "overlap":
+        n_fft = next_fast_len(min(16 * kernel_size, out_length), real=True)
+        kernel_spectra = rfft(kernel, n_fft, axis=-1)
+        convolved = _overlap_save(waveforms, kernel_spectra, kernel_size, n_fft)
+    else:
+        raise ValueError(
+            "method must be one of 'auto', 'direct', 'fft' or 'overlap', "
+            "but got {}.".format(method)
+        )
+    return convolved
+
+
 def convolve1d(
     waveforms,
     kernel,
@@ -184,11 +436,15 @@ def convolve1d(
     use_fft=True,
     rotation_index=0,
 ):
-    """Use mindspore.conv1d to perform 1d padding and convolution.
+    """Perform 1d padding and linear convolution.
 
     Args:
-        waveforms (np.ndarray): The audio signal to perform convolution on.
-        kernel (np.ndarray): The filter kernel to apply during convolution.
+        waveforms (np.ndarray): The audio signal to perform convolution on,
+            with shape `[time]`, `[batch, time]` or `[batch, time, channels]`.
+        kernel (np.ndarray): The filter kernel to apply during convolution,
+            with shape `[kernel_size]`, `[batch, kernel_size]` or
+            `[batch, kernel_size, channels]`. A batch or channel size of 1 is
+            shared, otherwise every item gets its own kernel.
         padding (int, tuple): The padding size to apply at
             left side and right side.
         pad_type (str): The type of padding to use.
@@ -196,18 +452,17 @@ def convolve1d(
         stride (int): The number of units to stride for the
             convolution operations. If `use_fft` is True, this will not have
             effects.
-        groups (int): This option is passed to `conv1d` to split the input
-            into groups for convolution. Input channels
-            should be divisible by the number of groups.
-        use_fft (bool): When `use_fft` is passed `True`, then compute the
-            convolution in the spectral domain using complex multiply.
-            This is more efficient on CPU when the size of the kernel is large.
-            WARNING: Without padding, circular convolution occurs.
-            This makes little difference in the case of reverberation,
-            but may make more difference with different kernels.
+        groups (int): Kept for compatibility, kernels are always applied
+            per channel.
+        use_fft (bool): When `use_fft` is passed `True`, the output is the
+            convolution with the same length as the padded signal, shifted by
+            `rotation_index`. Otherwise the output is the valid
+            cross-correlation with the kernel, as computed by `Conv1d`. Both
+            modes pick direct, FFT or block convolution from the kernel and
+            signal sizes.
         rotation_index (int): This option only applies if `use_fft` is true.
-            If so, the kernel is rolled by this amount
-            before convolution to shift the output location.
+            If so, the output is advanced by this amount, which keeps for
+            example the direct path of a RIR aligned with the input.
 
     Returns:
         np.ndarray, the convolved waveform.
@@ -216,58 +471,44 @@ def convolve1d(
     n_dim = len(waveforms.shape)
     if n_dim == 1:
         waveforms = np.expand_dims(np.expand_dims(waveforms, -1), 0)
+    elif n_dim == 2:
+        waveforms = np.expand_dims(waveforms, -1)
     if len(kernel.shape) == 1:
         kernel = np.expand_dims(np.expand_dims(kernel, -1), 0)
-
-    # batchify waveforms and kernels
-    if n_dim == 2:
-        waveforms = np.expand_dims(waveforms, -1)
-    if n_dim == 2:
+    elif len(kernel.shape) == 2:
         kernel = np.expand_dims(kernel, -1)
 
     waveforms = np.transpose(waveforms, [0, 2, 1])  # make sure time last
     kernel = np.transpose(kernel, [0, 2, 1])  # make sure time last
 
     # Padding can be a tuple (left_pad, right_pad) or an int
-    if isinstance(padding, tuple):
-        waveforms = np.pad(waveforms, pad=padding, mode=pad_type)
-
-    # This approach uses FFT, which is more efficient if the kernel is large
-    if use_fft:
-        # Pad kernel to same length as signal, ensuring correct alignment
-        zero_length = waveforms.shape[-1] - kernel.shape[-1]
-
-        # Handle case where signal is shorter
-        if zero_length < 0:
-            kernel = kernel[..., :zero_length]
-            zero_length = 0
-
-        # Perform rotation to ensure alignment
-        zeros = np.zeros((kernel.shape[0], kernel.shape[1], zero_length))
-
-        after_index = kernel[..., rotation_index:]
-        before_index = kernel[..., :rotation_index]
-        kernel = np.concatenate((after_index, zeros, before_index), axis=-1)
+    if isinstance(padding, int):
+        padding = (padding, padding)
+    if padding != (0, 0):
+        waveforms = np.pad(waveforms, ((0, 0), (0, 0), padding), mode=pad_type)
+
+    batch, channels, num_samples = waveforms.shape
+    kernel_size = kernel.shape[-1]
+    if kernel.shape[0] == 1 and kernel.shape[1] == 1:
+        kernel = kernel.reshape(1, kernel_size)
+    else:
+        kernel = np.broadcast_to(kernel, (batch, channels, kernel_size))
+        kernel = kernel.reshape(batch * channels, kernel_size)
 
-        result = np.fft.rfft(waveforms) * np.fft.rfft(kernel)
-        convolved = np.fft.irfft(result, n=waveforms.shape[-1])
+    if not use_fft:
+        # Conv1d computes a cross-correlation
+        kernel = kernel[:, ::-1]
+    convolved = _linear_convolve(waveforms.reshape(-1, num_samples), kernel)
 
+    if use_fft:
+        convolved = convolved[:, rotation_index : rotation_index + num_samples]
+        if convolved.shape[-1] < num_samples:
+            convolved = np.pad(
+                convolved, ((0, 0), (0, num_samples - convolved.shape[-1]))
+            )
     else:
-        # Todo: the implementation can be optimized here.
-        conv1d = Conv1d(
-            1,
-            1,
-            kernel_size=kernel.shape[-1],
-            stride=stride,
-            group=groups,
-            padding=0,
-            pad_mode="valid",
-        )
-        weight = ms.Tensor(np.expand_dims(kernel, 0))
-        weight.set_dtype(ms.float32)
-        conv1d.weight.set_data(weight)
-        data = ms.Tensor(waveforms).astype(ms.float32)
-        convolved = conv1d(data).asnumpy()
+        convolved = convolved[:, kernel_size - 1 : num_samples : stride]
+    convolved = convolved.reshape(batch, channels, -1)
 
     if n_dim == 1:  # meaning num_channel and batch dimension are expanded
         convolved = np.squeeze(np.squeeze(convolved, 1), 0)
@@ -307,17 +548,106 @@ def caculate_rms(samples):
     return rms
 
 
-def add_noise(samples, backgroundlist, min_snr_in_db, max_snr_in_db, mix_prob=1.0):
+class NoiseBank:
+    """
+    A corpus of background noises kept in memory for fast noise mixing.
+
+    All noise files are read once, converted to mono, normalized to unit RMS
+    and stored back to back in one flat array, so drawing noise for a batch
+    is a single gather instead of file reads and concatenations on every
+    call. When `cache_file` is given, the flat array is saved there on the
+    first use and memory-mapped afterwards, which lets several data workers
+    share one copy of a large corpus.
+
+    Args:
+        backgroundlist (list): List of paths to background audio files.
+        cache_file (str): Path of a `.npy` file to store and memory-map the
+            corpus (default=None, keep the corpus in memory only).
+        dtype (np.dtype): Data type of the stored noise (default=np.float32).
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.augment as augment
+        >>> bank = augment.NoiseBank(['./samples/ASR/1089-134686-0000.wav'])
+        >>> samples = np.random.rand(10, 1, 16000) - 0.5
+        >>> noise_added_samples = augment.add_noise(samples, bank, 3, 30)
+    """
+
+    def __init__(self, backgroundlist, cache_file=None, dtype=np.float32):
+        if cache_file is not None and not cache_file.endswith(".npy"):
+            cache_file += ".npy"
+        offsets_file = (
+            None if cache_file is None else cache_file[: -len(".npy")] + "_offsets.npy"
+        )
+
+        if cache_file is not None and os.path.exists(cache_file):
+            self.data = np.load(cache_file, mmap_mode="r")
+            self.offsets = np.load(offsets_file)
+            return
+
+        pieces = []
+        for background_path in backgroundlist:
+            noise_audio, _ = read(background_path)
+            noise_audio = stereo_to_mono(noise_audio)
+            pieces.append(rms_normalize(noise_audio).astype(dtype))
+        if not pieces:
+            raise ValueError("backgroundlist must contain at least one file.")
+
+        self.offsets = np.cumsum([0] + [len(piece) for piece in pieces])
+        self.data = np.concatenate(pieces)
+
+        if cache_file is not None:
+            np.save(cache_file, self.data)
+            np.save(offsets_file, self.offsets)
+            self.data = np.load(cache_file, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def sample(self, batch_size, num_samples, rng=None):
+        """
+        Draw random unit-RMS noise crops.
+
+        Each crop starts at a random position of a randomly chosen file and
+        continues into the following files if that file is too short.
+
+        Args:
+            batch_size (int): Number of crops.
+            num_samples (int): Length of each crop.
+            rng (int, np.random.Generator): The seed or generator of the
+                random draws (default=None, see `get_rng`).
+
+        Returns:
+            np.ndarray, noise with shape `[batch_size, num_samples]`.
+        """
+        rng = get_rng(rng)
+        index = rng.integers(0, len(self), size=batch_size)
+        lengths = self.offsets[index + 1] - self.offsets[index]
+        starts = self.offsets[index] + (rng.random(batch_size) * lengths).astype(
+            np.int64
+        )
+        positions = (starts[:, None] + np.arange(num_samples)) % len(self.data)
+        noise = self.data[positions]
+        return noise / (caculate_rms(noise)[:, None] + 1e-8)
+
+
+def add_noise(
+    samples, backgroundlist, min_snr_in_db, max_snr_in_db, mix_prob=1.0, rng=None
+):
     """
     add background noise.
 
     Args:
         samples (np.ndarray): The audio signal to perform convolution on.The
         shape should be`[time]` or `[batch, time]` or `[batch, channels, time]`
-        backgroundlist (list): List of paths to background audio files.
+        backgroundlist (list, NoiseBank): List of paths to background audio
+            files, or a `NoiseBank`. With a `NoiseBank` every item of the
+            batch gets its own noise crop and SNR.
         min_snr_in_db(int): nimimum SNR in dB
         max_snr_in_db(int): maximum SNR in dB
         mix_prob(float): The probablity that the audio signals will be mix.
+        rng(int, np.random.Generator): The seed or generator of the random
+            draws (default=None, see `get_rng`).
 
     Returns:
         samples(np.ndarray):samples added background noise
@@ -328,7 +658,8 @@ def add_noise(samples, backgroundlist, min_snr_in_db, max_snr_in_db, mix_prob=1.
         >>> background_list = ['./samples/ASR/1089-134686-0000.wav']
         >>> noise_added_saples = add_noise(samples, background_list, 3, 30)
     """
-    if np.random.rand(1) > mix_prob:
+    rng = get_rng(rng)
+    if rng.random() > mix_prob:
         return samples
 
     dimension_of_samples = len(samples.shape)
@@ -342,34 +673,35 @@ def add_noise(samples, backgroundlist, min_snr_in_db, max_snr_in_db, mix_prob=1.
         samples = np.expand_dims(samples, 1)
     batch, chanel, sample_lenth = samples.shape
 
-    missing_num_samples = sample_lenth
-    pieces = None
-    while missing_num_samples > 0:
-        background_path = random.choice(backgroundlist)
-        noise_audio, sr = read(background_path)
-        background_num_samples = len(noise_audio)
-
-        if background_num_samples > missing_num_samples:
-            num_samples = missing_num_samples
-            background_samples = rms_normalize(noise_audio[:num_samples])
-            missing_num_samples = 0
-        else:
-            background_samples = rms_normalize(noise_audio)
-            missing_num_samples -= background_num_samples
-
-        if pieces is not None:
-            pieces = np.append(pieces, background_samples)
-        else:
-            pieces = background_samples
-
-    background = rms_normalize(pieces.reshape(1, sample_lenth))
+    if isinstance(backgroundlist, NoiseBank):
+        background = np.expand_dims(
+            backgroundlist.sample(batch, sample_lenth, rng=rng), 1
+        )
+        snr = rng.uniform(min_snr_in_db, max_snr_in_db, (batch, 1))
+    else:
+        missing_num_samples = sample_lenth
+        pieces = []
+        while missing_num_samples > 0:
+            background_path = backgroundlist[rng.integers(len(backgroundlist))]
+            noise_audio, sr = read(background_path)
+            background_num_samples = len(noise_audio)
+
+            if background_num_samples > missing_num_samples:
+                num_samples = missing_num_samples
+                background_samples = rms_normalize(noise_audio[:num_samples])
+                missing_num_samples = 0
+            else:
+                background_samples = rms_normalize(noise_audio)
+                missing_num_samples -= background_num_samples
+
+            pieces.append(background_samples)
+
+        background = rms_normalize(np.concatenate(pieces).reshape(1, 1, sample_lenth))
+        snr = rng.uniform(min_snr_in_db, max_snr_in_db, 1)
 
     sample_rms = caculate_rms(samples)
-    snr = np.random.uniform(min_snr_in_db, max_snr_in_db, 1)
     background_scale = sample_rms / (10 ** (snr / 20))
-    background_noise = (np.expand_dims(background, axis=0)) * (
-        np.expand_dims(background_scale, axis=2)
-    )
+    background_noise = background * np.expand_dims(background_scale, axis=2)
     samples_added_noise = samples + background_noise
 
     if dimension_of_samples == 1:
@@ -380,7 +712,370 @@ def add_noise(samples, backgroundlist, min_snr_in_db, max_snr_in_db, mix_prob=1.
     return samples_added_noise
 
 
-def add_reverb(samples, rirlist, reverb_prob=1.0):
+def _overlap_save(waveforms, kernel_spectra, kernel_length, n_fft):
+    """
+    Full linear convolution of each row of `waveforms` with its own kernel,
+    given the kernel spectra at `n_fft`.
+
+    The signal is cut into blocks of `n_fft - kernel_length + 1` new samples,
+    so the working memory stays close to the signal size however long the
+    kernel is. Returns an array of shape `[batch, time + kernel_length - 1]`.
+    """
+    batch, num_samples = waveforms.shape
+    step = n_fft - kernel_length + 1
+    out_length = num_samples + kernel_length - 1
+    num_blocks = -(-out_length // step)
+
+    padded = np.zeros((batch, (num_blocks - 1) * step + n_fft), dtype=waveforms.dtype)
+    padded[:, kernel_length - 1 : kernel_length - 1 + num_samples] = waveforms
+    blocks = np.lib.stride_tricks.sliding_window_view(padded, n_fft, axis=-1)[:, ::step]
+
+    spectra = rfft(blocks, n_fft, axis=-1) * kernel_spectra[:, None, :]
+    convolved = irfft(spectra, n_fft, axis=-1)[..., kernel_length - 1 :]
+    return convolved.reshape(batch, num_blocks * step)[:, :out_length]
+
+
+@numba.njit(cache=True)
+def _image_axis(index, length, position, beta):
+    # Coordinate of the `index`-th image along one axis and the product of
+    # the reflection coefficients of the walls at 0 and at `length` it hit.
+    if index % 2 == 0:
+        coordinate = index * length + position
+    else:
+        coordinate = (index + 1) * length - position
+    if index >= 0:
+        near, far = index // 2, (index + 1) // 2
+    else:
+        near, far = (1 - index) // 2, -index // 2
+    return coordinate, beta[0] ** near * beta[1] ** far
+
+
+@numba.njit(parallel=True, cache=True)
+def _image_source_rirs(room_size, source, microphone, beta, max_order, fs_c, taps, out):
+    # Allen & Berkley image sources of every room up to `max_order`
+    # reflections, each added as a Hann-windowed sinc centered on its
+    # fractional delay. The sinc numerator alternates in sign along the taps
+    # and the window is advanced by rotation, so no trigonometric call is
+    # made per tap.
+    half = taps // 2
+    step_cos = np.cos(2.0 * np.pi / taps)
+    step_sin = np.sin(2.0 * np.pi / taps)
+    for b in numba.prange(out.shape[0]):
+        for ix in range(-max_order, max_order + 1):
+            x, gain_x = _image_axis(ix, room_size[b, 0], source[b, 0], beta[b, 0:2])
+            dx = x - microphone[b, 0]
+            rest_x = max_order - abs(ix)
+            for iy in range(-rest_x, rest_x + 1):
+                y, gain_y = _image_axis(iy, room_size[b, 1], source[b, 1], beta[b, 2:4])
+                dy = y - microphone[b, 1]
+                rest_y = rest_x - abs(iy)
+                for iz in range(-rest_y, rest_y + 1):
+                    z, gain_z = _image_axis(
+                        iz, room_size[b, 2], source[b, 2], beta[b, 4:6]
+                    )
+                    dz = z - microphone[b, 2]
+                    distance = np.sqrt(dx * dx + dy * dy + dz * dz)
+                    delay = distance * fs_c
+                    gain = (
+                        gain_x * gain_y * gain_z / (4.0 * np.pi * max(distance, 1e-3))
+                    )
+
+                    first = int(np.floor(delay)) - half + 1
+                    t = first - delay
+                    sin_t = np.sin(np.pi * t)
+                    angle = 2.0 * np.pi * t / taps
+                    win_cos = np.cos(angle)
+                    win_sin = np.sin(angle)
+                    for n in range(first, first + taps):
+                        if 0 <= n < out.shape[1]:
+                            if abs(t) < 1e-6:
+                                value = 1.0
+                            else:
+                                value = sin_t / (np.pi * t)
+                            out[b, n] += gain * (0.5 + 0.5 * win_cos) * value
+                        t += 1.0
+                        sin_t = -sin_t
+                        win_cos, win_sin = (
+                            win_cos * step_cos - win_sin * step_sin,
+                            win_sin * step_cos + win_cos * step_sin,
+                        )
+
+
+def simulate_rir(
+    room_size,
+    source,
+    microphone,
+    absorption=0.3,
+    sample_rate=16000,
+    max_order=8,
+    rir_length=None,
+    sound_speed=343.0,
+    sinc_taps=32,
+):
+    """
+    Simulate room impulse responses of shoebox rooms with the image-source
+    method.
+
+    Every room is an axis-aligned box with a corner at the origin. All image
+    sources with at most `max_order` wall reflections are added with a
+    windowed-sinc fractional delay, attenuated by the distance and by the
+    reflection coefficient `sqrt(1 - absorption)` of every wall they hit.
+    Rooms are simulated in parallel by a compiled kernel.
+
+    Args:
+        room_size (np.ndarray): The room dimensions in meters, shape `[3]` or
+            `[batch, 3]`.
+        source (np.ndarray): The source positions, shape `[3]` or
+            `[batch, 3]`.
+        microphone (np.ndarray): The microphone positions, shape `[3]` or
+            `[batch, 3]`.
+        absorption (float, np.ndarray): The energy absorption of the walls,
+            a scalar, one value per room `[batch]` or one per wall
+            `[batch, 6]` in the order x=0, x=L, y=0, y=W, z=0, z=H
+            (default=0.3).
+        sample_rate (int): The sampling rate of the RIRs (default=16000).
+        max_order (int): The maximum number of reflections (default=8).
+        rir_length (int): The number of samples of the RIRs (default=None,
+            long enough for the farthest image source).
+        sound_speed (float): The speed of sound in m/s (default=343.0).
+        sinc_taps (int): The length of the fractional-delay filters
+            (default=32).
+
+    Returns:
+        np.ndarray, the RIRs with shape `[batch, rir_length]`, or
+        `[rir_length]` if all positions are 1D.
+
+    Examples:
+        >>> import mindaudio.data.augment as augment
+        >>> rir = augment.simulate_rir([6.0, 4.0, 3.0], [2.0, 1.5, 1.2],
+        ...                            [4.0, 2.5, 1.5], absorption=0.4)
+    """
+    unbatched = np.ndim(room_size) == np.ndim(source) == np.ndim(microphone) == 1
+    room_size, source, microphone = np.broadcast_arrays(
+        np.atleast_2d(np.asarray(room_size, dtype=np.float64)),
+        np.atleast_2d(np.asarray(source, dtype=np.float64)),
+        np.atleast_2d(np.asarray(microphone, dtype=np.float64)),
+    )
+    batch_size = room_size.shape[0]
+    absorption = np.asarray(absorption, dtype=np.float64)
+    if absorption.ndim == 1:
+        absorption = absorption[:, None]
+    beta = np.sqrt(1.0 - np.broadcast_to(absorption, (batch_size, 6)))
+
+    if rir_length is None:
+        # No image with at most `max_order` reflections is farther than this
+        farthest = (max_order + 1) * np.linalg.norm(room_size, axis=-1).max()
+        rir_length = int(np.ceil(farthest * sample_rate / sound_speed)) + sinc_taps
+
+    rirs = np.zeros((batch_size, rir_length))
+    _image_source_rirs(
+        np.ascontiguousarray(room_size),
+        np.ascontiguousarray(source),
+        np.ascontiguousarray(microphone),
+        np.ascontiguousarray(beta),
+        max_order,
+        sample_rate / sound_speed,
+        sinc_taps,
+        rirs,
+    )
+    rirs = rirs.astype(np.float32)
+    if unbatched:
+        rirs = rirs[0]
+    return rirs
+
+
+class RIRBank:
+    """
+    A set of room impulse responses (RIRs) prepared for batched reverberation.
+
+    The RIRs are read once, converted to mono and zero-padded to a common
+    length; convolution runs in single precision. Their spectra are computed
+    once per FFT size and cached. The FFT size is the next power of two that
+    holds the whole convolution of short signals, capped at `block_factor`
+    times the RIR length. Longer signals are convolved block by block with
+    overlap-save, so memory does not grow with signal length times RIR
+    length. Unlike `reverberate`, the convolution is linear rather than
+    circular.
+
+    Args:
+        rirlist (list, np.ndarray): List of paths to RIR files, or the RIRs
+            as an array of shape `[num_rirs, length]`, e.g. from
+            `simulate_rir`.
+        block_factor (int): Ratio of the largest FFT size to the RIR length
+            (default=4).
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.augment as augment
+        >>> rir_bank = augment.RIRBank(
+        ...     ['./samples/rir/air_binaural_aula_carolina_0_1_3_0_3_16k.wav'])
+        >>> samples = np.random.rand(10, 200960) - 0.5
+        >>> reverbed = rir_bank.reverberate(samples)
+    """
+
+    def __init__(self, rirlist, block_factor=4):
+        if isinstance(rirlist, np.ndarray):
+            rirs = list(np.atleast_2d(rirlist))
+        else:
+            rirs = []
+            for rir_path in rirlist:
+                rir_waveform, _ = read(rir_path)
+                rirs.append(stereo_to_mono(rir_waveform))
+        if not rirs:
+            raise ValueError("rirlist must contain at least one file.")
+
+        self.kernel_length = max(len(rir) for rir in rirs)
+        self.rirs = np.zeros((len(rirs), self.kernel_length), dtype=np.float32)
+        for i, rir in enumerate(rirs):
+            self.rirs[i, : len(rir)] = rir
+        # Index of the direct path, used to keep the output aligned
+        self.direct_index = np.argmax(np.abs(self.rirs), axis=-1)
+        self.max_fft = 1 << int(np.ceil(np.log2(block_factor * self.kernel_length)))
+        self._spectra = {}
+
+    @classmethod
+    def simulate(
+        cls,
+        num_rirs,
+        sample_rate=16000,
+        room_size_low=(3.0, 3.0, 2.5),
+        room_size_high=(10.0, 10.0, 4.0),
+        absorption_low=0.1,
+        absorption_high=0.6,
+        max_order=8,
+        rir_length=None,
+        block_factor=4,
+        rng=None,
+    ):
+        """
+        Build a bank of simulated RIRs of random shoebox rooms.
+
+        Room dimensions, the absorption of every wall and the source and
+        microphone positions (at least 0.5 m from the walls when the room
+        allows it) are drawn uniformly, then all RIRs are simulated in one
+        call of `simulate_rir`.
+
+        Args:
+            num_rirs (int): The number of RIRs.
+            sample_rate (int): The sampling rate of the RIRs (default=16000).
+            room_size_low (tuple): The smallest room dimensions in meters
+                (default=(3.0, 3.0, 2.5)).
+            room_size_high (tuple): The largest room dimensions in meters
+                (default=(10.0, 10.0, 4.0)).
+            absorption_low (float): The lowest wall absorption (default=0.1).
+            absorption_high (float): The highest wall absorption
+                (default=0.6).
+            max_order (int): The maximum number of reflections (default=8).
+            rir_length (int): The number of samples of the RIRs (default=None,
+                see `simulate_rir`).
+            block_factor (int): Ratio of the largest FFT size to the RIR
+                length (default=4).
+            rng (int, np.random.Generator): The seed or generator of the
+                random draws (default=None, see `get_rng`).
+
+        Returns:
+            RIRBank, the bank of simulated RIRs.
+        """
+        rng = get_rng(rng)
+        room_size = rng.uniform(room_size_low, room_size_high, (num_rirs, 3))
+        margin = np.minimum(0.5, room_size / 4)
+        source = rng.uniform(margin, room_size - margin)
+        microphone = rng.uniform(margin, room_size - margin)
+        absorption = rng.uniform(absorption_low, absorption_high, (num_rirs, 6))
+        rirs = simulate_rir(
+            room_size,
+            source,
+            microphone,
+            absorption,
+            sample_rate=sample_rate,
+            max_order=max_order,
+            rir_length=rir_length,
+        )
+        return cls(rirs, block_factor=block_factor)
+
+    def __len__(self):
+        return len(self.rirs)
+
+    def spectra(self, n_fft):
+        """Return the cached RIR spectra at FFT size `n_fft`."""
+        if n_fft not in self._spectra:
+            self._spectra[n_fft] = rfft(self.rirs, n_fft, axis=-1)
+        return self._spectra[n_fft]
+
+    def kernels(self, batch_size, index=None, rng=None):
+        """
+        Draw RIRs for a batch.
+
+        Args:
+            batch_size (int): Number of RIRs.
+            index (np.ndarray): Index of the RIR of each item (default=None,
+                draw them at random).
+            rng (int, np.random.Generator): The seed or generator of the
+                random draws (default=None, see `get_rng`).
+
+        Returns:
+            - np.ndarray, the RIRs with shape `[batch_size, kernel_length]`.
+            - np.ndarray, the index of the direct path of each RIR.
+        """
+        if index is None:
+            index = get_rng(rng).integers(0, len(self), size=batch_size)
+        index = np.broadcast_to(index, (batch_size,))
+        return self.rirs[index], self.direct_index[index]
+
+    def reverberate(self, waveforms, index=None, rescale_amp="avg", rng=None):
+        """
+        Reverberate every item of a batch with its own RIR.
+
+        Args:
+            waveforms (np.ndarray): The audio signals, shape `[time]` or
+                `[batch, time]`.
+            index (np.ndarray): Index of the RIR used for each item
+                (default=None, draw them at random).
+            rescale_amp (str): Whether reverberated signal is rescaled (None)
+                and with respect either to original signal "peak" amplitude
+                or "avg" average amplitude. Options: [None, "avg", "peak"].
+            rng (int, np.random.Generator): The seed or generator of the
+                random draws (default=None, see `get_rng`).
+
+        Returns:
+            np.ndarray, the reverberated signals with the input shape.
+        """
+        if rescale_amp not in [None, "avg", "peak"]:
+            raise ValueError("rescale_amp must be None, 'avg' or 'peak'.")
+
+        orig_ndim = waveforms.ndim
+        waveforms = np.atleast_2d(waveforms)
+        batch, num_samples = waveforms.shape
+        if index is None:
+            index = get_rng(rng).integers(0, len(self), size=batch)
+        index = np.broadcast_to(index, (batch,))
+
+        length = num_samples + self.kernel_length - 1
+        n_fft = min(1 << int(np.ceil(np.log2(length))), self.max_fft)
+        convolved = _overlap_save(
+            waveforms.astype(np.float32),
+            self.spectra(n_fft)[index],
+            self.kernel_length,
+            n_fft,
+        )
+
+        # Keep the direct path of each RIR aligned with the dry signal
+        positions = self.direct_index[index][:, None] + np.arange(num_samples)
+        reverbed = np.take_along_axis(convolved, positions, axis=-1)
+
+        if rescale_amp is not None:
+            amp = np.mean if rescale_amp == "avg" else np.max
+            orig_amplitude = amp(np.abs(waveforms), axis=-1, keepdims=True)
+            new_amplitude = amp(np.abs(reverbed), axis=-1, keepdims=True)
+            reverbed = reverbed * (orig_amplitude / (new_amplitude + 1e-14))
+
+        reverbed = reverbed.astype(waveforms.dtype, copy=False)
+        if orig_ndim == 1:
+            reverbed = reverbed[0]
+        return reverbed
+
+
+def add_reverb(samples, rirlist, reverb_prob=1.0, rng=None):
     """
     add reverb.
 
@@ -388,9 +1083,12 @@ def add_reverb(samples, rirlist, reverb_prob=1.0):
         samples (np.ndarray): The audio signal to perform convolution on.
         The shape should be `[time]` or `[batch, time]`
         or `[batch, channels, time]`
-        rirlist (list): List of paths to RIR files.
+        rirlist (list, RIRBank): List of paths to RIR files, or a `RIRBank`.
+            With a `RIRBank` every item of the batch gets its own RIR.
         reverb_prob(float): The chance that the audio signal will be
             reverbed.
+        rng(int, np.random.Generator): The seed or generator of the random
+            draws (default=None, see `get_rng`).
 
     Returns:
         samples(np.ndarray):samples added reverb
@@ -403,9 +1101,20 @@ def add_reverb(samples, rirlist, reverb_prob=1.0):
         >>> addrir = augment.add_reverb(samples, rir_list, 1.0)
 
     """
-    if np.random.rand(1) > reverb_prob:
+    rng = get_rng(rng)
+    if rng.random() > reverb_prob:
         return samples
 
+    if isinstance(rirlist, RIRBank):
+        if samples.ndim > 3:
+            raise NotImplementedError
+        if samples.ndim < 3:
+            return rirlist.reverberate(samples, rng=rng)
+        batch, chanel, times = samples.shape
+        index = np.repeat(rng.integers(0, len(rirlist), size=batch), chanel)
+        res = rirlist.reverberate(samples.reshape(batch * chanel, times), index)
+        return res.reshape(batch, chanel, times)
+
     orig_shapelen = len(samples.shape)
 
     if orig_shapelen > 3:
@@ -416,7 +1125,7 @@ def add_reverb(samples, rirlist, reverb_prob=1.0):
         batch, chanel, times = samples.shape
         samples = np.expand_dims(samples.reshape(batch * chanel, times), axis=2)
 
-    rir_path = random.choice(rirlist)
+    rir_path = rirlist[rng.integers(len(rirlist))]
     rir_waveform, sr = read(rir_path)
     res = reverberate(samples, rir_waveform)
 
@@ -431,11 +1140,22 @@ def add_reverb(samples, rirlist, reverb_prob=1.0):
 
 
 def add_babble(
-    waveforms, lengths, speaker_count=3, snr_low=0, snr_high=0, mix_prob=1.0
+    waveforms,
+    lengths,
+    speaker_count=3,
+    snr_low=0,
+    snr_high=0,
+    mix_prob=1.0,
+    rng=None,
 ):
     """
         Simulate babble noise by mixing the signals in a batch.
 
+        Every signal is mixed with the `speaker_count` signals before it in
+        the batch, see `mix_babble` for randomly chosen speakers. The babble
+        spans the whole padded batch, and its amplitude is the sum over all
+        samples divided by the longest length of the mixed signals.
+
         Args:
             waveforms(np.ndarray): A batch of audio signals to process,
                 with shape `[batch, time]` or `[batch, time, channels]`.
@@ -447,6 +1167,8 @@ def add_babble(
             snr_high(int): The high end of the mixing ratios, in decibels.
             mix_prob(float): The probability that the batch of signals will
                 bemixed with babble noise.By default, every signal is mixed.
+            rng(int, np.random.Generator): The seed or generator of the random
+                draws (default=None, see `get_rng`).
 
         Returns:
             waveforms(np.ndarray):array with processed waveforms.
@@ -477,36 +1199,197 @@ def add_babble(
             speaker_count=3, snr_low=0, snr_high=0)
 
     """
-    babbled_waveform = waveforms.copy()
-    lengths = np.expand_dims(lengths * waveforms.shape[1], axis=1)
-    batch_size = len(waveforms)
+    rng = get_rng(rng)
+    if rng.random() > mix_prob:
+        return waveforms.copy()
+
+    # Item i is mixed with items i - 1, ..., i - speaker_count
+    batch_size, num_samples = waveforms.shape[:2]
+    lengths = np.asarray(lengths) * num_samples
+    others = np.arange(batch_size)[:, None] - 1 - np.arange(speaker_count)
+    snr = rng.uniform(snr_low, snr_high, batch_size)
+    return _mix_babble(waveforms, lengths, others % batch_size, snr, truncate=False)
+
+
+@numba.njit(parallel=True, cache=True)
+def _mix_babble_rows(rows, lengths, others, noise_factor, truncate, out):
+    # Every row gathers the rows of its other speakers into a row-sized
+    # scratch buffer, which stays in cache for the amplitude sums and the
+    # mixture, so the batch is read once and written once. With `truncate`
+    # only the first `lengths[i]` samples of row i are summed and mixed,
+    # otherwise the whole row is.
+    for i in numba.prange(rows.shape[0]):
+        length = lengths[i]
+        span = min(int(length), rows.shape[1]) if truncate else rows.shape[1]
+        babble_length = 0.0
+        babble = np.zeros(rows.shape[1], dtype=rows.dtype)
+        for k in range(others.shape[1]):
+            other = others[i, k]
+            babble_length = max(babble_length, lengths[other])
+            for t in range(span):
+                babble[t] += rows[other, t]
+        if truncate:
+            babble_length = min(babble_length, length)
+
+        clean = 0.0
+        noise = 0.0
+        for t in range(span):
+            clean += abs(rows[i, t])
+            noise += abs(babble[t])
+        scale = (
+            noise_factor[i]
+            * (clean / max(length, 1.0))
+            / (noise / max(babble_length, 1.0) + 1e-14)
+        )
+        keep = 1.0 - noise_factor[i]
+        for t in range(rows.shape[1]):
+            out[i, t] = keep * rows[i, t] + scale * babble[t]
+
+
+def _mix_babble(waveforms, lengths, others, snr, truncate):
+    # Mix the sum of the items `others[i]` into every item i at `snr` dB, with
+    # the amplitudes normalised by the `lengths` in samples, and summed and
+    # mixed inside the first `lengths[i]` samples when `truncate` is set. The
+    # clean signal is scaled so that the mixture keeps its amplitude.
+    # Channels are mixed as separate rows, `[batch * channels, time]`.
+    batch_size, num_samples = waveforms.shape[:2]
+    rows = np.moveaxis(waveforms.reshape(batch_size, num_samples, -1), 1, 2)
+    channels = rows.shape[1]
+    rows = np.ascontiguousarray(rows.reshape(batch_size * channels, num_samples))
+
+    channel = np.arange(channels)
+    others = (others[:, None, :] * channels + channel[:, None]).reshape(
+        batch_size * channels, -1
+    )
+    lengths = np.repeat(np.clip(lengths, 0, num_samples), channels)
+    noise_factor = 1 / (dB_to_amplitude(np.broadcast_to(snr, batch_size), 1, 1) + 1)
+
+    out = np.empty_like(rows)
+    _mix_babble_rows(
+        rows,
+        lengths.astype(np.float64),
+        others.astype(np.int64),
+        np.repeat(noise_factor, channels).astype(np.float64),
+        truncate,
+        out,
+    )
+    out = np.moveaxis(out.reshape(batch_size, channels, num_samples), 1, 2)
+    return out.reshape(waveforms.shape)
+
+
+def mix_babble(
+    waveforms,
+    lengths,
+    speaker_count=3,
+    snr_low=0,
+    snr_high=0,
+    mix_prob=1.0,
+    rng=None,
+):
+    """
+    Simulate babble noise by mixing every signal of a padded batch with
+    randomly chosen other signals of the batch.
+
+    Unlike `add_babble`, the lengths are in samples and every item draws its
+    own `speaker_count` distinct other items instead of its neighbours. The
+    babble is cut to the length of each item, and the amplitudes are
+    measured on the valid samples only, so the result does not depend on
+    the padding.
+
+    Args:
+        waveforms(np.ndarray): A batch of audio signals to process, with
+            shape `[batch, time]` or `[batch, time, channels]`.
+        lengths(np.ndarray): The number of valid samples of each signal,
+            with shape `[batch]`.
+        speaker_count(int): The number of signals to mix with each signal,
+            at most `batch - 1` (default=3).
+        snr_low(float): The low end of the mixing ratios, in decibels
+            (default=0).
+        snr_high(float): The high end of the mixing ratios, in decibels
+            (default=0).
+        mix_prob(float): The probability that the batch of signals will be
+            mixed with babble noise (default=1.0).
+        rng(int, np.random.Generator): The seed or generator of the random
+            draws (default=None, see `get_rng`).
 
-    if np.random.rand(1) > mix_prob:
-        return babbled_waveform
+    Returns:
+        np.ndarray, the mixed signals with the input shape.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.augment as augment
+        >>> waveforms = np.random.rand(16, 32000) - 0.5
+        >>> lengths = np.random.randint(16000, 32001, 16)
+        >>> babbled = augment.mix_babble(waveforms, lengths, speaker_count=4,
+        ...                              snr_low=0, snr_high=10)
+    """
+    rng = get_rng(rng)
+    batch_size = waveforms.shape[0]
+    speaker_count = min(speaker_count, batch_size - 1)
+    if rng.random() > mix_prob or speaker_count < 1:
+        return waveforms.copy()
+
+    # Distinct random other items: sort random keys with the item itself last
+    keys = rng.random((batch_size, batch_size))
+    keys[np.diag_indices(batch_size)] = np.inf
+    others = np.argsort(keys, axis=1)[:, :speaker_count]
+    snr = rng.uniform(snr_low, snr_high, batch_size)
+    lengths = np.asarray(lengths).astype(np.int64)
+    return _mix_babble(waveforms, lengths, others, snr, truncate=True)
+
+
+@functools.lru_cache(maxsize=16)
+def _notch_filter_bank(
+    drop_freq_low, drop_freq_high, drop_width, filter_length, max_count, num_bins
+):
+    # Spectra of notch kernels at `num_bins` frequencies over the drop range,
+    # plus a delayed delta as the last row. Products of `max_count` rows are
+    # composed filters with one common delay, sized so they don't wrap.
+    pad = filter_length // 2
+    freqs = np.linspace(drop_freq_low, drop_freq_high, num_bins)
+    kernels = np.zeros((num_bins + 1, filter_length))
+    for i, frequency in enumerate(freqs):
+        kernels[i] = notch_filter(frequency, filter_length, drop_width).reshape(-1)
+    kernels[num_bins, pad] = 1.0
 
-    # Pick an SNR and use it to compute the mixture amplitude factors
-    clean_amplitude = compute_amplitude(waveforms, lengths)
-    SNR = np.random.rand(batch_size, 1)
-    SNR = SNR * (snr_high - snr_low) + snr_low
-    noise_amplitude_factor = 1 / (dB_to_amplitude(SNR, 1, 1) + 1)
-    new_noise_amplitude = noise_amplitude_factor * clean_amplitude
+    n_fft = next_fast_len(max_count * (filter_length - 1) + 1, real=True)
+    return rfft(kernels, n_fft, axis=-1), n_fft
 
-    # Scale clean signal appropriately
-    babbled_waveform *= 1 - noise_amplitude_factor
 
-    # For each speaker in the mixture, roll and add
-    babble_waveform = np.roll(waveforms, 1, axis=0)
-    babble_len = np.roll(lengths, 1, axis=0)
-    for i in range(1, speaker_count):
-        babble_waveform += np.roll(waveforms, 1 + i, axis=0)
-        babble_len = np.maximum(babble_len, np.roll(babble_len, 1, axis=0))
+def _drop_freq_filters(
+    batch_size,
+    drop_freq_low=1e-14,
+    drop_freq_high=1,
+    drop_count_low=1,
+    drop_count_high=2,
+    drop_width=0.05,
+    num_bins=256,
+    rng=None,
+):
+    # One composed notch filter per item, `[batch, length]`, centered on
+    # sample `length // 2`.
+    filter_length = 101
+    spectra, n_fft = _notch_filter_bank(
+        drop_freq_low,
+        drop_freq_high,
+        drop_width,
+        filter_length,
+        drop_count_high,
+        num_bins,
+    )
 
-    # Rescale and add to mixture
-    babble_amplitude = compute_amplitude(babble_waveform, babble_len)
-    babble_waveform *= new_noise_amplitude / (babble_amplitude + 1e-14)
-    babbled_waveform += babble_waveform
+    # Pick number of frequencies to drop and the frequencies for every item,
+    # unused slots take the delayed delta
+    rng = get_rng(rng)
+    drop_count = rng.integers(
+        low=drop_count_low, high=drop_count_high + 1, size=(batch_size, 1)
+    )
+    index = rng.integers(0, num_bins, size=(batch_size, drop_count_high))
+    index[np.arange(drop_count_high) >= drop_count] = num_bins
 
-    return babbled_waveform
+    # Compose the notches of each item into one filter
+    length = drop_count_high * (filter_length - 1) + 1
+    return irfft(np.prod(spectra[index], axis=1), n_fft, axis=-1)[:, :length]
 
 
 def drop_freq(
@@ -517,11 +1400,18 @@ def drop_freq(
     drop_count_high=2,
     drop_width=0.05,
     drop_prob=1,
+    num_bins=256,
+    rng=None,
 ):
     """
     Drops a random frequency from the signal.To teach models to learn to rely
     on all parts of the signal,not just a few frequency bands.
 
+    The notch kernels are taken from a bank of `num_bins` frequencies over
+    the drop range, built on the first call for a set of parameters and
+    cached. Every item of the batch draws its own frequencies, which are
+    combined in the frequency domain into a single filter.
+
     Args:
         waveforms(np.ndarray): A batch of audio signals to process,
         with shape `[batch, time]` or`[batch, time, channels]`.
@@ -537,6 +1427,9 @@ def drop_freq(
             fraction of the sampling_rate / 2.
         drop_prob(float): The probability that the batch of signals will have a
             frequency dropped. By default,every batch has frequencies dropped.
+        num_bins(int): The number of frequencies in the notch filter bank.
+        rng(int, np.random.Generator): The seed or generator of the random
+            draws (default=None, see `get_rng`).
 
     Returns:
         ndarray of shape `[batch, time]` or `[batch, time, channels]`
@@ -551,7 +1444,8 @@ def drop_freq(
     # Don't drop (return early) 1-`drop_prob` portion of the batches
     orig_shapelen = len(waveforms.shape)
     dropped_waveform = waveforms.copy()
-    if np.random.rand(1) > drop_prob:
+    rng = get_rng(rng)
+    if rng.random() > drop_prob or drop_count_high <= 0:
         return dropped_waveform
 
     # Add channels dimension
@@ -559,36 +1453,27 @@ def drop_freq(
         dropped_waveform = np.expand_dims(np.expand_dims(dropped_waveform, 0), 2)
     elif len(waveforms.shape) == 2:
         dropped_waveform = np.expand_dims(dropped_waveform, axis=2)
-
-    # Pick number of frequencies to drop
-    drop_count = np.random.randint(
-        low=drop_count_low, high=drop_count_high + 1, size=(1,)
+    batch_size = dropped_waveform.shape[0]
+
+    drop_filter = _drop_freq_filters(
+        batch_size,
+        drop_freq_low,
+        drop_freq_high,
+        drop_count_low,
+        drop_count_high,
+        drop_width,
+        num_bins,
+        rng,
     )
-    drop_count = drop_count[0]
-
-    # Pick a frequency to drop
-    drop_range = drop_freq_high - drop_freq_low
-    drop_frequency = np.random.rand(drop_count) * drop_range + drop_freq_low
-
-    # Filter parameters
-    filter_length = 101
-    pad = filter_length // 2
-
-    # Start with delta function
-    drop_filter = np.zeros([1, filter_length, 1])
-    drop_filter[0, pad, 0] = 1
-
-    # Subtract each frequency
-    for frequency in drop_frequency:
-        notch_kernel = notch_filter(
-            frequency,
-            filter_length,
-            drop_width,
-        )
-        drop_filter = convolve1d(drop_filter, notch_kernel, pad)
+    length = drop_filter.shape[-1]
 
     # Apply filter
-    dropped_waveform = convolve1d(dropped_waveform, drop_filter, pad)
+    dropped_waveform = convolve1d(
+        dropped_waveform,
+        np.expand_dims(drop_filter, -1),
+        length // 2,
+        use_fft=False,
+    )
 
     # Remove channels dimension if added
     if orig_shapelen == 2:
@@ -598,12 +1483,22 @@ def drop_freq(
     return dropped_waveform
 
 
-def speed_perturb(waveform, orig_freq, speeds=[90, 100, 110], perturb_prob=1.0):
+def speed_perturb(
+    waveform,
+    orig_freq,
+    speeds=[90, 100, 110],
+    perturb_prob=1.0,
+    lengths=None,
+    rng=None,
+):
     """
     Slightly speed up or slow down an audio signal.Resample the audio signal
         at a rate that is similar to the original rate, to achieve a slightly
         slower or slightly faster signal.
 
+    Resampling is polyphase with cached Kaiser filters, so the cost only
+    depends on the signal length and not on its prime factors.
+
     Args:
         waveform(np.ndarray): Shape should be `[batch, time]` or
             `[batch, time, channels]`.
@@ -613,10 +1508,18 @@ def speed_perturb(waveform, orig_freq, speeds=[90, 100, 110], perturb_prob=1.0):
             divided by 100 to get a ratio).
         perturb_prob(float): The chance that the batch will be speed-perturbed.
             By default, every batch is perturbed.
+        lengths(np.ndarray): The relative lengths of the signals with shape
+            `[batch]`. When given, every item draws its own speed and the new
+            relative lengths are returned too (default=None, one speed for
+            the whole batch).
+        rng(int, np.random.Generator): The seed or generator of the random
+            draws (default=None, see `get_rng`).
 
     Returns:
         perturbed_waveform(np.ndarray): Shape `[batch, time]` or
         `[batch, time, channels]`.
+        new_lengths(np.ndarray): Only when `lengths` is given, the relative
+        lengths of the perturbed signals.
 
     Example:
         >>> import mindaudio.data.io as io
@@ -625,17 +1528,39 @@ def speed_perturb(waveform, orig_freq, speeds=[90, 100, 110], perturb_prob=1.0):
         >>> perturbed_mindaudio = augment.speed_perturb(signal, \
         orig_freq=16000, speeds=[90])
     """
+    axis = 1 if len(waveform.shape) == 3 else -1
 
     # Don't perturb (return early) 1-`perturb_prob` portion of the batches
-    if np.random.rand(1) > perturb_prob:
-        return waveform.copy()
+    rng = get_rng(rng)
+    if rng.random() > perturb_prob:
+        if lengths is None:
+            return waveform.copy()
+        return waveform.copy(), lengths
+
+    if lengths is None:
+        # Perform a random perturbation
+        samp_index = rng.integers(0, len(speeds))
+        speed = speeds[samp_index]
+        return _polyphase_resample(waveform, orig_freq, orig_freq * speed / 100, axis)
+
+    # Perform a random perturbation of every item, one resampling per speed
+    batch_size, num_samples = waveform.shape[:2]
+    samp_index = rng.integers(0, len(speeds), (batch_size,))
+    item_speeds = np.asarray(speeds)[samp_index]
+    out_samples = int(np.ceil(num_samples * item_speeds.max() / 100))
+    perturbed_waveform = np.zeros(
+        (batch_size, out_samples) + waveform.shape[2:], dtype=waveform.dtype
+    )
+    for speed in np.unique(item_speeds):
+        items = item_speeds == speed
+        resampled = _polyphase_resample(
+            waveform[items], orig_freq, orig_freq * speed / 100, axis=1
+        )
+        perturbed_waveform[items, : resampled.shape[1]] = resampled
 
-    # Perform a random perturbation
-    samp_index = np.random.randint(0, len(speeds), (1,))[0]
-    speed = speeds[samp_index]
-    new_freq = orig_freq * speed // 100
-    perturbed_waveform = resample(waveform, orig_freq, new_freq)
-    return perturbed_waveform
+    new_samples = np.ceil(np.round(lengths * num_samples) * item_speeds / 100)
+    new_lengths = np.minimum(new_samples, out_samples) / out_samples
+    return perturbed_waveform, new_lengths
 
 
 def drop_chunk(
@@ -649,6 +1574,7 @@ def drop_chunk(
     drop_end=None,
     drop_prob=1,
     noise_factor=0.0,
+    rng=None,
 ):
     """
     This class drops portions of the input signal.Using `drop_chunk` as an
@@ -676,6 +1602,8 @@ def drop_chunk(
             utterance to use for scaling the white
         noise inserted. 1 keeps the average amplitude the same, while 0
             inserts all 0's.
+        rng(int, np.random.Generator): The seed or generator of the random
+            draws (default=None, see `get_rng`).
 
     Returns:
         dropped_waveform(np.ndarray): Shape `[batch, time]` or
@@ -730,64 +1658,70 @@ def drop_chunk(
     dropped_waveform = waveforms.copy()
 
     # Don't drop (return early) 1-`drop_prob` portion of the batches
-    if np.random.rand(1) > drop_prob:
+    rng = get_rng(rng)
+    if rng.random() > drop_prob:
         return dropped_waveform
 
-    # Store original amplitude for computing white noise amplitude
-    clean_amplitude = compute_amplitude(waveforms, np.expand_dims(lengths, axis=1))
-
-    # Pick a number of times to drop
-    drop_times = np.random.randint(
+    # Pick a number of times to drop and the lengths of every drop
+    drop_times = rng.integers(
         low=drop_count_low,
         high=drop_count_high + 1,
-        size=(batch_size,),
+        size=(batch_size, 1),
+    )
+    length = rng.integers(
+        low=drop_length_low,
+        high=drop_length_high + 1,
+        size=(batch_size, max(drop_count_high, 1)),
+    )
+    length[np.arange(length.shape[1]) >= drop_times] = 0
+
+    # Compute range of starting locations
+    start_min = np.full(batch_size, float(drop_start))
+    if drop_start < 0:
+        start_min += lengths
+    if drop_end is None:
+        start_max = lengths.astype(float)
+    elif drop_end < 0:
+        start_max = drop_end + lengths
+    else:
+        start_max = np.full(batch_size, float(drop_end))
+    start_max = np.maximum(0, start_max - length.max(axis=1))
+    start_min = start_min.astype(np.int64)
+    start_max = np.maximum(start_max.astype(np.int64), start_min)
+
+    # Pick starting locations
+    span = (start_max - start_min + 1)[:, None]
+    start = start_min[:, None] + (rng.random(length.shape) * span).astype(np.int64)
+    start = np.minimum(start, waveforms.shape[1])
+    end = np.minimum(start + length, waveforms.shape[1])
+
+    # Expand the intervals into flat sample indices with one cumulative sum
+    length = end - start
+    rows = np.broadcast_to(np.arange(batch_size)[:, None], length.shape)
+    interval_starts = (rows * waveforms.shape[1] + start).ravel()
+    interval_lengths = length.ravel()
+    interval_offsets = np.cumsum(interval_lengths) - interval_lengths
+    index = np.repeat(interval_starts - interval_offsets, interval_lengths)
+    index += np.arange(len(index))
+    flat_waveform = dropped_waveform.reshape(
+        (batch_size * waveforms.shape[1],) + waveforms.shape[2:]
     )
 
-    # Iterate batch to set mask
-    for i in range(batch_size):
-        if drop_times[i] == 0:
-            continue
-
-        # Pick lengths
-        length = np.random.randint(
-            low=drop_length_low,
-            high=drop_length_high + 1,
-            size=(drop_times[i],),
-        )
-
-        # Compute range of starting locations
-        start_min = drop_start
-        if start_min < 0:
-            start_min += lengths[i]
-        start_max = drop_end
-        if start_max is None:
-            start_max = lengths[i]
-        if start_max < 0:
-            start_max += lengths[i]
-        start_max = max(0, start_max - length.max())
-
-        # Pick starting locations
-        start = np.random.randint(
-            low=start_min,
-            high=start_max + 1,
-            size=(drop_times[i],),
+    # Update waveform
+    if not noise_factor:
+        flat_waveform[index] = 0.0
+    else:
+        # Store original amplitude for computing white noise amplitude
+        clean_amplitude = compute_amplitude(
+            waveforms, lengths.reshape((-1,) + (1,) * (waveforms.ndim - 1))
         )
-
-        end = start + length
-
-        # Update waveform
-        if not noise_factor:
-            for j in range(drop_times[i]):
-                dropped_waveform[i, start[j] : end[j]] = 0.0
-        else:
-            # Uniform distribution of -2 to +2 * avg amplitude should
-            # preserve the average for normalization
-            noise_max = 2 * clean_amplitude[i] * noise_factor
-            for j in range(drop_times[i]):
-                # zero-center the noise distribution
-                noise_vec = np.random.rand(length[j])
-                noise_vec = 2 * noise_max * noise_vec - noise_max
-                dropped_waveform[i, start[j] : end[j]] = noise_vec
+        # Uniform distribution of -2 to +2 * avg amplitude should
+        # preserve the average for normalization
+        noise_max = 2 * clean_amplitude.reshape((batch_size,) + waveforms.shape[2:])
+        noise_max = noise_factor * noise_max[index // waveforms.shape[1]]
+        # zero-center the noise distribution
+        noise_vec = rng.random(noise_max.shape)
+        flat_waveform[index] = 2 * noise_max * noise_vec - noise_max
 
     return dropped_waveform
 
@@ -839,36 +1773,46 @@ def _phase_vocoder(matrix, rate, hop_length=None, n_fft=None):
         hop_length = int(n_fft // 4)
 
     time_steps = np.arange(0, matrix.shape[-1], rate, dtype=np.float64)
+    index = time_steps.astype(np.int64)
 
-    # Create an empty output array
-    shape = list(matrix.shape)
-    shape[-1] = len(time_steps)
-    d_stretch = np.zeros_like(matrix, shape=shape)
+    # Work on time-major frames `[time, freq, ...]`, a free view of the
+    # Fortran-ordered output of `stft`
+    frames = matrix.T
+
+    # Pad 0 columns to simplify boundary logic
+    padding = [(0, 0) for _ in matrix.shape]
+    padding[0] = (0, 2)
+    frames = np.pad(frames, padding, mode="constant")
+    magnitude = np.abs(frames)
+    angle = np.angle(frames)
 
     # Expected phase advance in each bin
     phi_advance = np.linspace(0, np.pi * hop_length, matrix.shape[-2])
+    phi_advance = phi_advance.reshape((-1,) + (1,) * (matrix.ndim - 2))
 
-    # Phase accumulator; initialize to the first sample
-    phase_acc = np.angle(matrix[..., 0])
+    # Interpolate the magnitude between neighbouring columns
+    alpha = np.mod(time_steps, 1.0).astype(magnitude.dtype)
+    alpha = alpha.reshape((-1,) + (1,) * (matrix.ndim - 1))
+    mag = (1.0 - alpha) * magnitude[index] + alpha * magnitude[index + 1]
 
-    # Pad 0 columns to simplify boundary logic
-    padding = [(0, 0) for _ in matrix.shape]
-    padding[-1] = (0, 2)
-    matrix = np.pad(matrix, padding, mode="constant")
+    # Phase advance of every output frame, with the deviation wrapped
+    dphase = angle[index + 1] - angle[index] - phi_advance
+    dphase -= 2.0 * np.pi * np.round(dphase / (2.0 * np.pi))
+    dphase += phi_advance
 
-    for t, step in enumerate(time_steps):
-        columns = matrix[..., int(step) : int(step + 2)]
-        alpha = np.mod(step, 1.0)
-        mag = (1.0 - alpha) * np.abs(columns[..., 0]) + alpha * np.abs(columns[..., 1])
-        phase_complex = np.cos(phase_acc) + 1j * np.sin(phase_acc)
-        if mag is not None:
-            phase_complex *= mag
-        d_stretch[..., t] = phase_complex
-        dphase = np.angle(columns[..., 1]) - np.angle(columns[..., 0]) - phi_advance
-        dphase = dphase - 2.0 * np.pi * np.round(dphase / (2.0 * np.pi))
-        phase_acc += phi_advance + dphase
+    # Phase accumulator; initialize to the first sample and add up the
+    # advances of all previous frames
+    phase_acc = np.empty(dphase.shape, dtype=np.float64)
+    phase_acc[0] = angle[0]
+    np.cumsum(dphase[:-1], axis=0, out=phase_acc[1:])
+    phase_acc[1:] += angle[0]
+    phase_acc -= 2.0 * np.pi * np.round(phase_acc / (2.0 * np.pi))
+    phase_acc = phase_acc.astype(magnitude.dtype)
 
-    return d_stretch
+    d_stretch = np.empty(mag.shape, dtype=matrix.dtype)
+    d_stretch.real = mag * np.cos(phase_acc)
+    d_stretch.imag = mag * np.sin(phase_acc)
+    return d_stretch.T
 
 
 def pitch_shift(waveforms, sr, n_steps, bins_per_octave=12):
@@ -893,9 +1837,413 @@ def pitch_shift(waveforms, sr, n_steps, bins_per_octave=12):
     rate = 2.0 ** (-float(n_steps) / bins_per_octave)
     waveforms_stretch = time_stretch(waveforms, rate=rate)
     # Stretch in time, then resample
-    y_shift = resample(
+    y_shift = _polyphase_resample(
         waveforms_stretch,
         orig_freq=float(sr) / rate,
         new_freq=sr,
     )
-    return _pad_shape(y_shift, data_shape=waveforms_stretch.shape[-1])
+    return _pad_shape(y_shift, data_shape=waveforms.shape[-1])
+
+
+# The arguments of the augmentation functions that gate a whole batch, a
+# pipeline draws them per item instead
+_BATCH_PROB_KWARGS = ("drop_prob", "mix_prob", "perturb_prob", "reverb_prob")
+
+
+class AugmentStage:
+    """
+    One stage of an `AugmentPipeline`, wrapping an augmentation function.
+
+    Args:
+        func (callable): The augmentation function, called as
+            `func(waveforms, rng=rng, **kwargs)`.
+        prob (float): The probability that the stage is applied to an item
+            (default=1.0). The batch probability of `func`, e.g. `drop_prob`
+            or `reverb_prob`, is folded into it, so it is drawn per item too.
+        layout (str): The layout `func` expects the waveforms in. Options:
+            ["channels_first", "channels_last", "rows"], i.e.
+            `[batch, channels, time]`, `[batch, time, channels]` or
+            `[batch * channels, time]` (default="channels_first").
+        uses_lengths (bool): Whether `func` takes the relative lengths as
+            `lengths`. If it then returns a tuple, the second element holds
+            the new lengths (default=False).
+        name (str): The name of the stage in the timings (default=None, the
+            name of `func`).
+        **kwargs: The other arguments of `func`.
+
+    Examples:
+        >>> import mindaudio.data.augment as augment
+        >>> stage = augment.AugmentStage(augment.drop_freq, prob=0.5,
+        ...                              layout="channels_last")
+    """
+
+    def __init__(
+        self,
+        func,
+        prob=1.0,
+        layout="channels_first",
+        uses_lengths=False,
+        name=None,
+        **kwargs,
+    ):
+        if layout not in ["channels_first", "channels_last", "rows"]:
+            raise ValueError(
+                "layout must be 'channels_first', 'channels_last' or 'rows', "
+                "but got {}.".format(layout)
+            )
+        self.func = func
+        for key in _BATCH_PROB_KWARGS:
+            prob = prob * kwargs.pop(key, 1.0)
+        self.prob = prob
+        self.layout = layout
+        self.uses_lengths = uses_lengths
+        self.name = func.__name__ if name is None else name
+        self.kwargs = kwargs
+
+    @property
+    def fusable(self):
+        """Whether the stage is a linear filter that can be fused."""
+        if self.func is drop_freq:
+            return True
+        return self.func is add_reverb and isinstance(
+            self.kwargs.get("rirlist"), RIRBank
+        )
+
+    def kernels(self, applied, rng):
+        # Per-item convolution kernels of a fusable stage, the sample of each
+        # kernel that aligns with the input, and the items whose amplitude is
+        # restored afterwards. Items that are not `applied` get an identity
+        # kernel.
+        batch_size = len(applied)
+        if self.func is drop_freq:
+            filters = _drop_freq_filters(batch_size, rng=rng, **self.kwargs)
+            # drop_freq correlates with its filters
+            delays = np.full(batch_size, filters.shape[-1] // 2)
+            kernels, rescale_amp = filters[:, ::-1], np.zeros(batch_size, bool)
+        else:
+            kernels, delays = self.kwargs["rirlist"].kernels(batch_size, rng=rng)
+            rescale_amp = applied
+
+        if not applied.all():
+            kernels = np.array(kernels)
+            kernels[~applied] = 0
+            kernels[~applied, delays[~applied]] = 1
+        return kernels, delays, rescale_amp
+
+    def __call__(self, waveforms, lengths, rng=None):
+        batch_size, channels, num_samples = waveforms.shape
+        if self.layout == "channels_last":
+            waveforms = waveforms.transpose(0, 2, 1)
+        elif self.layout == "rows":
+            waveforms = waveforms.reshape(batch_size * channels, num_samples)
+            lengths = np.repeat(lengths, channels)
+
+        if self.uses_lengths:
+            waveforms = self.func(waveforms, lengths=lengths, rng=rng, **self.kwargs)
+        else:
+            waveforms = self.func(waveforms, rng=rng, **self.kwargs)
+        if isinstance(waveforms, tuple):
+            waveforms, lengths = waveforms
+
+        if self.layout == "channels_last":
+            waveforms = waveforms.transpose(0, 2, 1)
+        elif self.layout == "rows":
+            waveforms = waveforms.reshape(batch_size, channels, -1)
+            lengths = lengths[::channels]
+        return waveforms, lengths
+
+
+def _merge_items(waveforms, lengths, items, augmented, new_lengths):
+    # Put the augmented `items` back into the batch, padding the items to the
+    # longest of them and rescaling their relative lengths.
+    if items.all():
+        return augmented, new_lengths
+    num_samples = max(waveforms.shape[-1], augmented.shape[-1])
+    merged = np.zeros(waveforms.shape[:2] + (num_samples,), dtype=augmented.dtype)
+    merged[~items, :, : waveforms.shape[-1]] = waveforms[~items]
+    merged[items, :, : augmented.shape[-1]] = augmented
+    merged_lengths = lengths * (waveforms.shape[-1] / num_samples)
+    merged_lengths[items] = new_lengths * (augmented.shape[-1] / num_samples)
+    return merged, merged_lengths
+
+
+_PIPELINE_WORKER = None
+
+
+def _init_pipeline_worker(stages, fuse):
+    global _PIPELINE_WORKER
+    _PIPELINE_WORKER = AugmentPipeline(stages, fuse=fuse)
+
+
+def _run_pipeline_chunk(name, shape, dtype, start, stop, lengths, seed):
+    # Augment items [start, stop) of the shared batch with the random stream
+    # of the chunk and return the result through a new shared memory block,
+    # which the caller unlinks.
+    shm = SharedMemory(name=name)
+    try:
+        waveforms = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[start:stop]
+        augmented, lengths, timings = _PIPELINE_WORKER._run(
+            waveforms, lengths, np.random.default_rng(seed)
+        )
+        out_shape, out_dtype = augmented.shape, augmented.dtype
+        out = SharedMemory(create=True, size=max(augmented.nbytes, 1))
+        np.ndarray(out_shape, dtype=out_dtype, buffer=out.buf)[...] = augmented
+        out_name = out.name
+        out.close()
+        del waveforms, augmented
+    finally:
+        shm.close()
+    return out_name, out_shape, out_dtype.str, lengths, timings
+
+
+class AugmentPipeline:
+    """
+    Compose augmentation stages on batches in the `[batch, channels, time]`
+    layout.
+
+    Every stage is drawn per item with its own probability and receives the
+    items it is applied to as a batch, in the layout it declares, so the
+    reshaping is done here once instead of in every function. Consecutive
+    `drop_freq` and `add_reverb` stages (with a `RIRBank`) are linear filters;
+    when more than one of them is applied, their kernels are composed per
+    item, with identity kernels for the stages an item skips, and the batch is
+    convolved once. With `num_workers` > 0 the batch is split over a
+    persistent process pool and exchanged through shared memory. The time
+    spent in every stage is accumulated in `timings`.
+
+    Every call draws from its own `np.random.SeedSequence`, spawned from
+    `seed` or from the generator passed to the call, and every chunk of the
+    pool gets an independent child stream, so the augmentations only depend
+    on the seed and the number of workers.
+
+    Args:
+        stages (list): The `AugmentStage` objects, in order.
+        num_workers (int): The number of worker processes, 0 runs in the
+            calling process (default=0).
+        fuse (bool): Whether to fuse consecutive filter stages (default=True).
+        seed (int): The seed of the random streams (default=None, seed every
+            call from the global numpy random state).
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.augment as augment
+        >>> pipeline = augment.AugmentPipeline([
+        ...     augment.AugmentStage(augment.speed_perturb, layout="channels_last",
+        ...                          uses_lengths=True, orig_freq=16000),
+        ...     augment.AugmentStage(augment.drop_freq, layout="channels_last"),
+        ...     augment.AugmentStage(augment.drop_chunk, prob=0.5,
+        ...                          layout="channels_last", uses_lengths=True),
+        ... ], num_workers=4)
+        >>> waveforms = np.random.rand(16, 1, 32000) - 0.5
+        >>> augmented, lengths = pipeline(waveforms, np.ones(16))
+        >>> pipeline.close()
+    """
+
+    def __init__(self, stages, num_workers=0, fuse=True, seed=None):
+        self.stages = list(stages)
+        self.num_workers = num_workers
+        self.fuse = fuse
+        self._seed_seq = None if seed is None else np.random.SeedSequence(seed)
+        self.timings = {}
+        self._pool = None
+
+    def __call__(self, waveforms, lengths=None, rng=None):
+        """
+        Augment a batch.
+
+        Args:
+            waveforms (np.ndarray): Shape `[time]`, `[batch, time]` or
+                `[batch, channels, time]`.
+            lengths (np.ndarray): The relative lengths with shape `[batch]`
+                (default=None).
+            rng (int, np.random.Generator): The seed or generator of this
+                call, e.g. from `worker_rng` (default=None, the next stream
+                of the pipeline seed).
+
+        Returns:
+            - np.ndarray, the augmented waveforms with the input layout.
+            - np.ndarray, only when `lengths` is given, the new relative
+              lengths.
+        """
+        orig_ndim = waveforms.ndim
+        if orig_ndim == 1:
+            waveforms = waveforms[None, None]
+        elif orig_ndim == 2:
+            waveforms = waveforms[:, None]
+        elif orig_ndim > 3:
+            raise NotImplementedError
+        batch_size = waveforms.shape[0]
+        new_lengths = np.ones(batch_size) if lengths is None else np.asarray(lengths)
+        if rng is None and self._seed_seq is not None:
+            seed_seq = self._seed_seq.spawn(1)[0]
+        else:
+            seed_seq = np.random.SeedSequence(get_rng(rng).integers(2**63))
+
+        if self.num_workers > 0:
+            augmented, new_lengths = self._run_pool(waveforms, new_lengths, seed_seq)
+        else:
+            augmented, new_lengths, timings = self._run(
+                waveforms, new_lengths, np.random.default_rng(seed_seq)
+            )
+            self._add_timings(timings)
+
+        if orig_ndim == 1:
+            augmented = augmented[0, 0]
+        elif orig_ndim == 2:
+            augmented = augmented[:, 0]
+        if lengths is None:
+            return augmented
+        return augmented, new_lengths
+
+    def _run(self, waveforms, lengths, rng):
+        timings = {}
+        i = 0
+        while i < len(self.stages):
+            group = [self.stages[i]]
+            if self.fuse and group[0].fusable:
+                while i + len(group) < len(self.stages):
+                    if not self.stages[i + len(group)].fusable:
+                        break
+                    group.append(self.stages[i + len(group)])
+            i += len(group)
+
+            batch_size = waveforms.shape[0]
+            drawn = [(stage, rng.random(batch_size) < stage.prob) for stage in group]
+            active = [(stage, applied) for stage, applied in drawn if applied.any()]
+            if not active:
+                continue
+            name = "+".join(stage.name for stage, _ in active)
+            start = time.perf_counter()
+            items = np.any([applied for _, applied in active], axis=0)
+            if len(active) == 1:
+                augmented, new_lengths = active[0][0](
+                    waveforms[items], lengths[items], rng
+                )
+            else:
+                stages, applied = zip(*active)
+                augmented = self._apply_fused(
+                    waveforms[items], stages, [mask[items] for mask in applied], rng
+                )
+                new_lengths = lengths[items]
+            waveforms, lengths = _merge_items(
+                waveforms, lengths, items, augmented, new_lengths
+            )
+            calls, seconds = timings.get(name, (0, 0.0))
+            timings[name] = (calls + 1, seconds + time.perf_counter() - start)
+        return waveforms, lengths, timings
+
+    @staticmethod
+    def _apply_fused(waveforms, stages, applied, rng):
+        batch_size, channels, num_samples = waveforms.shape
+        kernels, delays, rescale_amp = stages[0].kernels(applied[0], rng)
+        for stage, mask in zip(stages[1:], applied[1:]):
+            next_kernels, next_delays, next_rescale = stage.kernels(mask, rng)
+            kernels = _linear_convolve(kernels, next_kernels)
+            delays = delays + next_delays
+            rescale_amp = rescale_amp | next_rescale
+
+        rows = waveforms.reshape(batch_size * channels, num_samples)
+        convolved = _linear_convolve(rows, np.repeat(kernels, channels, axis=0))
+        positions = np.repeat(delays, channels)[:, None] + np.arange(num_samples)
+        filtered = np.take_along_axis(convolved, positions, axis=-1)
+
+        if rescale_amp.any():
+            rescale_rows = np.repeat(rescale_amp, channels)
+            orig_amplitude = np.mean(np.abs(rows), axis=-1, keepdims=True)
+            new_amplitude = np.mean(np.abs(filtered), axis=-1, keepdims=True)
+            gain = np.where(
+                rescale_rows[:, None], orig_amplitude / (new_amplitude + 1e-14), 1.0
+            )
+            filtered = filtered * gain
+        return filtered.astype(waveforms.dtype).reshape(waveforms.shape)
+
+    def _run_pool(self, waveforms, lengths, seed_seq):
+        if self._pool is None:
+            # Share one resource tracker with the workers, so that the blocks
+            # they create are released by the unlink here. Workers come from
+            # a fork server, as forking a process that runs numba or BLAS
+            # threads can deadlock.
+            resource_tracker.ensure_running()
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context("spawn")
+            self._pool = context.Pool(
+                self.num_workers,
+                initializer=_init_pipeline_worker,
+                initargs=(self.stages, self.fuse),
+            )
+
+        batch_size, channels = waveforms.shape[:2]
+        bounds = np.linspace(0, batch_size, min(self.num_workers, batch_size) + 1)
+        bounds = bounds.astype(np.int64)
+        chunk_seeds = seed_seq.spawn(len(bounds) - 1)
+
+        shm = SharedMemory(create=True, size=max(waveforms.nbytes, 1))
+        try:
+            shared = np.ndarray(waveforms.shape, dtype=waveforms.dtype, buffer=shm.buf)
+            shared[...] = waveforms
+            del shared
+            jobs = [
+                self._pool.apply_async(
+                    _run_pipeline_chunk,
+                    (
+                        shm.name,
+                        waveforms.shape,
+                        waveforms.dtype.str,
+                        start,
+                        stop,
+                        lengths[start:stop],
+                        seed,
+                    ),
+                )
+                for start, stop, seed in zip(bounds[:-1], bounds[1:], chunk_seeds)
+            ]
+            results = [job.get() for job in jobs]
+        finally:
+            shm.close()
+            shm.unlink()
+
+        # Chunks may come back with different lengths, pad them to the longest
+        num_samples = max(result[1][-1] for result in results)
+        augmented = np.zeros(
+            (batch_size, channels, num_samples), dtype=np.dtype(results[0][2])
+        )
+        new_lengths = np.empty(batch_size)
+        for start, stop, result in zip(bounds[:-1], bounds[1:], results):
+            name, shape, dtype, chunk_lengths, timings = result
+            out = SharedMemory(name=name)
+            try:
+                chunk = np.ndarray(shape, dtype=dtype, buffer=out.buf)
+                augmented[start:stop, :, : shape[-1]] = chunk
+                del chunk
+            finally:
+                out.close()
+                out.unlink()
+            new_lengths[start:stop] = chunk_lengths * shape[-1] / num_samples
+            self._add_timings(timings)
+        return augmented, new_lengths
+
+    def _add_timings(self, timings):
+        for name, (calls, seconds) in timings.items():
+            total = self.timings.setdefault(name, {"calls": 0, "seconds": 0.0})
+            total["calls"] += calls
+            total["seconds"] += seconds
+
+    def reset_timings(self):
+        """Clear the accumulated stage timings."""
+        self.timings = {}
+
+    def close(self):
+        """Shut down the worker processes."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
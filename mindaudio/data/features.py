@@ -1,11 +1,23 @@
+import functools
+
 import mindspore as ms
 import mindspore.dataset.audio as msaudio
+import numba
 import numpy as np
 from mindspore import Tensor, nn
-from mindspore.dataset.audio.utils import BorderType, NormMode, WindowType, create_dct
-from scipy.ndimage import median_filter
-
-from .spectrum import amplitude_to_dB, istft, magphase, melspectrogram, stft
+from mindspore.dataset.audio.utils import NormMode, WindowType, create_dct
+from scipy.fft import irfft, next_fast_len, rfft
+from scipy.signal import get_window
+
+from .processing import resample
+from .spectrum import (
+    _frame_view,
+    amplitude_to_dB,
+    istft,
+    magphase,
+    melspectrogram,
+    stft,
+)
 
 __all__ = [
     "spectral_centroid",
@@ -15,7 +27,15 @@ __all__ = [
     "mfcc",
     "complex_norm",
     "angle",
+    "running_median",
+    "hpss",
     "harmonic",
+    "percussive",
+    "yin",
+    "pyin",
+    "energy",
+    "cqt",
+    "chroma_cqt",
 ]
 
 
@@ -155,10 +175,14 @@ def context_window(waveforms, left_frames=0, right_frames=0):
     return context.asnumpy()
 
 
-def compute_deltas(specgram, win_length=5, pad_mode="edge"):
+def compute_deltas(specgram, win_length=5, pad_mode="edge", order=1, out=None):
     """
     Compute delta coefficients of a spectrogram.
 
+    Orders `1..order` are computed in one call, each order being a single
+    vectorized pass over the padded previous order, and written into
+    consecutive frequency blocks of the output.
+
     Args:
         specgram(np.ndarray): audio signals of dimension'(..., freq, time)'
         win_length (int): The window length used for computing delta, must be
@@ -176,21 +200,68 @@ def compute_deltas(specgram, win_length=5, pad_mode="edge"):
 
             - 'symmetric', means it reflects the values on the edge repeating
             the last value of edge.
+        order (int): The highest order of deltas to compute (default=1).
+        out (np.ndarray): Optional output array of shape
+            `(..., order * freq, time)`, e.g. a slice of a larger feature
+            buffer, that the deltas are written into (default=None).
     Returns:
-        deltas
+        np.ndarray, deltas of orders `1..order` stacked along the frequency
+        axis, with shape `(..., order * freq, time)`.
 
     Examples:
         >>> import numpy as np
         >>> import mindaudio.data.features as features
         >>> specgram = np.random.random([1, 400 // 2 + 1, 1000])
-        >>> deltas = features.compute_deltas(waveforms, win_length=7, \
+        >>> deltas = features.compute_deltas(specgram, win_length=7, \
         pad_mode="edge")
+        >>> deltas = features.compute_deltas(specgram, order=2)
+        >>> deltas.shape
+        (1, 402, 1000)
     """
+    if win_length < 3:
+        raise ValueError(
+            "win_length must be no less than 3, but got {}".format(win_length)
+        )
+    if pad_mode not in ("constant", "edge", "reflect", "symmetric"):
+        raise ValueError("Unsupported pad_mode {}".format(repr(pad_mode)))
+    if order < 1:
+        raise ValueError("order must be a positive integer, but got {}".format(order))
+
+    specgram = np.asarray(specgram)
+    n = (win_length - 1) // 2
+    denom = n * (n + 1) * (2 * n + 1) / 3
+    n_freq, n_frames = specgram.shape[-2:]
+
+    shape = specgram.shape[:-2] + (order * n_freq, n_frames)
+    if out is None:
+        out = np.empty(shape, dtype=np.result_type(specgram.dtype, np.float32))
+    elif out.shape != shape:
+        raise ValueError("out must have shape {}, but got {}".format(shape, out.shape))
+
+    padding = [(0, 0)] * (specgram.ndim - 1) + [(n, n)]
+    feats = specgram
+    tmp = np.empty(specgram.shape, dtype=out.dtype)
+    for k in range(order):
+        delta = out[..., k * n_freq : (k + 1) * n_freq, :]
+        padded = np.pad(feats, padding, mode=pad_mode)
+        # delta[t] = sum_i i * (x[t + i] - x[t - i]) / denom
+        np.subtract(
+            padded[..., n + 1 : n + 1 + n_frames],
+            padded[..., n - 1 : n - 1 + n_frames],
+            out=delta,
+        )
+        for i in range(2, n + 1):
+            np.subtract(
+                padded[..., n + i : n + i + n_frames],
+                padded[..., n - i : n - i + n_frames],
+                out=tmp,
+            )
+            tmp *= i
+            delta += tmp
+        delta /= denom
+        feats = delta
 
-    pad_mode = BorderType(pad_mode)
-    compute_deltas_ms = msaudio.ComputeDeltas(win_length, pad_mode)
-
-    return compute_deltas_ms(specgram)
+    return out
 
 
 def fbank(
@@ -262,9 +333,14 @@ def fbank(
     )
     fbanks = amplitude_to_dB(wavform=melspcgram, stype="power", ref=1.0, top_db=80.0)
     if deltas:
-        delta1 = compute_deltas(fbanks)
-        delta2 = compute_deltas(delta1)
-        fbanks = np.concatenate((fbanks, delta1, delta2), axis=-2)
+        n_feats = fbanks.shape[-2]
+        feats = np.empty(
+            fbanks.shape[:-2] + (3 * n_feats, fbanks.shape[-1]),
+            dtype=np.result_type(fbanks.dtype, np.float32),
+        )
+        feats[..., :n_feats, :] = fbanks
+        compute_deltas(fbanks, order=2, out=feats[..., n_feats:, :])
+        fbanks = feats
     if context:
         fbanks = context_window(fbanks, left_frames, right_frames)
     return fbanks
@@ -365,9 +441,14 @@ def mfcc(
         )
 
     if deltas:
-        delta1 = compute_deltas(mfccs)
-        delta2 = compute_deltas(delta1)
-        mfccs = np.concatenate((mfccs, delta1, delta2), axis=-2)
+        n_feats = mfccs.shape[-2]
+        feats = np.empty(
+            mfccs.shape[:-2] + (3 * n_feats, mfccs.shape[-1]),
+            dtype=np.result_type(mfccs.dtype, np.float32),
+        )
+        feats[..., :n_feats, :] = mfccs
+        compute_deltas(mfccs, order=2, out=feats[..., n_feats:, :])
+        mfccs = feats
     if context:
         mfccs = context_window(mfccs, left_frames, right_frames)
     return mfccs
@@ -469,8 +550,152 @@ def soft_mask(x_input, x_ref, *, power=1, split_zeros=False):
     return mask
 
 
+@numba.njit(cache=True)
+def _sift_heap(heap, size, pos, values, where, sign):
+    # Move the slot at `pos` of a heap of window slots to its place, the heap
+    # keeps the largest `sign * values[slot]` on top; `where` tracks the
+    # position of every slot.
+    slot = heap[pos]
+    key = sign * values[slot]
+    while pos > 0:
+        parent = (pos - 1) // 2
+        if sign * values[heap[parent]] >= key:
+            break
+        heap[pos] = heap[parent]
+        where[heap[pos]] = pos
+        pos = parent
+    while True:
+        child = 2 * pos + 1
+        if child >= size:
+            break
+        if (
+            child + 1 < size
+            and sign * values[heap[child + 1]] > sign * values[heap[child]]
+        ):
+            child += 1
+        if sign * values[heap[child]] <= key:
+            break
+        heap[pos] = heap[child]
+        where[heap[pos]] = pos
+        pos = child
+    heap[pos] = slot
+    where[slot] = pos
+
+
+@numba.njit(parallel=True, cache=True)
+def _running_median_rows(padded, size, out):
+    # The window is a ring of `size` slots split over two heaps: a max-heap
+    # with the lower half, whose top is the median, and a min-heap with the
+    # upper half. Each step overwrites the slot of the outgoing sample with
+    # the incoming one, sifts it within its heap and swaps the two tops if
+    # the halves then overlap, so a step costs O(log size).
+    num_low = size // 2 + 1
+    num_high = size - num_low
+    for r in numba.prange(out.shape[0]):
+        row = padded[r]
+        values = row[:size].copy()
+        order = np.argsort(values)
+        low = np.empty(num_low, dtype=np.int64)
+        high = np.empty(num_high, dtype=np.int64)
+        where = np.empty(size, dtype=np.int64)
+        in_high = np.zeros(size, dtype=np.bool_)
+        # Sorted arrays are heaps: descending for the lower, ascending for
+        # the upper half
+        for j in range(num_low):
+            low[j] = order[num_low - 1 - j]
+            where[low[j]] = j
+        for j in range(num_high):
+            high[j] = order[num_low + j]
+            where[high[j]] = j
+            in_high[high[j]] = True
+        out[r, 0] = values[low[0]]
+
+        for i in range(1, out.shape[1]):
+            slot = (i - 1) % size
+            values[slot] = row[i - 1 + size]
+            if in_high[slot]:
+                _sift_heap(high, num_high, where[slot], values, where, -1.0)
+            else:
+                _sift_heap(low, num_low, where[slot], values, where, 1.0)
+            if num_high > 0 and values[low[0]] > values[high[0]]:
+                top_low, top_high = low[0], high[0]
+                low[0], high[0] = top_high, top_low
+                in_high[top_low], in_high[top_high] = True, False
+                _sift_heap(low, num_low, 0, values, where, 1.0)
+                _sift_heap(high, num_high, 0, values, where, -1.0)
+            out[r, i] = values[low[0]]
+
+
+def running_median(x, size, axis=-1):
+    """
+    Apply a sliding median filter along one axis of an array.
+
+    The result is identical to `scipy.ndimage.median_filter` with a kernel
+    that is `size` wide along `axis` and 1 elsewhere (mode "reflect"), but
+    the window is kept in two heaps that are updated incrementally, so each
+    sample costs O(log size) instead of a selection over the whole window.
+    All the other axes are processed in parallel.
+
+    Args:
+        x (np.ndarray): Real-valued input of any shape.
+        size (int): Width of the median window.
+        axis (int): The axis along which to filter (default=-1).
+
+    Returns:
+        np.ndarray, the filtered array with the same shape as `x`.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.features as features
+        >>> spec = np.abs(np.random.randn(4, 1025, 600))
+        >>> harm = features.running_median(spec, 31, axis=-1)
+        >>> perc = features.running_median(spec, 31, axis=-2)
+    """
+    size = int(size)
+    if size < 1:
+        raise ValueError("size must be a positive integer, but got {}".format(size))
+
+    x = np.asarray(x)
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+    rows = np.moveaxis(x, axis, -1)
+    moved_shape = rows.shape
+    rows = rows.reshape((-1, moved_shape[-1])).astype(dtype, copy=False)
+
+    # Same window placement and border handling as scipy.ndimage "reflect"
+    padded = np.pad(rows, [(0, 0), (size // 2, (size - 1) // 2)], mode="symmetric")
+    out = np.empty(rows.shape, dtype=dtype)
+    _running_median_rows(np.ascontiguousarray(padded), size, out)
+
+    return np.moveaxis(out.reshape(moved_shape), -1, axis)
+
+
 def hpss(spectrogram, *, kernel_size=31, power=2.0, mask=False, margin=1.0):
-    # pylint: disable=C,R,W,E,F
+    """
+    Median-filtering harmonic percussive source separation.
+
+    Args:
+        spectrogram (np.ndarray): Complex or magnitude spectrogram with shape
+            `[freq, time]` or `[..., freq, time]`; leading axes are treated
+            as a batch.
+        kernel_size (int, tuple): Width of the harmonic (time) and
+            percussive (frequency) median filters (default=31).
+        power (float): Exponent of the soft masks (default=2.0).
+        mask (bool): Whether to return the masks instead of the separated
+            spectrograms (default=False).
+        margin (float, tuple): Margin of the harmonic and percussive masks,
+            which must be >= 1.0 (default=1.0).
+
+    Returns:
+        tuple, the harmonic and percussive spectrograms (or masks).
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.features as features
+        >>> import mindaudio.data.spectrum as spectrum
+        >>> waveforms = np.random.randn(8, 16000)
+        >>> D = spectrum.stft(waveforms, n_fft=2048)
+        >>> D_harm, D_perc = features.hpss(D)
+    """
     if not np.iscomplexobj(spectrogram):
         phase = 1
     else:
@@ -496,19 +721,9 @@ def hpss(spectrogram, *, kernel_size=31, power=2.0, mask=False, margin=1.0):
             "Margins must be >= 1.0. " "A typical range is between 1 and 10."
         )
 
-    # shape for kernels
-    perc_shape = [1 for _ in spectrogram.shape]
-    perc_shape[-2] = win_perc
-
-    harmonic_shape = [1 for _ in spectrogram.shape]
-    harmonic_shape[-1] = win_harmonic
-
-    # Compute median filters. Pre-allocation here preserves memory layout.
-    harm = np.empty_like(spectrogram)
-    harm[:] = median_filter(spectrogram, size=harmonic_shape, mode="reflect")
-
-    perc = np.empty_like(spectrogram)
-    perc[:] = median_filter(spectrogram, size=perc_shape, mode="reflect")
+    # Harmonic components are smooth in time, percussive ones in frequency
+    harm = running_median(spectrogram, win_harmonic, axis=-1)
+    perc = running_median(spectrogram, win_perc, axis=-2)
 
     split_zeros = margin_harmonic == 1 and margin_perc == 1
 
@@ -534,12 +749,12 @@ def harmonic(y_input, **kwargs):
     Extract harmonic elements from an audio time-series.
 
     Args:
-        y_input(np.ndarray): A batch of data in shape (,n) or (n_channel,n).
-        **kwargs : additional keyword arguments.
+        y_input(np.ndarray): A batch of data in shape (,n) or (batch,n).
+        **kwargs : additional keyword arguments passed to `hpss`.
 
     Returns:
         np.ndarray, the waveform after harmonic,A batch of data in shape (,n)
-        or (n_channel,n).
+        or (batch,n).
 
     Examples:
         >>> waveform, sr = io.read('./samples/ASR/BAC009S0002W0122.wav')
@@ -557,3 +772,673 @@ def harmonic(y_input, **kwargs):
     y_harm = istft(stft_harm, length=y_input.shape[-1])
 
     return y_harm
+
+
+def percussive(y_input, **kwargs):
+    """
+    Extract percussive elements from an audio time-series.
+
+    Args:
+        y_input(np.ndarray): A batch of data in shape (,n) or (batch,n).
+        **kwargs : additional keyword arguments passed to `hpss`.
+
+    Returns:
+        np.ndarray, the percussive waveform with the same shape as `y_input`.
+
+    Examples:
+        >>> waveform, sr = io.read('./samples/ASR/BAC009S0002W0122.wav')
+        >>> perc = features.percussive(waveform)
+    """
+    y_stft = stft(y_input, n_fft=2048, pad_mode="constant")
+
+    # Remove harmonic
+    stft_perc = hpss(y_stft, **kwargs)[1]
+
+    y_perc = istft(stft_perc, length=y_input.shape[-1])
+
+    return y_perc
+
+
+def _cumulative_mean_normalized_difference(
+    waveforms, frame_length, hop_length, min_period, max_period
+):
+    # The difference function is taken over the first
+    # `frame_length - max_period` samples of every frame. The result has
+    # shape (..., n_lags, n_frames).
+    win_length = frame_length - max_period
+    n_fft = next_fast_len(frame_length)
+
+    # Lagged cross-correlation with the analysis window, through the FFT.
+    # Time-major frames keep every FFT on a contiguous axis.
+    frames = np.swapaxes(_frame_view(waveforms, frame_length, hop_length), -1, -2)
+    spec = rfft(frames, n_fft, axis=-1)
+    spec *= np.conj(rfft(frames[..., :win_length], n_fft, axis=-1))
+    acf = irfft(spec, n_fft, axis=-1)[..., : max_period + 1]
+
+    # Energy of the window shifted by each lag, from one cumulative sum over
+    # the whole signal rather than over every frame
+    power = np.zeros(waveforms.shape[:-1] + (waveforms.shape[-1] + 1,))
+    np.cumsum(np.square(waveforms), axis=-1, out=power[..., 1:])
+    energy = power[..., win_length:] - power[..., :-win_length]
+    energy = np.swapaxes(_frame_view(energy, max_period + 1, hop_length), -1, -2)
+    energy = energy[..., : acf.shape[-2], :]
+
+    diff = energy[..., :1] + energy - 2 * acf
+    np.maximum(diff, 0, out=diff)
+
+    cumulative_mean = np.cumsum(diff[..., 1:], axis=-1)
+    cumulative_mean /= np.arange(1, max_period + 1)
+    cmnd = diff[..., min_period:] / (
+        cumulative_mean[..., min_period - 1 :] + np.finfo(np.float64).tiny
+    )
+    return np.swapaxes(cmnd, -1, -2)
+
+
+def _parabolic_shift(x):
+    # Sub-sample offset of the extremum at every position along axis -2
+    prev, cur, nxt = x[..., :-2, :], x[..., 1:-1, :], x[..., 2:, :]
+    denom = prev - 2 * cur + nxt
+    shift = np.zeros_like(x)
+    valid = np.abs(denom) > np.finfo(x.dtype).tiny
+    shift[..., 1:-1, :] = np.where(
+        valid, 0.5 * (prev - nxt) / np.where(valid, denom, 1), 0
+    )
+    # An interpolated extremum never lies beyond the neighbouring lags
+    return np.clip(shift, -1, 1)
+
+
+def _local_troughs(x):
+    # Strict local minima along axis -2, the first lag counts if it decreases
+    trough = np.zeros(x.shape, dtype=bool)
+    trough[..., 1:-1, :] = (x[..., 1:-1, :] < x[..., :-2, :]) & (
+        x[..., 1:-1, :] <= x[..., 2:, :]
+    )
+    trough[..., 0, :] = x[..., 0, :] < x[..., 1, :]
+    return trough
+
+
+def _yin_frames(
+    waveforms, sample_rate, fmin, fmax, frame_length, hop_length, center, pad_mode
+):
+    if fmin <= 0 or fmax <= fmin:
+        raise ValueError("fmin and fmax must satisfy 0 < fmin < fmax.")
+    if fmax > sample_rate / 2:
+        raise ValueError("fmax must not be higher than the Nyquist frequency.")
+
+    min_period = max(int(np.floor(sample_rate / fmax)), 1)
+    max_period = int(np.ceil(sample_rate / fmin))
+    if max_period >= frame_length - 1:
+        raise ValueError(
+            "frame_length={} is too small for fmin={}, it must be larger than "
+            "{}".format(frame_length, fmin, max_period + 1)
+        )
+
+    waveforms = np.asarray(waveforms, dtype=np.float64)
+    if center:
+        padding = [(0, 0)] * (waveforms.ndim - 1) + [
+            (frame_length // 2, frame_length // 2)
+        ]
+        waveforms = np.pad(waveforms, padding, mode=pad_mode)
+
+    cmnd = _cumulative_mean_normalized_difference(
+        waveforms, frame_length, hop_length, min_period, max_period
+    )
+    return cmnd, min_period
+
+
+def yin(
+    waveforms,
+    sample_rate=16000,
+    fmin=65.0,
+    fmax=2093.0,
+    frame_length=2048,
+    hop_length=None,
+    trough_threshold=0.1,
+    center=True,
+    pad_mode="constant",
+):
+    """
+    Estimate the fundamental frequency (F0) with the YIN algorithm.
+
+    The difference function of all frames is computed at once through the
+    FFT, so a whole batch is processed without any per-frame loop. With
+    `center=True` frame `t` is centered at `t * hop_length`, which gives
+    `1 + time // hop_length` frames, the same as `spectrum.melspectrogram`
+    with the same hop length.
+
+    Args:
+        waveforms (np.ndarray): Audio signals with shape `[time]` or
+            `[..., time]`.
+        sample_rate (int): Sampling rate of the waveforms (default=16000).
+        fmin (float): Minimum frequency to search, in Hz (default=65.0).
+        fmax (float): Maximum frequency to search, in Hz (default=2093.0).
+        frame_length (int): Length of the analysis frames, in samples. It must
+            cover more than one period of `fmin` (default=2048).
+        hop_length (int): Number of samples between frames (default=None,
+            will use frame_length // 4).
+        trough_threshold (float): Absolute threshold for the normalized
+            difference function (default=0.1).
+        center (bool): Whether to pad the waveforms so that frames are
+            centered (default=True).
+        pad_mode (str): Padding mode used when `center` is True
+            (default="constant").
+
+    Returns:
+        np.ndarray, the F0 in Hz with shape `[..., n_frames]`.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.features as features
+        >>> t = np.arange(22050) / 22050
+        >>> waveforms = np.stack([np.sin(2 * np.pi * 220 * t), np.sin(2 * np.pi * 440 * t)])
+        >>> f0 = features.yin(waveforms, sample_rate=22050, hop_length=256)
+        >>> f0.shape
+        (2, 87)
+    """
+    hop_length = hop_length if hop_length else frame_length // 4
+    cmnd, min_period = _yin_frames(
+        waveforms, sample_rate, fmin, fmax, frame_length, hop_length, center, pad_mode
+    )
+    shift = _parabolic_shift(cmnd)
+
+    # Take the first trough below the threshold, or the global minimum
+    below = _local_troughs(cmnd) & (cmnd < trough_threshold)
+    period = np.where(
+        np.any(below, axis=-2), np.argmax(below, axis=-2), np.argmin(cmnd, axis=-2)
+    )
+    period = (
+        min_period
+        + period
+        + np.take_along_axis(shift, np.expand_dims(period, -2), axis=-2)[..., 0, :]
+    )
+    return sample_rate / period
+
+
+@numba.njit(parallel=True, cache=True)
+def _pyin_viterbi(log_obs, log_band, log_stay, log_switch):
+    # Banded Viterbi decoding; states [0, n_bins) are voiced pitch bins and
+    # [n_bins, 2 * n_bins) their unvoiced counterparts. The best voiced and
+    # unvoiced predecessors of a bin are shared by both of its states.
+    n_batch, n_states, n_frames = log_obs.shape
+    n_bins = n_states // 2
+    half = log_band.shape[1] // 2
+    states = np.empty((n_batch, n_frames), dtype=np.int64)
+    for b in numba.prange(n_batch):
+        value = log_obs[b, :, 0] - np.log(n_states)
+        pointer = np.empty((n_frames, n_states), dtype=np.int64)
+        new_value = np.empty(n_states)
+        for t in range(1, n_frames):
+            for dst in range(n_bins):
+                best_voiced = -np.inf
+                best_unvoiced = -np.inf
+                src_voiced = dst
+                src_unvoiced = dst
+                for src in range(max(0, dst - half), min(n_bins, dst + half + 1)):
+                    weight = log_band[src, dst - src + half]
+                    score = value[src] + weight
+                    if score > best_voiced:
+                        best_voiced = score
+                        src_voiced = src
+                    score = value[src + n_bins] + weight
+                    if score > best_unvoiced:
+                        best_unvoiced = score
+                        src_unvoiced = src + n_bins
+
+                if best_voiced + log_stay >= best_unvoiced + log_switch:
+                    new_value[dst] = best_voiced + log_stay
+                    pointer[t, dst] = src_voiced
+                else:
+                    new_value[dst] = best_unvoiced + log_switch
+                    pointer[t, dst] = src_unvoiced
+
+                if best_unvoiced + log_stay >= best_voiced + log_switch:
+                    new_value[dst + n_bins] = best_unvoiced + log_stay
+                    pointer[t, dst + n_bins] = src_unvoiced
+                else:
+                    new_value[dst + n_bins] = best_voiced + log_switch
+                    pointer[t, dst + n_bins] = src_voiced
+
+            for state in range(n_states):
+                value[state] = new_value[state] + log_obs[b, state, t]
+
+        state = np.argmax(value)
+        for t in range(n_frames - 1, -1, -1):
+            states[b, t] = state
+            state = pointer[t, state]
+    return states
+
+
+def pyin(
+    waveforms,
+    sample_rate=16000,
+    fmin=65.0,
+    fmax=2093.0,
+    frame_length=2048,
+    hop_length=None,
+    n_thresholds=100,
+    beta_parameters=(2, 18),
+    resolution=0.1,
+    max_transition_rate=35.92,
+    switch_prob=0.01,
+    no_trough_prob=0.01,
+    fill_na=np.nan,
+    center=True,
+    pad_mode="constant",
+):
+    """
+    Estimate the fundamental frequency (F0) with probabilistic YIN (pYIN).
+
+    Every trough of the YIN difference function is weighted by the
+    probability mass of the thresholds that select it, and the resulting
+    pitch candidates are smoothed with a Viterbi decoding over voiced and
+    unvoiced pitch states. The frame layout is the same as `yin`.
+
+    Args:
+        waveforms (np.ndarray): Audio signals with shape `[time]` or
+            `[..., time]`.
+        sample_rate (int): Sampling rate of the waveforms (default=16000).
+        fmin (float): Minimum frequency to search, in Hz (default=65.0).
+        fmax (float): Maximum frequency to search, in Hz (default=2093.0).
+        frame_length (int): Length of the analysis frames, in samples
+            (default=2048).
+        hop_length (int): Number of samples between frames (default=None,
+            will use frame_length // 4).
+        n_thresholds (int): Number of thresholds of the prior (default=100).
+        beta_parameters (tuple): Shape parameters of the beta distribution
+            prior over the thresholds (default=(2, 18)).
+        resolution (float): Resolution of the pitch states, in semitones
+            (default=0.1).
+        max_transition_rate (float): Maximum pitch change, in octaves per
+            second (default=35.92).
+        switch_prob (float): Probability of switching between voiced and
+            unvoiced (default=0.01).
+        no_trough_prob (float): Weight given to the global minimum when no
+            trough is below a threshold (default=0.01).
+        fill_na (float): Value of the F0 in unvoiced frames (default=np.nan).
+        center (bool): Whether to pad the waveforms so that frames are
+            centered (default=True).
+        pad_mode (str): Padding mode used when `center` is True
+            (default="constant").
+
+    Returns:
+        np.ndarray, the F0 in Hz with shape `[..., n_frames]`.
+        np.ndarray, whether each frame is voiced.
+        np.ndarray, the voicing probability of each frame.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.features as features
+        >>> t = np.arange(22050) / 22050
+        >>> waveform = np.sin(2 * np.pi * 220 * t)
+        >>> f0, voiced_flag, voiced_prob = features.pyin(waveform, sample_rate=22050, hop_length=256)
+    """
+    from scipy import stats
+
+    hop_length = hop_length if hop_length else frame_length // 4
+    cmnd, min_period = _yin_frames(
+        waveforms, sample_rate, fmin, fmax, frame_length, hop_length, center, pad_mode
+    )
+    shift = _parabolic_shift(cmnd)
+    batch_shape = cmnd.shape[:-2]
+    n_frames = cmnd.shape[-1]
+
+    # Threshold prior: a trough takes the mass of all thresholds above its
+    # value and below every earlier trough.
+    thresholds = np.linspace(0, 1, n_thresholds + 1)[1:]
+    cdf = stats.beta.cdf(np.linspace(0, 1, n_thresholds + 1), *beta_parameters)
+    mass = np.concatenate(([0.0], np.cumsum(np.diff(cdf))))
+
+    def mass_below(value):
+        return mass[np.searchsorted(thresholds, value, side="right")]
+
+    troughs = np.where(_local_troughs(cmnd), cmnd, np.inf)
+    earlier = np.minimum.accumulate(troughs, axis=-2)
+    earlier = np.concatenate(
+        (np.full_like(earlier[..., :1, :], np.inf), earlier[..., :-1, :]), axis=-2
+    )
+    probs = np.maximum(mass_below(earlier) - mass_below(troughs), 0)
+
+    # Thresholds below every trough fall back to the lowest trough, frames
+    # without any trough stay unvoiced
+    lowest = np.min(troughs, axis=-2)
+    no_trough = np.where(np.isfinite(lowest), mass_below(lowest), 0)
+    global_min = np.expand_dims(np.argmin(troughs, axis=-2), -2)
+    np.put_along_axis(
+        probs,
+        global_min,
+        np.take_along_axis(probs, global_min, axis=-2)
+        + no_trough_prob * np.expand_dims(no_trough, -2),
+        axis=-2,
+    )
+
+    # Project the period candidates onto pitch bins
+    bins_per_semitone = int(np.ceil(1.0 / resolution))
+    n_bins = int(np.floor(12 * bins_per_semitone * np.log2(fmax / fmin))) + 1
+    period = min_period + np.arange(cmnd.shape[-2]).reshape((-1, 1)) + shift
+    pitch_bin = np.round(
+        12 * bins_per_semitone * np.log2(sample_rate / period / fmin)
+    ).astype(np.int64)
+    pitch_bin = np.clip(pitch_bin, 0, n_bins - 1)
+
+    probs = probs.reshape((-1,) + probs.shape[-2:])
+    pitch_bin = pitch_bin.reshape(probs.shape)
+    n_batch = probs.shape[0]
+    index = (
+        np.arange(n_batch).reshape((-1, 1, 1)) * n_bins + pitch_bin
+    ) * n_frames + np.arange(n_frames)
+    voiced = np.bincount(
+        index.ravel(), weights=probs.ravel(), minlength=n_batch * n_bins * n_frames
+    ).reshape((n_batch, n_bins, n_frames))
+    voiced_prob = np.clip(np.sum(voiced, axis=-2), 0, 1)
+    unvoiced = np.broadcast_to(
+        np.expand_dims((1 - voiced_prob) / n_bins, -2), voiced.shape
+    )
+    tiny = np.finfo(np.float64).tiny
+    log_obs = np.log(np.maximum(np.concatenate((voiced, unvoiced), axis=-2), tiny))
+
+    # Triangular local transition between pitch bins, normalized per source
+    max_semitones = int(round(max_transition_rate * 12 * hop_length / sample_rate))
+    half = max_semitones * bins_per_semitone
+    offsets = np.arange(-half, half + 1)
+    band = np.tile(1.0 - np.abs(offsets) / (half + 1), (n_bins, 1))
+    dst = np.arange(n_bins).reshape((-1, 1)) + offsets
+    band[(dst < 0) | (dst >= n_bins)] = 0
+    band /= np.sum(band, axis=-1, keepdims=True)
+    log_band = np.log(np.maximum(band, tiny))
+
+    states = _pyin_viterbi(
+        log_obs, log_band, np.log(1 - switch_prob), np.log(switch_prob)
+    )
+
+    voiced_flag = states < n_bins
+    freqs = fmin * 2.0 ** (np.arange(n_bins) / (12 * bins_per_semitone))
+    f0 = np.where(voiced_flag, freqs[states % n_bins], fill_na)
+
+    out_shape = batch_shape + (n_frames,)
+    return (
+        f0.reshape(out_shape),
+        voiced_flag.reshape(out_shape),
+        voiced_prob.reshape(out_shape),
+    )
+
+
+def energy(
+    waveforms,
+    n_fft=400,
+    win_length=None,
+    hop_length=None,
+    window="hann",
+    center=True,
+    pad_mode="reflect",
+):
+    """
+    Compute the frame-level energy, the L2-norm of each STFT magnitude frame,
+    used as the energy target of FastSpeech2.
+
+    With `center=True` frame `t` is centered at `t * hop_length`, so the
+    frames align with `spectrum.melspectrogram` and `yin` when they use the
+    same hop length.
+
+    Args:
+        waveforms (np.ndarray): Audio signals with shape `[time]` or
+            `[..., time]`.
+        n_fft (int): Size of FFT (default=400).
+        win_length (int): Window size (default=None, will use n_fft).
+        hop_length (int): Length of hop between STFT windows (default=None,
+            will use win_length // 2).
+        window (str): Window function (default="hann").
+        center (bool): Whether to pad the waveforms so that frames are
+            centered (default=True).
+        pad_mode (str): Padding mode used when `center` is True
+            (default="reflect").
+
+    Returns:
+        np.ndarray, the energy with shape `[..., n_frames]`.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.features as features
+        >>> waveforms = np.random.randn(4, 22050)
+        >>> e = features.energy(waveforms, n_fft=1024, hop_length=256)
+        >>> e.shape
+        (4, 87)
+    """
+    win_length = win_length if win_length else n_fft
+    hop_length = hop_length if hop_length else win_length // 2
+    spec = stft(
+        np.asarray(waveforms),
+        n_fft=n_fft,
+        win_length=win_length,
+        hop_length=hop_length,
+        window=window,
+        center=center,
+        pad_mode=pad_mode,
+    )
+    return np.linalg.norm(np.abs(spec), axis=-2)
+
+
+@functools.lru_cache(maxsize=64)
+def _cqt_octave_basis(
+    sample_rate, fmin, n_bins, bins_per_octave, filter_scale, sparsity, window
+):
+    # Sparse frequency-domain kernels of the bins of one octave, the n_fft
+    # they were designed for, with the STFT bins as columns.
+    from scipy import sparse
+
+    quality = float(filter_scale) / (2.0 ** (1.0 / bins_per_octave) - 1)
+    freqs = fmin * 2.0 ** (np.arange(n_bins) / bins_per_octave)
+    lengths = quality * sample_rate / freqs
+    n_fft = int(2.0 ** np.ceil(np.log2(np.max(lengths))))
+
+    kernels = np.zeros((n_bins, n_fft), dtype=np.complex128)
+    for i, (freq, length) in enumerate(zip(freqs, lengths)):
+        t = np.arange(-(int(length) // 2), int(length) - int(length) // 2)
+        kernel = get_window(window, len(t), fftbins=False) * np.exp(
+            2j * np.pi * freq * t / sample_rate
+        )
+        # Unit-amplitude sinusoids at the center frequency give |C| = 0.5
+        kernel /= np.sum(np.abs(kernel))
+        start = (n_fft - len(t)) // 2
+        kernels[i, start : start + len(t)] = kernel
+
+    # Correlation with the kernels, restricted to the non-negative frequencies
+    basis = np.conj(np.fft.fft(kernels, axis=-1))[:, : n_fft // 2 + 1] / n_fft
+
+    # Drop the smallest coefficients that hold `sparsity` of each row's mass
+    if sparsity > 0:
+        mag = np.abs(basis)
+        order = np.argsort(mag, axis=-1)
+        cum = np.cumsum(np.take_along_axis(mag, order, axis=-1), axis=-1)
+        drop = cum < sparsity * cum[:, -1:]
+        np.put_along_axis(mag, order, np.where(drop, 0, 1), axis=-1)
+        basis = basis * mag
+
+    return sparse.csr_matrix(basis), n_fft
+
+
+def cqt(
+    waveforms,
+    sample_rate=22050,
+    hop_length=512,
+    fmin=32.70319566257483,
+    n_bins=84,
+    bins_per_octave=12,
+    filter_scale=1.0,
+    sparsity=0.01,
+    window="hann",
+):
+    """
+    Compute the constant-Q transform (CQT) of an audio signal.
+
+    The CQT is computed one octave at a time, from the top octave down. Each
+    octave is a sparse matrix product with an STFT of the signal, after which
+    the signal is resampled to half its rate, so the same cached octave
+    kernels are reused for every lower octave instead of building very long
+    kernels for the lowest bins.
+
+    Args:
+        waveforms (np.ndarray): Audio signals with shape `[time]` or
+            `[..., time]`.
+        sample_rate (int): Sampling rate of the waveforms (default=22050).
+        hop_length (int): Number of samples between frames. It must be
+            divisible by `2 ** (n_octaves - 1)` (default=512).
+        fmin (float): Center frequency of the lowest bin, in Hz
+            (default=32.70, the C1 note).
+        n_bins (int): Number of frequency bins (default=84).
+        bins_per_octave (int): Number of bins per octave (default=12).
+        filter_scale (float): Scale of the filter lengths, larger values give
+            a finer frequency resolution (default=1.0).
+        sparsity (float): Share of each kernel's total magnitude that may be
+            discarded: the smallest coefficients are dropped while their
+            cumulative magnitude stays below `sparsity` times the row total
+            (default=0.01).
+        window (str): Window function of the kernels (default="hann").
+
+    Returns:
+        np.ndarray, complex CQT with shape `[..., n_bins, n_frames]`. With
+        frames centered at `t * hop_length`, so there are
+        `1 + time // hop_length` frames.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.features as features
+        >>> waveforms = np.random.randn(4, 22050 * 3)
+        >>> C = features.cqt(waveforms, sample_rate=22050)
+        >>> C.shape
+        (4, 84, 130)
+    """
+    n_octaves = int(np.ceil(float(n_bins) / bins_per_octave))
+    if hop_length % 2 ** (n_octaves - 1) != 0:
+        raise ValueError(
+            "hop_length={} must be divisible by 2 ** {} for {} octaves.".format(
+                hop_length, n_octaves - 1, n_octaves
+            )
+        )
+
+    quality = float(filter_scale) / (2.0 ** (1.0 / bins_per_octave) - 1)
+    fmax = fmin * 2.0 ** ((n_bins - 1) / bins_per_octave)
+    if fmax * (1 + 0.5 / quality) > sample_rate / 2:
+        raise ValueError(
+            "The highest CQT bin ({:.1f} Hz) exceeds the Nyquist frequency.".format(
+                fmax
+            )
+        )
+
+    waveforms = np.asarray(waveforms)
+    n_frames = 1 + waveforms.shape[-1] // hop_length
+    octaves = []
+    sr = float(sample_rate)
+    hop = hop_length
+    for octave in range(n_octaves):
+        # Bins of this octave, counting down from the top
+        hi = n_bins - octave * bins_per_octave
+        lo = max(hi - bins_per_octave, 0)
+        if octave > 0:
+            waveforms = resample(waveforms, orig_freq=sr, new_freq=sr / 2)
+            sr /= 2
+            hop //= 2
+
+        # Kernels only depend on frequencies relative to the sampling rate
+        octave_fmin = fmin * 2.0 ** (lo / bins_per_octave) * sample_rate / sr
+        basis, n_fft = _cqt_octave_basis(
+            float(sample_rate),
+            octave_fmin,
+            hi - lo,
+            bins_per_octave,
+            float(filter_scale),
+            float(sparsity),
+            window,
+        )
+        signal = waveforms
+        if n_fft > signal.shape[-1]:
+            # Long low-octave kernels just see zeros past the end
+            padding = [(0, 0)] * (signal.ndim - 1) + [(0, n_fft - signal.shape[-1])]
+            signal = np.pad(signal, padding)
+
+        spec = stft(
+            signal, n_fft=n_fft, hop_length=hop, window="boxcar", pad_mode="constant"
+        )
+        spec = spec[..., :n_frames]
+        n_frames = spec.shape[-1]
+
+        # One sparse product for all the frames of the batch
+        flat = np.moveaxis(spec, -2, 0).reshape((spec.shape[-2], -1))
+        response = np.asarray(basis.dot(flat))
+        response = np.moveaxis(
+            response.reshape((hi - lo,) + spec.shape[:-2] + (n_frames,)), 0, -2
+        )
+        octaves.insert(0, response)
+
+    return np.concatenate([c[..., :n_frames] for c in octaves], axis=-2).astype(
+        np.complex64
+    )
+
+
+def chroma_cqt(
+    waveforms,
+    sample_rate=22050,
+    hop_length=512,
+    fmin=32.70319566257483,
+    n_chroma=12,
+    n_octaves=7,
+    bins_per_octave=36,
+    norm=np.inf,
+    **kwargs,
+):
+    """
+    Compute a chromagram from the constant-Q transform.
+
+    Args:
+        waveforms (np.ndarray): Audio signals with shape `[time]` or
+            `[..., time]`.
+        sample_rate (int): Sampling rate of the waveforms (default=22050).
+        hop_length (int): Number of samples between frames (default=512).
+        fmin (float): Center frequency of the lowest CQT bin, in Hz
+            (default=32.70, the C1 note).
+        n_chroma (int): Number of chroma bins, starting at C (default=12).
+        n_octaves (int): Number of octaves of the CQT (default=7).
+        bins_per_octave (int): Number of CQT bins per octave, it must be a
+            multiple of `n_chroma` (default=36).
+        norm (float): Order of the per-frame norm of the chroma vectors,
+            None for no normalization (default=np.inf).
+        **kwargs: Additional keyword arguments passed to `cqt`.
+
+    Returns:
+        np.ndarray, chromagram with shape `[..., n_chroma, n_frames]`.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.features as features
+        >>> waveforms = np.random.randn(4, 22050 * 3)
+        >>> chroma = features.chroma_cqt(waveforms, sample_rate=22050)
+        >>> chroma.shape
+        (4, 12, 130)
+    """
+    if bins_per_octave % n_chroma != 0:
+        raise ValueError("bins_per_octave must be a multiple of n_chroma.")
+
+    n_bins = n_octaves * bins_per_octave
+    magnitude = np.abs(
+        cqt(
+            waveforms,
+            sample_rate=sample_rate,
+            hop_length=hop_length,
+            fmin=fmin,
+            n_bins=n_bins,
+            bins_per_octave=bins_per_octave,
+            **kwargs,
+        )
+    )
+
+    # Map every CQT bin to the nearest pitch class, with C at index 0
+    freqs = fmin * 2.0 ** (np.arange(n_bins) / bins_per_octave)
+    pitch = n_chroma * np.log2(freqs / 440.0) + n_chroma * 9 / 12
+    pitch_class = np.round(pitch).astype(np.int64) % n_chroma
+    projection = np.zeros((n_chroma, n_bins), dtype=magnitude.dtype)
+    projection[pitch_class, np.arange(n_bins)] = 1
+
+    chroma = np.matmul(projection, magnitude)
+    if norm is not None:
+        scale = np.linalg.norm(chroma, ord=norm, axis=-2, keepdims=True)
+        chroma = chroma / np.maximum(scale, np.finfo(chroma.dtype).tiny)
+    return chroma
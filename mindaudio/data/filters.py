@@ -1,7 +1,9 @@
+import functools
 from typing import Optional, Union
 
 import mindspore.dataset.audio as msaudio
 import numpy as np
+from scipy import signal
 from typing_extensions import Literal
 
 __all__ = [
@@ -12,6 +14,10 @@ __all__ = [
     "riaa_biquad",
     "treble_biquad",
     "dcshift",
+    "design_biquad",
+    "sos_chain",
+    "sos_filter",
+    "StreamingFilter",
     "filtfilt",
     "mel",
 ]
@@ -72,54 +78,288 @@ def notch_filter(notch_freq, filter_width=101, notch_width=0.05):
     return (hlpf + hhpf).reshape(1, -1, 1)
 
 
-def cal_filter_by_coffs(waveform, b, a):
-    # pylint: disable=C,R,W,E,F
-    if waveform.ndim == 1:
-        changed_waveform = waveform
-        o2 = 0.0
-        o1 = 0.0
-        i2 = 0.0
-        i1 = 0.0
-        j = 0
-        while j < waveform.shape[-1]:
-            o0 = waveform[j] * b[0] + i1 * b[1] + i2 * b[2] - o1 * a[1] - o2 * a[2]
-            i2 = i1
-            i1 = waveform[j]
-            o2 = o1
-            o1 = o0
-            changed_waveform[j] = min(o0, 1.0)
-            j += 1
+def cal_filter_by_coffs(waveform, b, a, axis=0, clamp=True):
+    """
+    Filter waveforms with an IIR filter given by its coefficients.
+
+    All channels and items are filtered in one call of
+    `scipy.signal.lfilter`; the input is not modified.
+
+    Args:
+        waveform (np.ndarray): The waveforms, with time along `axis`.
+        b (np.ndarray): The numerator coefficients.
+        a (np.ndarray): The denominator coefficients.
+        axis (int): The time axis (default=0).
+        clamp (bool): Whether to clip the output to [-1, 1] (default=True).
+
+    Returns:
+        np.ndarray, the filtered waveforms with the input shape.
+    """
+    filtered = signal.lfilter(b, a, waveform, axis=axis)
+    if clamp:
+        np.clip(filtered, -1.0, 1.0, out=filtered)
+    dtype = waveform.dtype if np.issubdtype(waveform.dtype, np.floating) else None
+    return filtered.astype(dtype, copy=False)
+
+
+_BIQUAD_TYPES = ["lowpass", "highpass", "bandpass", "peaking", "bass", "treble", "riaa"]
+
+# Zeros and poles of the RIAA playback filter per sampling rate, as in SoX
+_RIAA_ROOTS = {
+    44100: ((-0.2014898, 0.9233820), (0.7083149, 0.9924091)),
+    48000: ((-0.1766069, 0.9321590), (0.7396325, 0.9931330)),
+    88200: ((-0.1168735, 0.9648312), (0.8590646, 0.9964002)),
+    96000: ((-0.1141486, 0.9676817), (0.8699137, 0.9966946)),
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _design_biquad(filter_type, sample_rate, params):
+    params = dict(params)
+    if filter_type == "riaa":
+        if sample_rate not in _RIAA_ROOTS:
+            raise ValueError(
+                "sample_rate must be one of {}, but got {}.".format(
+                    sorted(_RIAA_ROOTS), sample_rate
+                )
+            )
+        zeros, poles = _RIAA_ROOTS[sample_rate]
+        b = np.array([1.0, -(zeros[0] + zeros[1]), zeros[0] * zeros[1]])
+        a = np.array([1.0, -(poles[0] + poles[1]), poles[0] * poles[1]])
+        # Normalize to 0 dB at 1 kHz
+        z = np.exp(-1j * 2 * np.pi * 1000 / sample_rate * np.arange(3))
+        b /= np.abs(np.dot(b, z) / np.dot(a, z))
     else:
-        waveform = waveform.T
-        changed_waveform = waveform
-        i = 0
-        while i < waveform.shape[0]:
-            j = 0
-            o2 = 0.0
-            o1 = 0.0
-            i2 = 0.0
-            i1 = 0.0
-            while j < waveform.shape[1]:
-                o0 = (
-                    waveform[i][j] * b[0]
-                    + i1 * b[1]
-                    + i2 * b[2]
-                    - o1 * a[1]
-                    - o2 * a[2]
+        freq = params.get("cutoff_freq", params.get("center_freq"))
+        q = params.get("q", 0.707)
+        w0 = 2 * np.pi * freq / sample_rate
+        alpha = np.sin(w0) / (2 * q)
+        cos_w0 = np.cos(w0)
+        if filter_type == "lowpass":
+            b = np.array([(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2])
+            a = np.array([1 + alpha, -2 * cos_w0, 1 - alpha])
+        elif filter_type == "highpass":
+            b = np.array([(1 + cos_w0) / 2, -1 - cos_w0, (1 + cos_w0) / 2])
+            a = np.array([1 + alpha, -2 * cos_w0, 1 - alpha])
+        elif filter_type == "bandpass":
+            b = np.array([alpha, 0.0, -alpha])
+            a = np.array([1 + alpha, -2 * cos_w0, 1 - alpha])
+        elif filter_type in ["peaking", "bass", "treble"]:
+            amp = np.exp(params["gain"] / 40 * np.log(10.0))
+            if filter_type == "peaking":
+                b = np.array([1 + alpha * amp, -2 * cos_w0, 1 - alpha * amp])
+                a = np.array([1 + alpha / amp, -2 * cos_w0, 1 - alpha / amp])
+            else:
+                # Shelving filters, `sign` is 1 for treble and -1 for bass
+                sign = 1 if filter_type == "treble" else -1
+                root = 2 * np.sqrt(amp) * alpha
+                minus = (amp - 1) * cos_w0
+                plus = (amp + 1) * cos_w0
+                b = amp * np.array(
+                    [
+                        amp + 1 + sign * minus + root,
+                        -2 * sign * (amp - 1 + sign * plus),
+                        amp + 1 + sign * minus - root,
+                    ]
+                )
+                a = np.array(
+                    [
+                        amp + 1 - sign * minus + root,
+                        2 * sign * (amp - 1 - sign * plus),
+                        amp + 1 - sign * minus - root,
+                    ]
+                )
+        else:
+            raise ValueError(
+                "filter_type must be one of {}, but got {}.".format(
+                    _BIQUAD_TYPES, filter_type
                 )
-                i2 = i1
-                i1 = waveform[i][j]
-                o2 = o1
-                o1 = o0
-                changed_waveform[i][j] = min(o0, 1.0)
-                j += 1
-            i += 1
-        changed_waveform = changed_waveform.T
-    return changed_waveform
-
-
-def low_pass_filter(waveform, sample_rate, cutoff_freq):
-    # pylint: disable=C,R,W,E,F
+            )
+
+    return (np.concatenate([b, a]) / a[0]).reshape(1, 6)
+
+
+def design_biquad(filter_type, sample_rate, **params):
+    """
+    Design a biquad filter as a second-order section.
+
+    The coefficients follow the Audio EQ Cookbook, as SoX does, and are
+    cached per filter type, sampling rate and parameters, so designing the
+    same filter again costs a dictionary lookup.
+
+    Args:
+        filter_type (str): The filter type. Options: ["lowpass", "highpass",
+            "bandpass", "peaking", "bass", "treble", "riaa"].
+        sample_rate (int): The sampling rate in Hz.
+        **params: The parameters of the filter type:
+            "lowpass", "highpass": `cutoff_freq` and `q` (default=0.707);
+            "bandpass": `center_freq` and `q`;
+            "peaking", "bass", "treble": `center_freq`, `gain` in dB and `q`;
+            "riaa": none, `sample_rate` must be 44100, 48000, 88200 or 96000.
+
+    Returns:
+        np.ndarray, the section with shape `[1, 6]`, in the layout of
+        `scipy.signal.sosfilt`.
+
+    Examples:
+        >>> import mindaudio.data.filters as filters
+        >>> sos = filters.design_biquad("peaking", 16000, center_freq=1500,
+        ...                             gain=3.0)
+    """
+    sos = _design_biquad(filter_type, sample_rate, tuple(sorted(params.items())))
+    return sos.copy()
+
+
+def sos_chain(filter_specs, sample_rate):
+    """
+    Cascade several biquad filters into one chain of second-order sections.
+
+    Args:
+        filter_specs (list): The filters as `(filter_type, params)` pairs, in
+            order, where `params` is a dict of the parameters of
+            `design_biquad`.
+        sample_rate (int): The sampling rate in Hz.
+
+    Returns:
+        np.ndarray, the sections with shape `[len(filter_specs), 6]`.
+
+    Examples:
+        >>> import mindaudio.data.filters as filters
+        >>> sos = filters.sos_chain([
+        ...     ("highpass", {"cutoff_freq": 80}),
+        ...     ("peaking", {"center_freq": 1500, "gain": 3.0}),
+        ...     ("treble", {"center_freq": 3000, "gain": -6.0}),
+        ... ], 16000)
+    """
+    return np.concatenate(
+        [
+            design_biquad(filter_type, sample_rate, **params)
+            for filter_type, params in filter_specs
+        ]
+    )
+
+
+def sos_filter(waveforms, sos, axis=-1, clamp=False):
+    """
+    Filter waveforms with a chain of second-order sections.
+
+    All sections are applied in a single pass over the signal, for all
+    items and channels at once.
+
+    Args:
+        waveforms (np.ndarray): The waveforms, e.g. `[batch, channel, time]`.
+        sos (np.ndarray): The sections with shape `[n_sections, 6]`, e.g.
+            from `design_biquad` or `sos_chain`.
+        axis (int): The time axis (default=-1).
+        clamp (bool): Whether to clip the output to [-1, 1] (default=False).
+
+    Returns:
+        np.ndarray, the filtered waveforms with the input shape.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.filters as filters
+        >>> waveforms = np.random.rand(16, 1, 32000) - 0.5
+        >>> sos = filters.sos_chain([("lowpass", {"cutoff_freq": 4000}),
+        ...                          ("bass", {"center_freq": 100,
+        ...                                    "gain": 6.0})], 16000)
+        >>> filtered = filters.sos_filter(waveforms, sos)
+    """
+    filtered = signal.sosfilt(sos, waveforms, axis=axis)
+    if clamp:
+        np.clip(filtered, -1.0, 1.0, out=filtered)
+    dtype = waveforms.dtype if np.issubdtype(waveforms.dtype, np.floating) else None
+    return filtered.astype(dtype, copy=False)
+
+
+class StreamingFilter:
+    """
+    A chain of second-order sections that filters a signal block by block.
+
+    The filter state is carried from one block to the next, so filtering a
+    signal in chunks, e.g. read with `io.read(file, offset, duration)` or
+    from a microphone, gives the same output as filtering it at once, with
+    no transient at the block boundaries and constant memory.
+
+    Args:
+        sos (np.ndarray): The sections with shape `[n_sections, 6]`, e.g.
+            from `design_biquad` or `sos_chain`. A `(b, a)` filter can be
+            converted with `scipy.signal.tf2sos`.
+        axis (int): The time axis of the blocks (default=-1).
+        clamp (bool): Whether to clip the output to [-1, 1]; the state is
+            kept unclipped (default=False).
+        steady_state (bool): Whether to start from the steady state of the
+            first sample instead of from rest, which avoids the start
+            transient of signals with an offset (default=False).
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.filters as filters
+        >>> stream = filters.StreamingFilter.from_specs(
+        ...     [("highpass", {"cutoff_freq": 80})], 16000)
+        >>> blocks = np.random.rand(10, 2, 1600) - 0.5
+        >>> filtered = np.concatenate([stream(block) for block in blocks], -1)
+    """
+
+    def __init__(self, sos, axis=-1, clamp=False, steady_state=False):
+        self.sos = np.atleast_2d(np.asarray(sos, dtype=np.float64))
+        self.axis = axis
+        self.clamp = clamp
+        self.steady_state = steady_state
+        self.zi = None
+
+    @classmethod
+    def from_specs(cls, filter_specs, sample_rate, **kwargs):
+        """
+        Build a streaming filter from biquad specifications.
+
+        Args:
+            filter_specs (list): The filters as `(filter_type, params)` pairs,
+                see `sos_chain`.
+            sample_rate (int): The sampling rate in Hz.
+            **kwargs: The other arguments of `StreamingFilter`.
+
+        Returns:
+            StreamingFilter, the streaming filter.
+        """
+        return cls(sos_chain(filter_specs, sample_rate), **kwargs)
+
+    def __call__(self, block):
+        """
+        Filter the next block of the stream.
+
+        Args:
+            block (np.ndarray): The next samples, with the same shape as the
+                previous blocks except along `axis`.
+
+        Returns:
+            np.ndarray, the filtered block with the input shape.
+        """
+        if self.zi is None:
+            axis = self.axis % block.ndim
+            shape = [1] * block.ndim
+            shape[axis] = 2
+            if self.steady_state:
+                # Scale the unit-step state of every section by the first sample
+                unit_zi = signal.sosfilt_zi(self.sos).reshape([len(self.sos)] + shape)
+                self.zi = unit_zi * np.take(block, [0], axis=axis)
+            else:
+                shape = list(block.shape)
+                shape[axis] = 2
+                self.zi = np.zeros([len(self.sos)] + shape)
+
+        filtered, self.zi = signal.sosfilt(self.sos, block, axis=self.axis, zi=self.zi)
+        if self.clamp:
+            np.clip(filtered, -1.0, 1.0, out=filtered)
+        dtype = block.dtype if np.issubdtype(block.dtype, np.floating) else None
+        return filtered.astype(dtype, copy=False)
+
+    def reset(self):
+        """Forget the state, so the next block starts a new stream."""
+        self.zi = None
+
+
+def low_pass_filter(waveform, sample_rate, cutoff_freq, clamp=True):
     """
     Allows audio signals with a frequency lower than the given cutoff to pass
     through and attenuates signals with frequencies higher than
@@ -131,6 +371,7 @@ def low_pass_filter(waveform, sample_rate, cutoff_freq):
         cutoff_freq: frequency (in Hz) where signals with higher frequencies
         will begin to be reduced by 6dB per octave (doubling in frequency)
         above this point.
+        clamp(bool): Whether to clip the output to [-1, 1] (default=True).
 
     Returns:
         np.ndarray, the waveform after low pass equalizer.
@@ -149,25 +390,11 @@ def low_pass_filter(waveform, sample_rate, cutoff_freq):
         >>> out_waveform = filters.low_pass_filter(waveform, sample_rate, \
         center_freq)
     """
-    q = 0.707
-    w0 = 2 * np.pi * cutoff_freq / sample_rate
-    alpha = np.sin(w0) / (2 * q)
-
-    b0 = (1 - np.cos(w0)) / 2
-    b1 = 1 - np.cos(w0)
-    b2 = (1 - np.cos(w0)) / 2
-    a0 = 1 + alpha
-    a1 = -2 * np.cos(w0)
-    a2 = 1 - alpha
+    sos = design_biquad("lowpass", sample_rate, cutoff_freq=cutoff_freq)
+    return sos_filter(waveform, sos, axis=0, clamp=clamp)
 
-    b = np.array([b0 / a0, b1 / a0, b2 / a0])
-    a = np.array([a0, a1 / a0, a2 / a0])
 
-    return cal_filter_by_coffs(waveform, b, a)
-
-
-def peaking_equalizer(waveform, sample_rate, center_freq, gain, q=0.707):
-    # pylint: disable=C,R,W,E,F
+def peaking_equalizer(waveform, sample_rate, center_freq, gain, q=0.707, clamp=True):
     """
     Applies a two-pole peaking equalization filter. The signal-level at
     and around `center_freq` can be increased or decreased, while all other
@@ -182,6 +409,7 @@ def peaking_equalizer(waveform, sample_rate, center_freq, gain, q=0.707):
         q: ratio of center frequency to bandwidth; bandwidth is inversely
             proportional to Q, meaning that as you raise Q, you narrow the
             bandwidth.
+        clamp(bool): Whether to clip the output to [-1, 1] (default=True).
 
     Returns:
         np.ndarray, the waveform after peaking equalizer
@@ -201,21 +429,8 @@ def peaking_equalizer(waveform, sample_rate, center_freq, gain, q=0.707):
         >>> out_waveform = filters.peaking_equalizer(waveform, sample_rate, \
              center_freq, gain, quality_factor)
     """
-    aa = np.exp(gain / 40 * np.log(10.0))
-    w0 = 2 * np.pi * center_freq / sample_rate
-    alpha = np.sin(w0) / (2 * q)
-
-    b0 = 1 + alpha * aa
-    b1 = -2 * np.cos(w0)
-    b2 = 1 - alpha * aa
-    a0 = 1 + alpha / aa
-    a1 = -2 * np.cos(w0)
-    a2 = 1 - alpha / aa
-
-    b = np.array([b0 / a0, b1 / a0, b2 / a0])
-    a = np.array([a0, a1 / a0, a2 / a0])
-
-    return cal_filter_by_coffs(waveform, b, a)
+    sos = design_biquad("peaking", sample_rate, center_freq=center_freq, gain=gain, q=q)
+    return sos_filter(waveform, sos, axis=0, clamp=clamp)
 
 
 def contrast(waveform, enhancement_amount=75.0):
@@ -270,8 +485,7 @@ def riaa_biquad(waveform, sample_rate=44100):
         >>> waveform, sr = io.read('./samples/ASR/BAC009S0002W0122.wav')
         >>> riaa_wav = filters.riaa_biquad(waveform)
     """
-    effect = msaudio.RiaaBiquad(sample_rate)
-    riaa_wav = effect(waveform)
+    riaa_wav = sos_filter(waveform, design_biquad("riaa", sample_rate), clamp=True)
     return riaa_wav
 
 
@@ -300,8 +514,8 @@ def treble_biquad(waveform, sample_rate, gain, central_freq=3000, Q=0.707):
         >>> treble_wav = filters.treble_biquad(waveform, sample_rate=44100, \
         gain=5)
     """
-    effect = msaudio.TrebleBiquad(sample_rate, gain, central_freq, Q)
-    treble_wav = effect(waveform)
+    sos = design_biquad("treble", sample_rate, center_freq=central_freq, gain=gain, q=Q)
+    treble_wav = sos_filter(waveform, sos, clamp=True)
     return treble_wav
 
 
@@ -335,18 +549,90 @@ def dcshift(waveform, shift, limiter_gain):
     return shifted_wav
 
 
-def filtfilt(waveform, N, Wn, btype):
+@functools.lru_cache(maxsize=128)
+def _design_butter(order, cutoff, btype):
+    """Design (and cache) a Butterworth filter as second-order sections."""
+    sos = signal.butter(order, cutoff, btype, output="sos")
+    return sos, signal.sosfilt_zi(sos)
+
+
+def _sosfiltfilt(sos, zi, waveform, axis):
+    """Forward-backward `sosfilt` with odd padding, as `signal.sosfiltfilt`."""
+    waveform = np.moveaxis(np.asarray(waveform), axis, -1)
+    # Same edge length as scipy: three times the number of filter taps
+    zeros = min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    padlen = min(3 * (2 * len(sos) + 1 - zeros), waveform.shape[-1] - 1)
+    first, last = waveform[..., :1], waveform[..., -1:]
+    padded = np.concatenate(
+        [
+            2 * first - waveform[..., padlen:0:-1],
+            waveform,
+            2 * last - waveform[..., -2 : -padlen - 2 : -1],
+        ],
+        axis=-1,
+    )
+    zi = zi.reshape(zi.shape[:1] + (1,) * (padded.ndim - 1) + (2,))
+    filted, _ = signal.sosfilt(sos, padded, zi=zi * padded[..., :1])
+    filted = filted[..., ::-1]
+    filted, _ = signal.sosfilt(sos, filted, zi=zi * filted[..., :1])
+    filted = filted[..., ::-1][..., padlen : padded.shape[-1] - padlen]
+    return np.moveaxis(filted, -1, axis)
+
+
+def _sosfiltfilt_gust(sos, waveform, axis):
     """
-    Apply a DC shift to the audio. This can be useful to remove DC offset
-    from audio.
+    Forward-backward `sosfilt` with Gustafsson's initial conditions.
+
+    This is `signal.filtfilt(method="gust")` with the state of the filter
+    taken as the states of all the sections, so the filter never has to be
+    converted to a (badly conditioned) transfer function.
+    """
+    waveform = np.moveaxis(np.asarray(waveform, dtype=np.float64), axis, -1)
+    num_samples = waveform.shape[-1]
+    order = 2 * len(sos)
+
+    # Zero-input response of the cascade to each unit initial state
+    zi = np.eye(order).reshape(order, len(sos), 2).transpose(1, 0, 2)
+    obs = signal.sosfilt(sos, np.zeros((order, num_samples)), zi=zi)[0].T
+    # The same responses reversed and filtered again, eq. (5) and (6)
+    s_mat = signal.sosfilt(sos, obs[::-1], axis=0)
+    m_mat = np.hstack((s_mat[::-1] - obs, obs[::-1] - s_mat))
+    w_mat = np.hstack((s_mat[::-1], obs[::-1]))
+
+    # Forward-backward and backward-forward passes from zero states
+    y_fb = signal.sosfilt(sos, signal.sosfilt(sos, waveform)[..., ::-1])[..., ::-1]
+    y_bf = signal.sosfilt(sos, signal.sosfilt(sos, waveform[..., ::-1])[..., ::-1])
+
+    # The initial states that make both orders agree, eq. (7). The unit
+    # states of low-cutoff sections give responses of very different scales,
+    # so the columns are normalised before the solve.
+    delta = (y_bf - y_fb).reshape(-1, num_samples).T
+    scale = np.linalg.norm(m_mat, axis=0)
+    scale[scale == 0] = 1
+    states = np.linalg.lstsq(m_mat / scale, delta, rcond=None)[0] / scale[:, None]
+    filted = y_fb + (w_mat @ states).T.reshape(y_fb.shape)
+    return np.moveaxis(filted, -1, axis)
+
+
+def filtfilt(waveform, N, Wn, btype, axis=-1, method="pad"):
+    """
+    Apply a zero-phase Butterworth filter, running it forward and backward.
+
+    The filter is designed as second-order sections, which stay stable for
+    high orders and low cutoffs, and the designs are cached so that
+    filtering many files with the same settings designs the filter once.
 
     Args:
         waveform(np.ndarray): The dimension of the audio waveform to be
-        processed needs to be (..., time).
+        processed needs to be (..., time), a batch is filtered in one call.
         N(int): The order of the filter.
-        Wn(float): Normalized cutoff frequency.
-        The formula Wn=2* cutoff_frequency / sample_rate.
+        Wn(float or list): Normalized cutoff frequency, a pair for the band
+        filters. The formula Wn=2* cutoff_frequency / sample_rate.
         btype(str): {‘lowpass', ‘highpass', ‘bandpass', ‘bandstop'}.
+        axis(int): The time axis of `waveform` (default=-1).
+        method(str): How the edges are handled, "pad" for odd extension or
+        "gust" for Gustafsson's initial conditions, which are solved for the
+        states of all the sections together (default="pad").
 
     Returns:
         filted_wav(np.ndarray): The dimension of the audio waveform is
@@ -359,10 +645,17 @@ def filtfilt(waveform, N, Wn, btype):
         >>> treble_wav = filters.filtfilt(waveform, N=8, Wn=0.02, \
         btype='highpass')
     """
-    from scipy import signal
+    cutoff = tuple(np.ravel(Wn).tolist()) if np.ndim(Wn) else float(Wn)
+    sos, zi = _design_butter(N, cutoff, btype)
+    if method == "pad":
+        filted_wav = _sosfiltfilt(sos, zi, waveform, axis)
+    elif method == "gust":
+        filted_wav = _sosfiltfilt_gust(sos, waveform, axis)
+    else:
+        raise ValueError("Unknown method {}, expected 'pad' or 'gust'".format(method))
 
-    b, a = signal.butter(N, Wn, btype)
-    filted_wav = signal.filtfilt(b, a, waveform)
+    if np.issubdtype(np.asarray(waveform).dtype, np.floating):
+        filted_wav = filted_wav.astype(waveform.dtype, copy=False)
     return filted_wav
 
 
@@ -1,22 +1,29 @@
+import functools
 import math
+from fractions import Fraction
 
 import mindspore as ms
 import mindspore.dataset.audio as msaudio
+import numba
 import numpy as np
 import scipy
 from mindspore import Parameter, Tensor, ops
 
-from .spectrum import amplitude_to_dB, compute_amplitude, dB_to_amplitude, frame
+from .spectrum import compute_amplitude, dB_to_amplitude
 
 __all__ = [
     "normalize",
     "unitarize",
     "resample",
+    "StreamingResampler",
     "rescale",
     "stereo_to_mono",
     "trim",
+    "trim_indices",
     "split",
+    "StreamingVAD",
     "sliding_window_cmn",
+    "StreamingCMN",
     "invert_channels",
     "loop",
     "clip",
@@ -129,6 +136,170 @@ def unitarize(waveforms, lengths=None, amp_type="avg", eps=1e-14):
     return waveforms / den
 
 
+@functools.lru_cache(maxsize=32)
+def _kaiser_resample_filter(up, down, lowpass_filter_width=6, rolloff=0.99, beta=None):
+    # Low-pass prototype of the polyphase resampler, at `up` times the input
+    # rate, with `lowpass_filter_width` zero crossings on each side.
+    if beta is None:
+        beta = 14.769656459379492
+    max_rate = max(up, down)
+    half_len = int(np.ceil(lowpass_filter_width * max_rate / rolloff))
+    return scipy.signal.firwin(
+        2 * half_len + 1, rolloff / max_rate, window=("kaiser", beta)
+    )
+
+
+def _resample_ratio(orig_freq, new_freq):
+    # Rational approximation of the ratio, so that 0.9, 14400.000000000002 / 16000
+    # and 9 / 10 share the same cached filter.
+    ratio = Fraction(float(new_freq) / float(orig_freq)).limit_denominator(1000)
+    return ratio.numerator, ratio.denominator
+
+
+def _polyphase_resample(
+    waveform,
+    orig_freq,
+    new_freq,
+    axis=-1,
+    lowpass_filter_width=6,
+    rolloff=0.99,
+    beta=None,
+):
+    up, down = _resample_ratio(orig_freq, new_freq)
+    if up == down:
+        return waveform.copy()
+    window = _kaiser_resample_filter(up, down, lowpass_filter_width, rolloff, beta)
+    y_hat = scipy.signal.resample_poly(waveform, up, down, axis=axis, window=window)
+    return np.asarray(y_hat, dtype=waveform.dtype)
+
+
+class StreamingResampler:
+    """
+    Polyphase resampling of a signal that arrives block by block.
+
+    The resampler keeps the input history its filter still needs, so that
+    resampling a stream in blocks, followed by `flush`, gives the same
+    samples as `resample(..., res_type="polyphase")` on the whole signal, in
+    time linear in the number of samples and with bounded memory.
+
+    Args:
+        orig_freq (float): The original frequency of the signal, which must be positive.
+        new_freq (float): The desired frequency, which must be positive.
+        axis (int): The time axis of the blocks (default=-1).
+        lowpass_filter_width (int): The number of zero crossings on each side of the filter (default=6).
+        rolloff (float): The roll-off frequency of the filter, as a fraction of the Nyquist (default=0.99).
+        beta (float): The shape parameter used for kaiser window (default=None, will use 14.769656459379492).
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.processing as processing
+        >>> stream = processing.StreamingResampler(44100, 16000)
+        >>> blocks = np.random.random([10, 2, 4410])
+        >>> y_16k = np.concatenate([stream(block) for block in blocks] + [stream.flush()], -1)
+    """
+
+    def __init__(
+        self,
+        orig_freq,
+        new_freq,
+        axis=-1,
+        lowpass_filter_width=6,
+        rolloff=0.99,
+        beta=None,
+    ):
+        self.up, self.down = _resample_ratio(orig_freq, new_freq)
+        self.axis = axis
+        window = _kaiser_resample_filter(
+            self.up, self.down, lowpass_filter_width, rolloff, beta
+        )
+        self._half_len = (len(window) - 1) // 2
+        # Pad the front of the filter so that its centre falls on a multiple of `down`,
+        # which aligns the outputs of `upfirdn` with those of `resample_poly`
+        pre_pad = -self._half_len % self.down
+        self._filter = np.concatenate([np.zeros(pre_pad), window * self.up])
+        self._delay = (self._half_len + pre_pad) // self.down
+        self.reset()
+
+    def reset(self):
+        """Forget the history, so the next block starts a new stream."""
+        self._buffer = None
+        self._offset = 0
+        self._received = 0
+        self._emitted = 0
+
+    def _emit(self, stop):
+        # Outputs `emitted:stop` from the buffered input, which starts at sample `offset`
+        start = self._emitted + self._delay - self._offset * self.up // self.down
+        if stop == self._emitted:
+            outputs = self._buffer[..., :0]
+        elif self.up == self.down:
+            outputs = self._buffer[
+                ..., self._emitted - self._offset : stop - self._offset
+            ]
+        else:
+            outputs = scipy.signal.upfirdn(
+                self._filter, self._buffer, self.up, self.down, axis=-1
+            )[..., start : start + stop - self._emitted]
+        self._emitted = stop
+        # Keep the input from the first sample the next output needs, at a multiple of `down`
+        first_needed = -(-(stop * self.down - self._half_len) // self.up)
+        offset = max(first_needed, 0) // self.down * self.down
+        self._buffer = self._buffer[..., offset - self._offset :]
+        self._offset = offset
+        return np.moveaxis(outputs.astype(self._dtype, copy=False), -1, self.axis)
+
+    def __call__(self, block):
+        """
+        Resample the next block of the stream.
+
+        Args:
+            block (np.ndarray): The next samples, with the same shape as the previous blocks
+                except along `axis`.
+
+        Returns:
+            np.ndarray, the output samples whose filter support has been received.
+        """
+        block = np.moveaxis(np.asarray(block), self.axis, -1)
+        self._dtype = (
+            block.dtype if np.issubdtype(block.dtype, np.floating) else np.float64
+        )
+        if self._buffer is None:
+            self._buffer = block
+        else:
+            self._buffer = np.concatenate([self._buffer, block], axis=-1)
+        self._received += block.shape[-1]
+        # The last output whose filter support lies within the received samples
+        ready = ((self._received - 1) * self.up - self._half_len) // self.down + 1
+        if self.up == self.down:
+            ready = self._received
+        return self._emit(max(ready, self._emitted))
+
+    def flush(self):
+        """
+        Finish the stream, emitting the outputs that depend on the last samples.
+
+        Returns:
+            np.ndarray, the remaining output samples; the resampler is reset afterwards.
+        """
+        if self._buffer is None:
+            raise ValueError("flush called before any block was resampled")
+        outputs = self._emit(-(-self._received * self.up // self.down))
+        self.reset()
+        return outputs
+
+
+@functools.lru_cache(maxsize=32)
+def _minddata_resampler(orig_freq, new_freq, lowpass_filter_width, rolloff, beta):
+    # Building the operator designs its kernel, so reuse it across calls
+    return msaudio.Resample(
+        orig_freq=orig_freq,
+        new_freq=new_freq,
+        lowpass_filter_width=lowpass_filter_width,
+        rolloff=rolloff,
+        beta=beta,
+    )
+
+
 def resample(
     waveform,
     orig_freq=16000,
@@ -137,6 +308,7 @@ def resample(
     lowpass_filter_width=6,
     rolloff=0.99,
     beta=None,
+    axis=-1,
 ):
     """
     Resample a signal from one frequency to another. A resample method can be given.
@@ -146,12 +318,16 @@ def resample(
             `[batch, num_frames, channel]`.
         orig_freq (float): The original frequency of the signal, which must be positive (default=16000).
         new_freq (float): The desired frequency, which must be positive (default=16000).
-        res_type (str): The resample method, which can be "fft","scipy","minddata".
+        res_type (str): The resample method, which can be "fft","scipy","polyphase","minddata".
+            "polyphase" filters with a cached Kaiser-windowed sinc, whose cost does not depend on
+            the prime factors of the signal length.
         lowpass_filter_width (int): Controls the shaperness of the filter, more means sharper but less
             efficient, which must be positive (default=6).
         rolloff (float): The roll-off frequency of the filter, as a fraction of the Nyquist. Lower values
             reduce anti-aliasing, but also reduce some of the highest frequencies, range: (0, 1] (default=0.99).
         beta (float): The shape parameter used for kaiser window (default=None, will use 14.769656459379492).
+        axis (int): The time axis, the other axes are resampled together in one call. Not used by
+            "minddata", which resamples the last axis (default=-1).
 
     Returns:
         np.ndarray, unitarized level waveform.
@@ -169,20 +345,27 @@ def resample(
 
     ratio = float(new_freq) / orig_freq
 
-    n_samples = int(np.ceil(waveform.shape[-1] * ratio))
+    n_samples = int(np.ceil(waveform.shape[axis] * ratio))
 
     if res_type in ("scipy", "fft"):
-        y_hat = scipy.signal.resample(waveform, n_samples, axis=-1)
+        y_hat = scipy.signal.resample(waveform, n_samples, axis=axis)
         return np.asarray(y_hat, dtype=waveform.dtype)
 
-    else:
-        resample_function = msaudio.Resample(
-            orig_freq=orig_freq,
-            new_freq=new_freq,
+    elif res_type == "polyphase":
+        return _polyphase_resample(
+            waveform,
+            orig_freq,
+            new_freq,
+            axis=axis,
             lowpass_filter_width=lowpass_filter_width,
             rolloff=rolloff,
             beta=beta,
         )
+
+    else:
+        resample_function = _minddata_resampler(
+            orig_freq, new_freq, lowpass_filter_width, rolloff, beta
+        )
         return resample_function(waveform)
 
 
@@ -260,6 +443,101 @@ def stereo_to_mono(waveforms):
     return waveforms
 
 
+def _framed_power(waveforms, frame_length, hop_length, lengths=None):
+    """
+    Mean power of the centred, zero-padded frames of `waveforms` with shape `[..., time]`.
+
+    The frame sums are differences of a cumulative sum of squares, so the cost is linear
+    in the signal length and no frame matrix is built. Samples from `lengths` on are
+    treated as padding.
+    """
+    if hop_length < 1:
+        raise ValueError("Invalid hop_length: {:d}".format(hop_length))
+    num_samples = waveforms.shape[-1]
+    pad = frame_length // 2
+    num_frames = (num_samples + 2 * pad - frame_length) // hop_length + 1
+    starts = np.arange(num_frames) * hop_length - pad
+    stops = starts + frame_length
+    limit = num_samples if lengths is None else np.expand_dims(lengths, -1)
+    starts = np.clip(starts, 0, limit)
+    stops = np.clip(stops, 0, limit)
+
+    energy = np.zeros(waveforms.shape[:-1] + (num_samples + 1,))
+    np.cumsum(np.square(waveforms, dtype=np.float64), axis=-1, out=energy[..., 1:])
+    if lengths is None:
+        power = energy[..., stops] - energy[..., starts]
+    else:
+        power = np.take_along_axis(energy, stops, -1)
+        power -= np.take_along_axis(energy, starts, -1)
+    # Rounding in the long cumulative sum can leave tiny negative values in silence
+    return np.maximum(power / frame_length, 0.0)
+
+
+def _non_silent_frames(power, top_db, ref_value, amin=1e-10):
+    # Same test as `amplitude_to_dB(power, ref=ref_value) > -top_db`, without the logarithms,
+    # with one reference per row of `power` or a shared one
+    threshold = np.maximum(amin, np.abs(ref_value)) * 10.0 ** (-top_db / 10.0)
+    return np.maximum(power, amin) > np.expand_dims(threshold, -1)
+
+
+def trim_indices(
+    waveforms,
+    lengths=None,
+    top_db=60,
+    reference=np.max,
+    frame_length=2048,
+    hop_length=512,
+):
+    """
+    Find the non-silent region of every signal in a batch, as `trim` does for one signal.
+
+    Args:
+        waveforms (np.ndarray): The audio signals in shape `[batch, time]` or `[batch, time, channels]`.
+        lengths (np.ndarray): The lengths of the signals in samples, the samples beyond are padding and
+            are ignored (default=None, all signals are complete).
+        top_db (float): The threshold in decibels below `reference`. The audio segments below this threshold
+            compared to `reference` will be considered as silence.
+        reference (float, Callable): The reference power, a callable is applied to the frame powers of each
+            signal. By default, `np.max` is used to serve as the reference.
+        frame_length (int): The number of samples per analysis frame.
+        hop_length (int): The number of samples between analysis frames.
+
+    Returns:
+        np.ndarray, shape=(batch, 2), the start and end sample of the non-silent region of every signal,
+            `[0, 0]` for a signal that is silent throughout.
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.processing as processing
+        >>> waveforms = np.zeros([2, 3000])
+        >>> waveforms[0, 1000:2000] = 0.6
+        >>> waveforms[1, 500:] = 0.3
+        >>> processing.trim_indices(waveforms, lengths=np.array([3000, 2500]), top_db=10)
+        array([[ 512, 3000],
+               [   0, 2500]])
+    """
+    mono_data = waveforms.mean(axis=-1) if waveforms.ndim > 2 else waveforms
+    batch_size, num_samples = mono_data.shape
+    if lengths is None:
+        lengths = np.full(batch_size, num_samples)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    power = _framed_power(mono_data, frame_length, hop_length, lengths)
+
+    pad = frame_length // 2
+    num_frames = (lengths + 2 * pad - frame_length) // hop_length + 1
+    if callable(reference):
+        reference = [reference(row[:n]) for row, n in zip(power, num_frames)]
+    non_silent = _non_silent_frames(power, top_db, np.asarray(reference, dtype=float))
+    non_silent &= np.arange(power.shape[-1]) < num_frames[:, None]
+
+    first = np.argmax(non_silent, axis=-1)
+    last = power.shape[-1] - np.argmax(non_silent[:, ::-1], axis=-1)
+    indices = np.stack([first, last], axis=-1) * hop_length
+    indices = np.minimum(indices, lengths[:, None])
+    indices[~non_silent.any(axis=-1)] = 0
+    return indices
+
+
 def trim(waveforms, top_db=60, reference=np.max, frame_length=2048, hop_length=512):
     """
     Trim an audio signal to keep concecutive non-silent segment.
@@ -291,32 +569,14 @@ def trim(waveforms, top_db=60, reference=np.max, frame_length=2048, hop_length=5
         3000
     """
     mono_data = stereo_to_mono(waveforms)
-    mono_data = np.pad(mono_data, int(frame_length // 2))
-    x = frame(mono_data, frame_length=frame_length, hop_length=hop_length)
-    # Calculate power
-    power = np.mean(np.abs(x) ** 2, axis=0, keepdims=False)
-    rms = np.sqrt(power) ** 2
-    non_silent = amplitude_to_dB(rms, ref=reference, top_db=None) > -top_db
-
-    edges = np.flatnonzero(np.diff(non_silent.astype(int)))
-
-    # Pad back the sample lost in the diff
-    edges = [edges + 1]
-
-    index = []
-    if non_silent[0]:
-        index.append(0)
-    else:
-        index.append(edges[0][0])
-    if non_silent[-1]:
-        index.append(len(non_silent))
-    else:
-        index.append(edges[-1][-1])
-
-    return (
-        waveforms[int(index[0] * hop_length) : int(index[1] * hop_length)],
-        np.array(index) * hop_length,
-    )
+    index = trim_indices(
+        mono_data[None],
+        top_db=top_db,
+        reference=reference,
+        frame_length=frame_length,
+        hop_length=hop_length,
+    )[0]
+    return waveforms[index[0] : index[1]], index
 
 
 def split(waveforms, top_db=60, reference=np.max, frame_length=2048, hop_length=512):
@@ -347,12 +607,9 @@ def split(waveforms, top_db=60, reference=np.max, frame_length=2048, hop_length=
                [5632, 8192]])
     """
     mono_data = stereo_to_mono(waveforms)
-    mono_data = np.pad(mono_data, int(frame_length // 2))
-    x = frame(mono_data, frame_length=frame_length, hop_length=hop_length)
-    # Calculate power
-    power = np.mean(np.abs(x) ** 2, axis=0, keepdims=False)
-    rms = np.sqrt(power) ** 2
-    non_silent = amplitude_to_dB(rms, ref=reference, top_db=None) > -top_db
+    power = _framed_power(mono_data, frame_length, hop_length)
+    ref_value = reference(power) if callable(reference) else reference
+    non_silent = _non_silent_frames(power, top_db, ref_value)
 
     edges = np.flatnonzero(np.diff(non_silent.astype(int)))
 
@@ -371,26 +628,276 @@ def split(waveforms, top_db=60, reference=np.max, frame_length=2048, hop_length=
     edges = np.concatenate(edges) * hop_length
 
     # Clip to the signal duration
-    edges = np.minimum(edges, waveforms.shape[-1])
+    edges = np.minimum(edges, mono_data.shape[-1])
 
     # Stack the results back as an ndarray
     return edges.reshape((-1, 2))
 
 
+@numba.njit(cache=True)
+def _vad_scan(
+    power_db, state, onset_db, offset_db, floor_rise, min_speech, min_silence, first
+):
+    # Hysteresis state machine over the frame powers, `state` holds the noise floor,
+    # whether speech is active, the length of the current run of frames that would
+    # switch the state, the first frame of the open segment and whether no onset has
+    # been seen yet. Returns the closed segments in frames.
+    floor, in_speech, run, start = state[0], state[1], state[2], state[3]
+    leading = state[4]
+    segments = np.empty((len(power_db) // max(min_silence, 1) + 1, 2), dtype=np.int64)
+    count = 0
+    for i in range(len(power_db)):
+        power = power_db[i]
+        if (
+            leading
+            and not in_speech
+            and first + i >= min_speech
+            and power + onset_db < floor
+        ):
+            # Before the first onset the floor has only seen the start of the stream. A
+            # frame `onset_db` below it shows that the stream started in speech, which
+            # then ends at this frame unless the level comes back.
+            in_speech, run, start, leading = 1, 0, 0, 0
+        if in_speech:
+            floor = min(floor, power)
+            if power < floor + offset_db:
+                run += 1
+                if run >= min_silence:
+                    segments[count, 0] = start
+                    segments[count, 1] = first + i - run + 1
+                    count += 1
+                    in_speech, run = 0, 0
+            else:
+                run = 0
+        else:
+            # The floor follows quieter frames at once and louder ones slowly
+            floor = min(power, floor + floor_rise)
+            if power > floor + onset_db:
+                run += 1
+                if run >= min_speech:
+                    start = first + i - run + 1
+                    in_speech, run, leading = 1, 0, 0
+            else:
+                run = 0
+    state[0], state[1], state[2], state[3] = floor, in_speech, run, start
+    state[4] = leading
+    return segments[:count]
+
+
+class StreamingVAD:
+    """
+    Energy-based voice activity detection on a stream of audio blocks.
+
+    The frame power is compared with an adaptive noise floor, which follows quieter
+    frames at once and rises slowly during silence. Speech starts after
+    `min_speech_duration` of frames `onset_db` above the floor and ends after
+    `min_silence_duration` of frames less than `offset_db` above it. Until the first
+    onset the floor has only seen the start of the stream, so a stream that starts in
+    speech is recognised when the level first drops `onset_db` below that floor, and
+    its segment starts at sample 0. The segments are returned as soon as they end, and
+    only the samples of an incomplete frame are kept between blocks, so recordings of
+    any length are segmented in bounded memory.
+
+    Args:
+        sample_rate (int): The sampling rate of the stream (default=16000).
+        frame_duration (float): The duration of the analysis frames in seconds (default=0.02).
+        onset_db (float): The level above the noise floor that starts speech (default=10.0).
+        offset_db (float): The level above the noise floor below which speech ends, lower than
+            `onset_db` for hysteresis (default=6.0).
+        floor_rise_db (float): How fast the noise floor may rise during silence, in dB per second
+            (default=3.0).
+        min_speech_duration (float): The shortest speech onset in seconds (default=0.25).
+        min_silence_duration (float): The shortest pause that ends a segment in seconds (default=0.3).
+        min_db (float): The frame power in dB is clipped to at least this level, so that digital
+            silence does not pull the noise floor down indefinitely (default=-70.0).
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.processing as processing
+        >>> vad = processing.StreamingVAD(sample_rate=16000)
+        >>> waveform = np.random.randn(16000 * 60) * 0.001
+        >>> waveform[16000 * 10 : 16000 * 20] += np.sin(np.arange(160000) * 0.1) * 0.3
+        >>> segments = [vad(block) for block in np.array_split(waveform, 60)] + [vad.flush()]
+        >>> np.concatenate(segments)
+        array([[160000, 320000]])
+    """
+
+    def __init__(
+        self,
+        sample_rate=16000,
+        frame_duration=0.02,
+        onset_db=10.0,
+        offset_db=6.0,
+        floor_rise_db=3.0,
+        min_speech_duration=0.25,
+        min_silence_duration=0.3,
+        min_db=-70.0,
+    ):
+        if offset_db > onset_db:
+            raise ValueError("offset_db must not be larger than onset_db")
+        self.frame_length = max(int(round(frame_duration * sample_rate)), 1)
+        frame_duration = self.frame_length / sample_rate
+        self.onset_db = onset_db
+        self.offset_db = offset_db
+        self.floor_rise = floor_rise_db * frame_duration
+        self.min_speech = max(int(round(min_speech_duration / frame_duration)), 1)
+        self.min_silence = max(int(round(min_silence_duration / frame_duration)), 1)
+        self.min_db = min_db
+        self.reset()
+
+    def reset(self):
+        """Forget the stream, so the next block starts a new recording at sample 0."""
+        self._state = np.array([np.inf, 0.0, 0.0, 0.0, 1.0])
+        self._remainder = np.zeros(0)
+        self._num_frames = 0
+        self._num_samples = 0
+
+    def __call__(self, block):
+        """
+        Detect speech in the next block of the stream.
+
+        Args:
+            block (np.ndarray): The next samples in shape (n,) or (n, n_channel).
+
+        Returns:
+            np.ndarray, shape=(m, 2), the start and end sample, counted from the start of the stream,
+                of the speech segments that ended within this block.
+        """
+        block = stereo_to_mono(np.asarray(block))
+        self._num_samples += len(block)
+        samples = np.concatenate([self._remainder, block])
+        num_frames = len(samples) // self.frame_length
+        frames = samples[: num_frames * self.frame_length]
+        self._remainder = samples[num_frames * self.frame_length :]
+
+        frames = frames.reshape(num_frames, self.frame_length)
+        power = np.einsum("ij,ij->i", frames, frames) / self.frame_length
+        power_db = np.maximum(10.0 * np.log10(np.maximum(power, 1e-10)), self.min_db)
+        segments = _vad_scan(
+            power_db,
+            self._state,
+            self.onset_db,
+            self.offset_db,
+            self.floor_rise,
+            self.min_speech,
+            self.min_silence,
+            self._num_frames,
+        )
+        self._num_frames += num_frames
+        return segments * self.frame_length
+
+    def flush(self):
+        """
+        Finish the stream, closing a segment that is still open at its end.
+
+        Returns:
+            np.ndarray, shape=(m, 2), the last segment if speech was active; the detector is reset
+                afterwards.
+        """
+        segments = np.zeros((0, 2), dtype=np.int64)
+        if self._state[1]:
+            start = int(self._state[3]) * self.frame_length
+            segments = np.array([[start, self._num_samples]], dtype=np.int64)
+        self.reset()
+        return segments
+
+
+def _cmn_window_bounds(frames, num_frames, cmn_window, min_cmn_window, center):
+    # Kaldi's sliding CMN window [starts, stops) of every frame in `frames`, for signals of
+    # `num_frames` frames (a scalar or one per row)
+    if center:
+        starts = frames - cmn_window // 2
+        stops = starts + cmn_window
+        # Shift the window right if it starts before the signal
+        stops = stops - np.minimum(starts, 0)
+    else:
+        # The window only looks ahead to reach `min_cmn_window` frames
+        starts = frames - cmn_window
+        stops = np.maximum(frames + 1, min_cmn_window)
+    starts = np.maximum(starts, 0)
+    # Shift the window left if it ends after the signal
+    overflow = np.maximum(stops - num_frames, 0)
+    starts = np.maximum(starts - overflow, 0)
+    stops = stops - overflow
+    return starts, stops
+
+
+@numba.njit(parallel=True, cache=True)
+def _windowed_cmn_rows(x, frames, starts, stops, norm_vars, out):
+    # Per row of `x` with shape [rows, time, freq], normalize the frames `frames` by the
+    # statistics of the frames [starts, stops), read from prefix sums
+    rows, num_frames, num_feats = x.shape
+    for row in numba.prange(rows):
+        prefix = np.zeros((num_frames + 1, num_feats))
+        prefix_sq = np.zeros((num_frames + 1, num_feats))
+        for t in range(num_frames):
+            for j in range(num_feats):
+                value = np.float64(x[row, t, j])
+                prefix[t + 1, j] = prefix[t, j] + value
+                if norm_vars:
+                    prefix_sq[t + 1, j] = prefix_sq[t, j] + value * value
+        for i in range(frames.shape[1]):
+            frame, start, stop = frames[row, i], starts[row, i], stops[row, i]
+            count = stop - start
+            for j in range(num_feats):
+                mean = (prefix[stop, j] - prefix[start, j]) / count
+                value = x[row, frame, j] - mean
+                if norm_vars:
+                    if count == 1:
+                        # A single frame has no variance, Kaldi outputs zeros
+                        value = 0.0
+                    else:
+                        variance = (prefix_sq[stop, j] - prefix_sq[start, j]) / count
+                        variance -= mean * mean
+                        value /= np.sqrt(max(variance, 1e-20))
+                out[row, i, j] = value
+
+
+def _windowed_cmn(x, frames, starts, stops, norm_vars):
+    """
+    Normalize the frames `frames` of `x` with shape `[..., time, freq]` by the statistics of the
+    frames `[starts, stops)`, so that the cost does not depend on the window size.
+    """
+    batch_shape = x.shape[:-2]
+    # Explicit sizes, so that empty inputs reshape too
+    num_rows = int(np.prod(batch_shape))
+    rows = x.reshape((num_rows,) + x.shape[-2:])
+    bounds = [
+        np.broadcast_to(bound, batch_shape + frames.shape[-1:]).reshape(
+            num_rows, frames.shape[-1]
+        )
+        for bound in (frames, starts, stops)
+    ]
+    out = np.empty(bounds[0].shape + x.shape[-1:])
+    _windowed_cmn_rows(rows, *bounds, norm_vars, out)
+    return out.reshape(batch_shape + out.shape[-2:])
+
+
 def sliding_window_cmn(
-    x, cmn_window=600, min_cmn_window=100, center=False, norm_vars=False
+    x,
+    cmn_window=600,
+    min_cmn_window=100,
+    center=False,
+    norm_vars=False,
+    lengths=None,
 ):
     """
     Apply sliding-window cepstral mean (and optionally variance) normalization per utterance.
 
+    The window statistics are differences of prefix sums, so the cost is linear in the number of
+    frames whatever the window size. The windows follow Kaldi's `apply-cmvn-sliding`.
+
     Args:
-        x (np.ndarray): A batch of data in shape (n,) or (n, n_channel).
+        x (np.ndarray): The features in shape (n,), (n, n_feature) or (batch, n, n_feature), n being the
+            number of frames.
         cmn_window (int): Window in frames for running average CMN computation (default=600).
         min_cmn_window (int): Minimum CMN window used at start of decoding (adds latency only at start).
             Only applicable if center is False, ignored if center is True (default=100).
         center (bool): If True, use a window centered on the current frame. If False, window is
             to the left. (default=False).
         norm_vars (bool): If True, normalize variance to one. (default=False).
+        lengths (np.ndarray): The number of frames of every utterance of a padded batch, the padding
+            frames are excluded from the windows and set to zero (default=None, no padding).
 
     Returns:
         np.ndarray, the data after CMN
@@ -401,10 +908,116 @@ def sliding_window_cmn(
         >>> waveform = np.random.random([1, 20, 10])
         >>> after_CMN = processing.sliding_window_cmn(waveform, 500, 200)
     """
-    sliding_window_cmn_ms = msaudio.SlidingWindowCmn(
-        cmn_window, min_cmn_window, center, norm_vars
+    orig_shape = x.shape
+    if x.ndim == 1:
+        x = x[:, None]
+    num_frames = x.shape[-2]
+    frames = np.arange(num_frames)
+    if lengths is not None:
+        lengths = np.asarray(lengths, dtype=np.int64)[:, None]
+    else:
+        lengths = num_frames
+    starts, stops = _cmn_window_bounds(
+        frames, lengths, cmn_window, min_cmn_window, center
     )
-    return sliding_window_cmn_ms(x)
+    out = _windowed_cmn(x, frames, starts, stops, norm_vars)
+    if not np.isscalar(lengths):
+        out *= (frames < lengths)[..., None]
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+    return out.astype(dtype, copy=False).reshape(orig_shape)
+
+
+class StreamingCMN:
+    """
+    Sliding-window cepstral mean (and optionally variance) normalization of a feature stream.
+
+    The frames are normalized with the same left windows as `sliding_window_cmn` with
+    `center=False`: the first `min_cmn_window` frames are returned once that many frames have been
+    received (or at `flush`), every later frame as soon as it arrives. Only the last `cmn_window`
+    frames are kept, so the memory is bounded for online decoding.
+
+    Args:
+        cmn_window (int): Window in frames for running average CMN computation (default=600).
+        min_cmn_window (int): Minimum CMN window used at start of decoding (default=100).
+        norm_vars (bool): If True, normalize variance to one. (default=False).
+
+    Examples:
+        >>> import numpy as np
+        >>> import mindaudio.data.processing as processing
+        >>> stream = processing.StreamingCMN(cmn_window=300, min_cmn_window=50)
+        >>> feats = np.random.random([1000, 80])
+        >>> blocks = [stream(block) for block in np.array_split(feats, 20)] + [stream.flush()]
+        >>> np.allclose(np.concatenate(blocks), processing.sliding_window_cmn(feats, 300, 50))
+        True
+    """
+
+    def __init__(self, cmn_window=600, min_cmn_window=100, norm_vars=False):
+        self.cmn_window = cmn_window
+        self.min_cmn_window = min_cmn_window
+        self.norm_vars = norm_vars
+        self.reset()
+
+    def reset(self):
+        """Forget the stream, so the next block starts a new utterance."""
+        self._history = None
+        self._offset = 0
+        self._emitted = 0
+
+    def _normalize(self, stop, num_frames):
+        # Frames `emitted:stop` of a stream of `num_frames` frames
+        frames = np.arange(self._emitted, stop)
+        starts, stops = _cmn_window_bounds(
+            frames, num_frames, self.cmn_window, self.min_cmn_window, False
+        )
+        out = _windowed_cmn(
+            self._history,
+            frames - self._offset,
+            starts - self._offset,
+            stops - self._offset,
+            self.norm_vars,
+        )
+        self._emitted = stop
+        # The next frame needs the history from its window start on
+        offset = max(stop - self.cmn_window, 0)
+        self._history = self._history[offset - self._offset :]
+        self._offset = offset
+        return out.astype(self._dtype, copy=False)
+
+    def __call__(self, block):
+        """
+        Normalize the next frames of the stream.
+
+        Args:
+            block (np.ndarray): The next frames in shape (n, n_feature).
+
+        Returns:
+            np.ndarray, the normalized frames whose window is complete, in shape (m, n_feature).
+        """
+        block = np.asarray(block)
+        self._dtype = (
+            block.dtype if np.issubdtype(block.dtype, np.floating) else np.float64
+        )
+        if self._history is None:
+            self._history = block
+        else:
+            self._history = np.concatenate([self._history, block])
+        received = self._offset + len(self._history)
+        stop = received if received >= self.min_cmn_window else self._emitted
+        return self._normalize(stop, received)
+
+    def flush(self):
+        """
+        Finish the utterance, normalizing the frames still waiting for `min_cmn_window` frames.
+
+        Returns:
+            np.ndarray, the remaining normalized frames; the normalizer is reset afterwards.
+        """
+        if self._history is None:
+            raise ValueError("flush called before any frame was normalized")
+        received = self._offset + len(self._history)
+        out = self._normalize(received, received)
+        self.reset()
+        return out
 
 
 def invert_channels(waveform):
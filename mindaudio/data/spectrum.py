@@ -234,7 +234,7 @@ def stft(
                 extra += y_frames_post.shape[-1]
             else:
                 # the end padding
-                post_shape = list(the_shape_of_frames.shape)
+                post_shape = list(the_shape_of_frames)
                 post_shape[-1] = 0
                 y_frames_post = np.empty_like(af_frames, shape=post_shape)
     else:
@@ -304,6 +304,15 @@ def frame(x, frame_length=2048, hop_length=64):
     return x_frames
 
 
+def _frame_view(x, frame_length, hop_length):
+    """Read-only strided view of `x` with shape (..., frame_length, num_frame), no copy is made."""
+    if hop_length < 1:
+        raise ValueError("Invalid hop_length: {:d}".format(hop_length))
+
+    x_frames = np.lib.stride_tricks.sliding_window_view(x, frame_length, axis=-1)
+    return np.swapaxes(x_frames[..., ::hop_length, :], -2, -1)
+
+
 def _pad_shape(y_shift, data_shape):
     need_shape = y_shift.shape[-1]
 
@@ -725,7 +734,7 @@ def magphase(waveform, power, iscomplex=True):
         mag_nonzero = mag + zero_to_ones
         # Compute real and imaginary seprately, because complex division can produce Nans
         # when denormaliased numbers are involved
-        phase = np.empty((waveform.shape[0], waveform.shape[1]), dtype=np.complex64)
+        phase = np.empty(waveform.shape, dtype=np.complex64)
         phase.real = waveform.real / mag_nonzero + zero_to_ones
         phase.imag = waveform.imag / mag_nonzero
         mag **= power
@@ -1,5 +1,6 @@
 import json
 import os
+import wave
 
 import mindspore.dataset.engine as de
 import numpy as np
@@ -15,6 +16,38 @@ TRAIN_LABEL_PAD_LENGTH = 350
 TEST_INPUT_PAD_LENGTH = 3500
 
 
+def get_num_samples(audio_path):
+    """
+    Number of samples of an audio file, read from the WAV header when possible.
+    """
+    try:
+        with wave.open(audio_path, "rb") as wav_file:
+            return wav_file.getnframes()
+    except (wave.Error, EOFError):
+        # Formats the wave module does not parse, e.g. float WAV
+        audio, _ = mindaudio.read(audio_path)
+        return len(audio)
+
+
+def load_duration_index(manifest_filepath, root_path, ids):
+    """
+    Number of samples of every manifest entry, cached next to the manifest so that the
+    audio headers are only read once.
+    """
+    index_path = os.path.splitext(manifest_filepath)[0] + "_durations.json"
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    missing = [data[0] for data in ids if data[0] not in index]
+    for wav_path in missing:
+        index[wav_path] = get_num_samples(os.path.join(root_path, wav_path))
+    if missing:
+        with open(index_path, "w") as f:
+            json.dump(index, f)
+    return [index[data[0]] for data in ids]
+
+
 class LoadAudioAndTranscript:
     """
     parse audio and transcript
@@ -64,6 +97,13 @@ class ASRDataset(LoadAudioAndTranscript):
         labels (list): List containing all the possible characters to map to
         normalize: Apply standard mean and deviation Normalization to audio tensor
         batch_size (int): Dataset batch size (default=32)
+        is_training (bool): Whether dataset is use for train or eval (default=True).
+        bucket_lengths (list): The padded lengths in frames of the duration buckets. Every utterance is
+            batched with utterances of its bucket and padded to the bucket length, so there is one static
+            shape per bucket. Longer training utterances are cropped to the last bucket
+            (default=None, a single bucket of TRAIN_INPUT_PAD_LENGTH or TEST_INPUT_PAD_LENGTH frames).
+        frames_per_batch (int): With `bucket_lengths`, the padded frames per batch, which sets the batch size
+            of every bucket instead of `batch_size` (default=None, `batch_size` times the longest bucket).
     """
 
     def __init__(
@@ -74,6 +114,8 @@ class ASRDataset(LoadAudioAndTranscript):
         normalize=False,
         batch_size=32,
         is_training=True,
+        bucket_lengths=None,
+        frames_per_batch=None,
     ):
         with open(manifest_filepath) as f:
             json_file = json.load(f)
@@ -85,18 +127,64 @@ class ASRDataset(LoadAudioAndTranscript):
         self.is_training = is_training
         self.ids = ids
         self.blank_id = int(labels.index("_"))
-        self.bins = [ids[i : i + batch_size] for i in range(0, len(ids), batch_size)]
-        if len(self.ids) % batch_size != 0:
-            self.bins = self.bins[:-1]
-            self.bins.append(ids[-batch_size:])
-        self.size = len(self.bins)
         self.batch_size = batch_size
         self.labels_map = {labels[i]: i for i in range(len(labels))}
         super(ASRDataset, self).__init__(audio_conf, normalize, self.labels_map)
 
+        if bucket_lengths:
+            self.bins, self.bin_lengths = self._bucket_bins(
+                manifest_filepath, sorted(bucket_lengths), frames_per_batch
+            )
+        else:
+            self.bins = [
+                ids[i : i + batch_size] for i in range(0, len(ids), batch_size)
+            ]
+            if len(self.ids) % batch_size != 0:
+                self.bins = self.bins[:-1]
+                self.bins.append(ids[-batch_size:])
+            pad_length = (
+                TRAIN_INPUT_PAD_LENGTH if is_training else TEST_INPUT_PAD_LENGTH
+            )
+            self.bin_lengths = [pad_length] * len(self.bins)
+        self.size = len(self.bins)
+
+    def _bucket_bins(self, manifest_filepath, bucket_lengths, frames_per_batch):
+        """
+        Group the utterances by duration into batches of the bucket lengths.
+        """
+        hop_length = int(self.sample_rate * self.window_stride)
+        num_samples = np.array(
+            load_duration_index(manifest_filepath, self.root_path, self.ids)
+        )
+        num_frames = num_samples // hop_length + 1
+        if not self.is_training and num_frames.max() > bucket_lengths[-1]:
+            raise ValueError(
+                f"The longest utterance has {num_frames.max()} frames, more than the "
+                f"largest bucket length {bucket_lengths[-1]}, it would be cropped."
+            )
+        if frames_per_batch is None:
+            frames_per_batch = self.batch_size * bucket_lengths[-1]
+
+        buckets = np.searchsorted(bucket_lengths, num_frames)
+        buckets = np.minimum(buckets, len(bucket_lengths) - 1)
+        bins, bin_lengths = [], []
+        for bucket, pad_length in enumerate(bucket_lengths):
+            members = np.flatnonzero(buckets == bucket)
+            if not len(members):
+                continue
+            batch_size = max(frames_per_batch // pad_length, 1)
+            # Fill the last batch with utterances of the same bucket to keep its shape static
+            num_batches = -(-len(members) // batch_size)
+            members = np.resize(members, num_batches * batch_size)
+            for batch in members.reshape(num_batches, batch_size):
+                bins.append([self.ids[i] for i in batch])
+                bin_lengths.append(pad_length)
+        return bins, bin_lengths
+
     def __getitem__(self, index):
         batch_idx = self.bins[index]
         batch_size = len(batch_idx)
+        pad_length = self.bin_lengths[index]
         batch_spect, batch_script, target_indices = [], [], []
         input_length = np.zeros(batch_size, np.float32)
         for data in batch_idx:
@@ -112,13 +200,11 @@ class ASRDataset(LoadAudioAndTranscript):
         if self.is_training:
             # 1501 is the max length in train dataset(LibriSpeech).
             # The length is fixed to this value because Mindspore does not support dynamic shape currently
-            inputs = np.zeros(
-                (batch_size, 1, freq_size, TRAIN_INPUT_PAD_LENGTH), dtype=np.float32
-            )
+            inputs = np.zeros((batch_size, 1, freq_size, pad_length), dtype=np.float32)
             # The target length is fixed to this value because Mindspore does not support dynamic shape currently
             # 350 may be greater than the max length of labels in train dataset(LibriSpeech).
             targets = (
-                np.ones((self.batch_size, TRAIN_LABEL_PAD_LENGTH), dtype=np.int32)
+                np.ones((batch_size, TRAIN_LABEL_PAD_LENGTH), dtype=np.int32)
                 * self.blank_id
             )
             for k, spect_, scripts_ in zip(
@@ -129,23 +215,21 @@ class ASRDataset(LoadAudioAndTranscript):
                 # input_length[k] = seq_length
                 script_length = len(scripts_)
                 targets[k, :script_length] = scripts_
-                for m in range(350):
+                for m in range(TRAIN_LABEL_PAD_LENGTH):
                     target_indices.append([k, m])
-                if seq_length <= TRAIN_INPUT_PAD_LENGTH:
+                if seq_length <= pad_length:
                     input_length[k] = seq_length
                     inputs[k, 0, :, 0:seq_length] = spect_[:, :seq_length]
                 else:
-                    maxstart = seq_length - TRAIN_INPUT_PAD_LENGTH
+                    maxstart = seq_length - pad_length
                     start = np.random.randint(maxstart)
-                    input_length[k] = TRAIN_INPUT_PAD_LENGTH
-                    inputs[k, 0, :, 0:TRAIN_INPUT_PAD_LENGTH] = spect_[
-                        :, start : start + TRAIN_INPUT_PAD_LENGTH
+                    input_length[k] = pad_length
+                    inputs[k, 0, :, 0:pad_length] = spect_[
+                        :, start : start + pad_length
                     ]
             targets = np.reshape(targets, (-1,))
         else:
-            inputs = np.zeros(
-                (batch_size, 1, freq_size, TEST_INPUT_PAD_LENGTH), dtype=np.float32
-            )
+            inputs = np.zeros((batch_size, 1, freq_size, pad_length), dtype=np.float32)
             targets = []
             for k, spect_, scripts_ in zip(
                 range(batch_size), batch_spect, batch_script
@@ -177,6 +261,8 @@ def create_dataset(
     train_mode=True,
     rank=None,
     group_size=None,
+    bucket_lengths=None,
+    frames_per_batch=None,
 ):
     """
     create train dataset
@@ -190,6 +276,8 @@ def create_dataset(
         batch_size (int): Dataset batch size
         rank (int): The shard ID within num_shards (default=None).
         group_size (int): Number of shards that the dataset should be divided into (default=None).
+        bucket_lengths (list): The padded lengths in frames of the duration buckets (default=None).
+        frames_per_batch (int): The padded frames per batch of the duration buckets (default=None).
 
     Returns:
         Dataset.
@@ -202,6 +290,8 @@ def create_dataset(
         normalize=normalize,
         batch_size=batch_size,
         is_training=train_mode,
+        bucket_lengths=bucket_lengths,
+        frames_per_batch=frames_per_batch,
     )
 
     sampler = DistributedSampler(dataset, rank, group_size, shuffle=True)
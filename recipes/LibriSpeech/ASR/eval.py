@@ -67,6 +67,8 @@ if __name__ == "__main__":
         batch_size=args.EvalConfig.batch_size,
         rank=0,
         group_size=1,
+        bucket_lengths=args.EvalConfig.get("bucket_lengths"),
+        frames_per_batch=args.EvalConfig.get("frames_per_batch"),
     )
 
     param_dict = load_checkpoint(args.Pretrained_model)
@@ -33,6 +33,8 @@ def train(args):
         batch_size=args.TrainingConfig.batch_size,
         rank=rank_id,
         group_size=group_size,
+        bucket_lengths=args.TrainingConfig.get("bucket_lengths"),
+        frames_per_batch=args.TrainingConfig.get("frames_per_batch"),
     )
 
     steps_size = ds_train.get_dataset_size()
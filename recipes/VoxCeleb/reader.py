@@ -4,8 +4,6 @@ import pickle
 
 import numpy as np
 
-np.random.seed(58)
-
 
 class DatasetGeneratorBatchEval:
     def __init__(self, data_path, read_limit=5000000):
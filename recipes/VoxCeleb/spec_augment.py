@@ -7,11 +7,16 @@ import wget
 
 import mindaudio.data.io as io
 from mindaudio.data.augment import (
+    AugmentPipeline,
+    AugmentStage,
+    NoiseBank,
+    RIRBank,
     add_babble,
     add_noise,
     add_reverb,
     drop_chunk,
     drop_freq,
+    get_rng,
     speed_perturb,
 )
 from mindaudio.data.processing import stereo_to_mono
@@ -40,32 +45,41 @@ class InputNormalization:
         self.norm_type = norm_type
         self.eps = 1e-10
 
-    def construct(self, x_input):
-        batches = x_input.shape[0]
-        for snt_id in range(batches):
-            # Avoiding padded time steps
-            actual_size = x_input.shape[1]
-
-            current_mean, current_std = self._compute_current_stats(
-                x_input[snt_id, 0:actual_size, ...]
-            )
-
-            if self.norm_type == "sentence":
-                x_input[snt_id] = (x_input[snt_id] - current_mean) / current_std
-
-        return x_input
+    def construct(self, x_input, lengths=None):
+        """
+        Normalize a batch of features `[batch, time, feature]`, `lengths` are the
+        relative lengths of the sentences, whose padding is left out of the statistics.
+        """
+        if self.norm_type != "sentence":
+            return x_input
+
+        num_frames = x_input.shape[1]
+        if lengths is None:
+            lengths = np.ones(x_input.shape[0])
+        actual_size = np.round(np.asarray(lengths) * num_frames)
+        # [batch, 1, time] weights, so the statistics are batched matrix products
+        mask = np.arange(num_frames) < actual_size[:, None, None]
+        mask = mask / np.maximum(actual_size, 1)[:, None, None]
+        current_mean, current_std = self._compute_current_stats(
+            x_input, mask.astype(x_input.dtype)
+        )
+        return (x_input - current_mean) / current_std
 
-    def _compute_current_stats(self, x_input):
+    def _compute_current_stats(self, x_input, mask):
+        # Statistics of every sentence over its frames, avoiding padded time steps.
+        # The std is always taken around the sentence mean, even if it is not removed
+        sentence_mean = mask @ x_input
         if self.mean_norm:
-            current_mean = np.mean(x_input, axis=0)
+            current_mean = sentence_mean
         else:
-            current_mean = np.array([0.0])
+            current_mean = np.zeros((1, 1, 1), dtype=x_input.dtype)
 
         # Compute current std
         if self.std_norm:
-            current_std = np.std(x_input, axis=0)
+            current_std = np.sqrt(mask @ np.square(x_input - sentence_mean))
+            current_std = np.maximum(current_std, self.eps)
         else:
-            current_std = np.array([1.0])
+            current_std = np.ones((1, 1, 1), dtype=x_input.dtype)
 
         return current_mean, current_std
 
@@ -107,14 +121,16 @@ class AddNoise:
         for batch in iterator:
             wav_file = batch["wav"]
             self.noise_data.append(str(wav_file))
+        self.noise_bank = NoiseBank(self.noise_data)
 
-    def construct(self, waveforms):
+    def construct(self, waveforms, rng=None):
         noisy_waveform = add_noise(
             waveforms,
-            self.noise_data,
+            self.noise_bank,
             self.snr_low,
             self.snr_high,
             self.mix_prob,
+            rng=rng,
         )
 
         # Normalizing to prevent clipping
@@ -144,9 +160,10 @@ class AddReverb:
         for batch in iterator:
             wav_file = batch["wav"]
             self.rir_data.append(str(wav_file))
+        self.rir_bank = RIRBank(self.rir_data)
 
-    def construct(self, waveforms):
-        rev_waveform = add_reverb(waveforms, self.rir_data, self.reverb_prob)
+    def construct(self, waveforms, rng=None):
+        rev_waveform = add_reverb(waveforms, self.rir_bank, self.reverb_prob, rng=rng)
         return rev_waveform
 
 
@@ -165,7 +182,7 @@ class AddBabble:
         self.snr_high = snr_high
         self.mix_prob = mix_prob
 
-    def construct(self, waveforms, lengths):
+    def construct(self, waveforms, lengths, rng=None):
         babbled_waveform = add_babble(
             waveforms,
             lengths,
@@ -173,6 +190,7 @@ class AddBabble:
             self.snr_low,
             self.snr_high,
             self.mix_prob,
+            rng=rng,
         )
         return babbled_waveform
 
@@ -240,21 +258,24 @@ class EnvCorrupt:
                 csv_file=reverb_csv,
             )
 
-    def construct(self, waves, lens):
+    def construct(self, waves, lens, rng=None):
         """
         Returns the distorted waveforms.
 
         Args:
             waves : np array, The waveforms to distort.
             lens : int, comparing to max waveform.
+            rng : int or np.random.Generator, The seed or generator of the
+                random draws.
         """
 
+        rng = get_rng(rng)
         if hasattr(self, "add_reverb"):
-            waves = self.add_reverb.construct(waves)
+            waves = self.add_reverb.construct(waves, rng=rng)
         if hasattr(self, "add_babble"):
-            waves = self.add_babble.construct(waves, lens)
+            waves = self.add_babble.construct(waves, lens, rng=rng)
         if hasattr(self, "add_noise"):
-            waves = self.add_noise.construct(waves)
+            waves = self.add_noise.construct(waves, rng=rng)
 
         return waves
 
@@ -381,17 +402,46 @@ class TimeDomainSpecAugment:
         self.drop_freq_count_low = drop_freq_count_low
         self.drop_freq_count_high = drop_freq_count_high
         self.drop_chunk_prob = drop_chunk_prob
+        self.pipeline = AugmentPipeline(
+            [
+                AugmentStage(
+                    speed_perturb,
+                    prob=perturb_prob,
+                    layout="channels_last",
+                    uses_lengths=True,
+                    orig_freq=sample_rate,
+                    speeds=speeds,
+                ),
+                AugmentStage(
+                    drop_freq,
+                    prob=drop_freq_prob,
+                    layout="channels_last",
+                    drop_count_low=drop_freq_count_low,
+                    drop_count_high=drop_freq_count_high,
+                ),
+                AugmentStage(
+                    drop_chunk,
+                    prob=drop_chunk_prob,
+                    layout="channels_last",
+                    uses_lengths=True,
+                    drop_length_low=drop_chunk_length_low,
+                    drop_length_high=drop_chunk_length_high,
+                    drop_count_low=drop_chunk_count_low,
+                    drop_count_high=drop_chunk_count_high,
+                    noise_factor=drop_chunk_noise_factor,
+                ),
+            ]
+        )
 
-    def construct(self, waves, lens):
+    def construct(self, waves, lens, rng=None):
         """
         Returns the distorted waveforms.
 
         Args:
             waves : np array, The waveforms to distort
+            rng : int or np.random.Generator, The seed or generator of the
+                random draws.
         """
 
-        waves = speed_perturb(waves, self.sample_rate, self.speeds)
-        waves = drop_freq(waves)
-        waves = drop_chunk(waves, lens)
-
+        waves, _ = self.pipeline(waves, lens, rng=rng)
         return waves
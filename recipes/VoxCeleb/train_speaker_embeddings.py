@@ -33,6 +33,7 @@ from util import AdditiveAngularMargin
 from voxceleb_prepare import prepare_voxceleb
 
 import mindaudio.data.io as io
+from mindaudio.data.augment import worker_rng
 from mindaudio.data.features import fbank
 from mindaudio.data.processing import stereo_to_mono
 from mindaudio.models.ecapatdnn import Classifier, EcapaTDNN
@@ -538,7 +539,9 @@ def generate_npy(
     count = 0
     label_fp_list = []
     fea_fp_list = []
-    for i in range(hparams.number_of_epochs):
+    for epoch in range(hparams.number_of_epochs):
+        # Independent, reproducible augmentation stream per process and epoch
+        rng = worker_rng(hparams.seed, worker_id=index, epoch=epoch)
         for batch in iterator:
             wavs = batch["sig"].astype(ms.float32)
             lens = np.ones(wavs.shape[0])
@@ -546,7 +549,9 @@ def generate_npy(
             wavs_aug_tot.append(wavs)
 
             for aug in spec_aug:
-                wavs_aug = Tensor(aug.construct(wavs.asnumpy(), lens), ms.float32)
+                wavs_aug = Tensor(
+                    aug.construct(wavs.asnumpy(), lens, rng=rng), ms.float32
+                )
 
                 if wavs_aug.shape[1] > wavs.shape[1]:
                     wavs_aug = wavs_aug[:, 0 : wavs.shape[1]]
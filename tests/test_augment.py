@@ -45,6 +45,35 @@ class TestOperators:
         masked = augment.timemasking(orignal, frequency_mask_param=80)
         print(masked)
 
+    def test_spec_augment(self):
+        specgrams = np.random.rand(16, 80, 400) + 1.0
+        lengths = np.linspace(0.25, 1.0, 16)
+        frame_lengths = np.round(lengths * 400).astype(int)
+
+        masked = augment.spec_augment(
+            specgrams, lengths, num_freq_masks=0, num_time_masks=3, time_mask_width=20
+        )
+        masked_frames = np.all(masked == 0, axis=1)
+        for i in range(16):
+            assert not masked_frames[i, frame_lengths[i] :].any()
+            assert masked_frames[i].sum() <= 60
+
+        masked = augment.spec_augment(
+            specgrams, num_freq_masks=2, freq_mask_width=10, num_time_masks=0
+        )
+        assert np.all(np.sum(np.all(masked == 0, axis=2), axis=1) <= 20)
+
+        ramp = np.tile(np.arange(400, dtype=np.float32), (16, 2, 1))
+        warped = augment.spec_augment(
+            ramp, lengths, num_freq_masks=0, num_time_masks=0, time_warp=10
+        )
+        assert warped.dtype == np.float32
+        for i in range(16):
+            assert np.all(np.diff(warped[i, 0, : frame_lengths[i]]) > 0)
+            assert np.allclose(
+                warped[i, :, frame_lengths[i] :], ramp[i, :, frame_lengths[i] :]
+            )
+
     def test_reverberate(self):
         samples, _ = io.read(self.data_path)
         rirs, _ = io.read(self.rir_list[0])
@@ -93,6 +122,174 @@ class TestOperators:
         addrir = augment.add_reverb(samples, self.rir_list, 1.0)
         print(addrir.shape)
 
+    def test_noise_bank(self):
+        bank = augment.NoiseBank(self.background_list)
+        assert len(bank) == 2
+        noise = bank.sample(4, 50000)
+        assert noise.shape == (4, 50000)
+        assert np.allclose(np.sqrt(np.mean(noise**2, axis=-1)), 1.0, atol=1e-3)
+
+        samples = np.random.rand(4, 1, 50000) - 0.5
+        addnoise = augment.add_noise(samples, bank, 10, 10, 1.0)
+        assert addnoise.shape == samples.shape
+        noise_rms = np.sqrt(np.mean((addnoise - samples) ** 2, axis=-1))
+        sample_rms = np.sqrt(np.mean(samples**2, axis=-1))
+        assert np.allclose(noise_rms, sample_rms / np.sqrt(10), rtol=1e-3)
+
+    def test_rir_bank(self):
+        bank = augment.RIRBank(self.rir_list)
+        samples = np.random.rand(3, 20000) - 0.5
+        index = np.array([0, 2, 1])
+        reverbed = bank.reverberate(samples, index, rescale_amp=None)
+        for i in range(3):
+            rir = bank.rirs[index[i]]
+            start = bank.direct_index[index[i]]
+            expected = np.convolve(samples[i], rir)[start : start + 20000]
+            assert np.allclose(reverbed[i], expected, atol=1e-4)
+
+        addrir = augment.add_reverb(np.random.rand(4, 2, 50000) - 0.5, bank, 1.0)
+        assert addrir.shape == (4, 2, 50000)
+
+    def test_simulate_rir(self):
+        room, source, mic = [6.0, 4.0, 3.0], [2.0, 1.5, 1.2], [4.0, 2.5, 1.5]
+        distance = np.linalg.norm(np.subtract(mic, source))
+        direct = augment.simulate_rir(room, source, mic, max_order=0)
+        assert direct.ndim == 1
+        assert np.argmax(direct) == round(distance * 16000 / 343.0)
+
+        rirs = augment.simulate_rir(
+            np.tile(room, (2, 1)), source, mic, absorption=[0.2, 0.8], max_order=6
+        )
+        assert rirs.shape[0] == 2 and rirs.dtype == np.float32
+        assert np.sum(rirs[0] ** 2) > np.sum(rirs[1] ** 2) > np.sum(direct**2)
+
+        bank = augment.RIRBank.simulate(16, rng=0)
+        assert len(bank) == 16
+        assert np.array_equal(bank.rirs, augment.RIRBank.simulate(16, rng=0).rirs)
+        reverbed = augment.add_reverb(np.random.rand(4, 16000) - 0.5, bank)
+        assert reverbed.shape == (4, 16000)
+
+    def test_augment_pipeline(self):
+        stages = [
+            augment.AugmentStage(
+                augment.speed_perturb,
+                layout="channels_last",
+                uses_lengths=True,
+                orig_freq=16000,
+                speeds=[90, 110],
+            ),
+            augment.AugmentStage(augment.drop_freq, layout="channels_last"),
+            augment.AugmentStage(
+                augment.add_reverb, rirlist=augment.RIRBank(self.rir_list)
+            ),
+            augment.AugmentStage(
+                augment.drop_chunk, layout="channels_last", uses_lengths=True
+            ),
+        ]
+        waveforms = np.random.rand(4, 2, 16000) - 0.5
+        lengths = np.array([1.0, 0.5, 0.8, 1.0])
+
+        pipeline = augment.AugmentPipeline(stages)
+        augmented, new_lengths = pipeline(waveforms, lengths)
+        assert augmented.shape[:2] == (4, 2)
+        assert augmented.shape[-1] in (14400, 17600)
+        assert np.max(new_lengths) <= 1.0
+        assert set(pipeline.timings) == {
+            "speed_perturb",
+            "drop_freq+add_reverb",
+            "drop_chunk",
+        }
+        assert pipeline(waveforms[:, 0]).shape[0] == 4
+
+        with augment.AugmentPipeline(stages, num_workers=2) as pipeline:
+            augmented, new_lengths = pipeline(waveforms, lengths)
+        assert augmented.shape[:2] == (4, 2)
+        assert new_lengths.shape == (4,)
+        assert pipeline.timings["drop_chunk"]["calls"] == 2
+
+        runs = []
+        for num_workers in [0, 0, 2]:
+            with augment.AugmentPipeline(
+                stages, num_workers=num_workers, seed=1234
+            ) as pipeline:
+                runs.append([pipeline(waveforms, lengths) for _ in range(2)])
+        assert np.array_equal(runs[0][0][0], runs[1][0][0])
+        assert np.array_equal(runs[0][1][1], runs[1][1][1])
+        assert not np.array_equal(
+            runs[0][0][0][..., :14400], runs[0][1][0][..., :14400]
+        )
+        assert runs[2][0][0].shape[:2] == (4, 2)
+
+        # Every stage is drawn per item, with the same probability whether it
+        # is fused or not
+        waveforms = np.random.rand(200, 1, 2000) - 0.5
+        for fuse in (True, False):
+            stages = [
+                augment.AugmentStage(
+                    augment.drop_freq, layout="channels_last", drop_prob=0.5
+                ),
+                augment.AugmentStage(
+                    augment.add_reverb,
+                    rirlist=augment.RIRBank(self.rir_list),
+                    reverb_prob=0.5,
+                ),
+            ]
+            pipeline = augment.AugmentPipeline(stages, fuse=fuse, seed=0)
+            augmented = pipeline(waveforms)
+            unchanged = [
+                np.allclose(item, orig, atol=1e-6)
+                for item, orig in zip(augmented, waveforms)
+            ]
+            assert 0.15 < np.mean(unchanged) < 0.35
+
+        stage = augment.AugmentStage(
+            augment.speed_perturb,
+            prob=0.5,
+            layout="channels_last",
+            uses_lengths=True,
+            orig_freq=16000,
+            speeds=[90, 110],
+        )
+        pipeline = augment.AugmentPipeline([stage], seed=0)
+        augmented, new_lengths = pipeline(waveforms, np.ones(200))
+        assert augmented.shape == (200, 1, 2200)
+        assert set(np.round(new_lengths * 2200)) == {1800, 2000, 2200}
+
+    def test_rng(self):
+        waveforms = np.random.rand(4, 16000) - 0.5
+        lengths = np.array([1.0, 0.5, 0.8, 1.0])
+        bank = augment.RIRBank(self.rir_list)
+        for func, kwargs in [
+            (augment.drop_freq, {}),
+            (augment.drop_chunk, {"lengths": lengths, "noise_factor": 1.0}),
+            (augment.add_babble, {"lengths": lengths, "snr_high": 10}),
+            (augment.add_reverb, {"rirlist": bank}),
+            (
+                augment.add_noise,
+                {
+                    "backgroundlist": self.background_list,
+                    "min_snr_in_db": 0,
+                    "max_snr_in_db": 10,
+                },
+            ),
+        ]:
+            first = func(waveforms, rng=7, **kwargs)
+            second = func(waveforms, rng=augment.get_rng(7), **kwargs)
+            assert np.array_equal(first, second)
+
+        np.random.seed(0)
+        first = augment.drop_freq(waveforms)
+        np.random.seed(0)
+        assert np.array_equal(first, augment.drop_freq(waveforms))
+
+        streams = [
+            augment.worker_rng(1234, worker_id, epoch).integers(2**62)
+            for worker_id in range(4)
+            for epoch in range(3)
+        ]
+        assert len(set(streams)) == 12
+        assert augment.worker_rng(1234, 2, 1).integers(2**62) == streams[7]
+
     def test_add_babble(self):
         wav_num = 0
         maxlen = 0
@@ -116,11 +313,49 @@ class TestOperators:
         )
         print(noisy_mindaudio.shape)
 
+        # Same output as summing the rolled batch over the padded length
+        waveforms = np.random.rand(6, 3000) - 0.5
+        lengths = np.array([1.0, 0.5, 0.8, 1.0, 0.3, 0.9])
+        waveforms[np.arange(3000) >= lengths[:, None] * 3000] = 0.0
+        babbled = augment.add_babble(waveforms, lengths, snr_high=10, rng=0)
+        rng = np.random.default_rng(0)
+        rng.random()
+        factor = 1 / (10 ** (rng.uniform(0, 10, (6, 1)) / 10) + 1)
+        babble = sum(np.roll(waveforms, 1 + i, axis=0) for i in range(3))
+        babble_lengths = np.max([np.roll(lengths, 1 + i) for i in range(3)], axis=0)
+        clean_amplitude = np.sum(np.abs(waveforms), 1) / (lengths * 3000)
+        babble_amplitude = np.sum(np.abs(babble), 1) / (babble_lengths * 3000)
+        scale = factor * (clean_amplitude / babble_amplitude)[:, None]
+        assert np.allclose(babbled, (1 - factor) * waveforms + scale * babble)
+
+    def test_mix_babble(self):
+        waveforms = np.random.rand(8, 4000, 2) - 0.5
+        lengths = np.array([4000, 3000, 2500, 4000, 1000, 3500, 2000, 4000])
+        waveforms[np.arange(4000) >= lengths[:, None]] = 0.0
+        babbled = augment.mix_babble(waveforms, lengths, speaker_count=5, rng=0)
+        assert babbled.shape == waveforms.shape
+        for i, length in enumerate(lengths):
+            assert np.all(babbled[i, length:] == 0.0)
+            # At 0 dB the babble has half the clean amplitude
+            clean = np.mean(np.abs(waveforms[i, :length]), axis=0)
+            babble = np.mean(
+                np.abs(babbled[i, :length] - 0.5 * waveforms[i, :length]), axis=0
+            )
+            assert np.allclose(babble, 0.5 * clean)
+
+        single = augment.mix_babble(waveforms[:1], lengths[:1])
+        assert np.array_equal(single, waveforms[:1])
+
     def test_drop_freq(self):
         signal, _ = io.read(self.background_list[0])
         dropped_signal_mindaudio = augment.drop_freq(signal)
         print(dropped_signal_mindaudio)
 
+        waveforms = np.random.randn(8, 16000, 2)
+        dropped = augment.drop_freq(waveforms, drop_count_low=3, drop_count_high=3)
+        assert dropped.shape == waveforms.shape
+        assert np.mean(dropped**2) < np.mean(waveforms**2)
+
     def test_speed_perturb(self):
         signal, _ = io.read(self.background_list[0])
         perturbed_mindaudio = augment.speed_perturb(
@@ -128,6 +363,15 @@ class TestOperators:
         )
         print(perturbed_mindaudio)
 
+        waveforms = np.random.rand(6, 16000, 2) - 0.5
+        lengths = np.array([1.0, 0.5, 0.8, 1.0, 1.0, 0.3])
+        perturbed, new_lengths = augment.speed_perturb(
+            waveforms, 16000, speeds=[90, 110], lengths=lengths
+        )
+        assert perturbed.shape[0] == 6 and perturbed.shape[2] == 2
+        assert perturbed.shape[1] in (14400, 17600)
+        assert np.all(new_lengths <= 1.0) and np.max(new_lengths) == 1.0
+
     def test_drop_chunk(self):
         wav_num = 0
         maxlen = 0
@@ -151,6 +395,19 @@ class TestOperators:
         )
         print(dropped_waveform)
 
+        dropped = augment.drop_chunk(
+            np.ones((4, 3000)),
+            np.ones(4),
+            drop_count_low=2,
+            drop_count_high=2,
+            drop_start=100,
+            drop_end=200,
+        )
+        assert np.all(np.sum(dropped == 0, axis=1) == 100)
+        assert np.all(dropped[:, 100:200] == 0)
+        noisy = augment.drop_chunk(np.ones((4, 3000, 2)), np.ones(4), noise_factor=1.0)
+        assert noisy.shape == (4, 3000, 2)
+
     def test_time_stretch(self):
         signal, _ = io.read(self.background_list[0])
         y_fast = augment.time_stretch(signal, rate=2.0)
@@ -165,6 +422,15 @@ class TestOperators:
             shift_waveform = augment.pitch_shift(waveform, sr=16000, n_steps=4)
             print(shift_waveform.shape)
 
+        sine = np.sin(2 * np.pi * 440 * np.arange(32000) / 16000)
+        stretched = augment.time_stretch(sine, rate=1.5)
+        shifted = augment.pitch_shift(sine, sr=16000, n_steps=12)
+        assert stretched.shape == (21333,)
+        assert shifted.shape == sine.shape
+        for waveform, freq in [(stretched, 440), (shifted, 880)]:
+            peak = np.argmax(np.abs(np.fft.rfft(waveform))) * 16000 / len(waveform)
+            assert abs(peak - freq) < 2
+
 
 if __name__ == "__main__":
     test = TestOperators()
@@ -2,6 +2,7 @@ import os
 import sys
 
 import numpy as np
+from scipy.ndimage import median_filter
 
 sys.path.append(".")
 import mindaudio.data.features as features
@@ -37,6 +38,15 @@ class TestOperators:
         deltas = features.compute_deltas(specgram)
         print(deltas.shape)
 
+    def test_compute_deltas_order(self):
+        specgram = np.random.random([2, 40, 300]).astype(np.float32)
+        delta1 = features.compute_deltas(specgram)
+        delta2 = features.compute_deltas(delta1)
+        deltas = features.compute_deltas(specgram, order=2)
+        assert deltas.shape == (2, 80, 300)
+        assert np.allclose(deltas[:, :40], delta1, atol=1e-6)
+        assert np.allclose(deltas[:, 40:], delta2, atol=1e-6)
+
     def test_fbank(self):
         inputs = np.random.random([10, 16000])
         feats = features.fbank(inputs)
@@ -61,6 +71,62 @@ class TestOperators:
         harm = features.harmonic(self.test_data)
         print(harm)
 
+    def test_running_median(self):
+        spec = np.abs(np.random.randn(2, 120, 90))
+        # Repeated values as well, which the two halves of the window share
+        spec[1] = np.round(spec[1])
+        for size in [31, 4, 2, 1]:
+            expected = median_filter(spec, size=[1, 1, size], mode="reflect")
+            assert np.allclose(features.running_median(spec, size, axis=-1), expected)
+            expected = median_filter(spec, size=[1, size, 1], mode="reflect")
+            assert np.allclose(features.running_median(spec, size, axis=-2), expected)
+
+    def test_hpss_batch(self):
+        waveforms = np.random.randn(3, 8000)
+        harm = features.harmonic(waveforms)
+        perc = features.percussive(waveforms)
+        assert harm.shape == waveforms.shape
+        assert perc.shape == waveforms.shape
+
+    def test_yin(self):
+        t = np.arange(16000) / 16000
+        waveforms = np.stack([np.sin(2 * np.pi * 220 * t), np.sin(2 * np.pi * 330 * t)])
+        f0 = features.yin(waveforms, sample_rate=16000, hop_length=160)
+        mel = spectrum.melspectrogram(waveforms, n_fft=512, hop_length=160)
+        assert f0.shape == (2, mel.shape[-1])
+        assert np.allclose(np.median(f0, axis=-1), [220, 330], rtol=0.01)
+
+    def test_pyin(self):
+        t = np.arange(16000) / 16000
+        waveform = np.sin(2 * np.pi * 220 * t)
+        waveform[:8000] = 0.0
+        f0, voiced_flag, voiced_prob = features.pyin(
+            waveform, sample_rate=16000, hop_length=160
+        )
+        assert not voiced_flag[:40].any()
+        assert voiced_flag[60:-10].all()
+        assert np.allclose(np.median(f0[60:]), 220, rtol=0.01)
+
+    def test_energy(self):
+        waveforms = np.random.randn(3, 16000)
+        mel = spectrum.melspectrogram(waveforms, n_fft=512, hop_length=160)
+        energy = features.energy(waveforms, n_fft=512, hop_length=160)
+        assert energy.shape == (3, mel.shape[-1])
+
+    def test_cqt(self):
+        t = np.arange(22050 * 2) / 22050
+        waveforms = np.stack([np.sin(2 * np.pi * 440 * t), np.sin(2 * np.pi * 110 * t)])
+        cqt = features.cqt(waveforms, sample_rate=22050, hop_length=512)
+        assert cqt.shape == (2, 84, 1 + waveforms.shape[-1] // 512)
+        # A4 and A2 are 45 and 21 semitones above C1
+        assert list(np.argmax(np.abs(cqt[..., 40]), axis=-1)) == [45, 21]
+
+    def test_chroma_cqt(self):
+        t = np.arange(22050 * 2) / 22050
+        chroma = features.chroma_cqt(np.sin(2 * np.pi * 440 * t), sample_rate=22050)
+        assert chroma.shape[0] == 12
+        assert np.argmax(chroma[:, 40]) == 9
+
 
 if __name__ == "__main__":
     test = TestOperators()
@@ -1,6 +1,9 @@
 import os
 import sys
 
+import numpy as np
+import pytest
+
 sys.path.append(".")
 import mindaudio.data.filters as filters
 import mindaudio.data.io as io
@@ -20,12 +23,110 @@ class TestOperators:
         notched_signals = convolve1d(waveform, kernel)
         print(notched_signals.shape)
 
+    def test_convolve1d_linear(self):
+        waveforms = np.random.randn(3, 5000)
+        for kernel_size in [7, 101, 3000]:
+            kernels = np.random.randn(3, kernel_size)
+            convolved = convolve1d(waveforms, kernels)
+            for i in range(3):
+                expected = np.convolve(waveforms[i], kernels[i])[:5000]
+                assert np.allclose(convolved[i], expected)
+
+        kernel = np.random.randn(11)
+        correlated = convolve1d(waveforms, kernel, padding=5, use_fft=False)
+        expected = np.correlate(np.pad(waveforms[0], 5), kernel, "valid")
+        assert np.allclose(correlated[0], expected)
+
     def test_low_pass_filter(self):
         waveform, sample_rate = io.read(self.data_path)
         cutoff_freq = 1500
         out_waveform = filters.low_pass_filter(waveform, sample_rate, cutoff_freq)
         print(out_waveform)
 
+    def test_cal_filter_by_coffs(self):
+        waveform = np.random.randn(1000, 2)
+        original = waveform.copy()
+        b = np.array([0.2, 0.4, 0.2])
+        a = np.array([1.0, -0.3, 0.1])
+        filtered = filters.cal_filter_by_coffs(waveform, b, a, clamp=False)
+        assert np.array_equal(waveform, original)
+
+        x, y = np.pad(waveform[:, 1], (2, 0)), np.zeros(1002)
+        for j in range(2, 1002):
+            y[j] = b @ x[j - 2 : j + 1][::-1] - a[1] * y[j - 1] - a[2] * y[j - 2]
+        expected = y[2:]
+        assert np.allclose(filtered[:, 1], expected)
+
+        clamped = filters.low_pass_filter(waveform.astype(np.float32), 16000, 1500)
+        assert clamped.dtype == np.float32
+        assert np.abs(clamped).max() <= 1.0
+
+    def test_sos_chain(self):
+        from scipy import signal
+
+        waveforms = np.random.randn(4, 2, 3000).astype(np.float32)
+        specs = [
+            ("highpass", {"cutoff_freq": 80}),
+            ("peaking", {"center_freq": 1500, "gain": 3.0}),
+            ("treble", {"center_freq": 3000, "gain": -6.0}),
+        ]
+        sos = filters.sos_chain(specs, 16000)
+        assert sos.shape == (3, 6)
+        filtered = filters.sos_filter(waveforms, sos)
+        assert filtered.shape == waveforms.shape and filtered.dtype == np.float32
+
+        expected = waveforms.astype(np.float64)
+        for filter_type, params in specs:
+            section = filters.design_biquad(filter_type, 16000, **params)[0]
+            expected = signal.lfilter(section[:3], section[3:], expected)
+        assert np.allclose(filtered, expected, atol=1e-4)
+
+        riaa = filters.riaa_biquad(waveforms * 0.1, 44100)
+        assert riaa.shape == waveforms.shape
+        with pytest.raises(ValueError):
+            filters.design_biquad("riaa", 16000)
+
+    def test_streaming_filter(self):
+        waveforms = np.random.randn(2, 8000).astype(np.float32) * 0.1
+        specs = [("highpass", {"cutoff_freq": 80}), ("lowpass", {"cutoff_freq": 4000})]
+        stream = filters.StreamingFilter.from_specs(specs, 16000)
+        blocks = np.array_split(waveforms, 7, axis=-1)
+        filtered = np.concatenate([stream(block) for block in blocks], axis=-1)
+        expected = filters.sos_filter(waveforms, filters.sos_chain(specs, 16000))
+        assert filtered.dtype == np.float32
+        assert np.allclose(filtered, expected, atol=1e-6)
+
+        stream.reset()
+        assert np.allclose(stream(waveforms), expected, atol=1e-6)
+
+    def test_filtfilt(self):
+        from scipy import signal
+
+        waveforms = np.random.randn(3, 4000).astype(np.float32)
+        filtered = filters.filtfilt(waveforms, N=8, Wn=0.02, btype="highpass")
+        sos = signal.butter(8, 0.02, "highpass", output="sos")
+        assert filtered.dtype == np.float32
+        assert np.allclose(filtered, signal.sosfiltfilt(sos, waveforms), atol=1e-5)
+
+        filtered = filters.filtfilt(waveforms.T, 4, [0.1, 0.3], "bandpass", axis=0)
+        assert filtered.shape == (4000, 3)
+        gust = filters.filtfilt(waveforms, 4, [0.1, 0.3], "bandpass", method="gust")
+        b, a = signal.butter(4, [0.1, 0.3], "bandpass")
+        expected = signal.filtfilt(b, a, waveforms, method="gust")
+        assert np.allclose(gust, expected, atol=1e-5)
+
+        # High orders and low cutoffs, where the transfer function is unusable
+        constant = np.ones((2, 20000))
+        gust = filters.filtfilt(constant, 10, 0.01, "lowpass", method="gust")
+        assert np.allclose(gust, 1.0)
+        waveforms = np.random.randn(2, 20000)
+        gust = filters.filtfilt(waveforms, 8, 0.005, "highpass", method="gust")
+        expected = signal.sosfiltfilt(
+            signal.butter(8, 0.005, "highpass", output="sos"), waveforms
+        )
+        assert np.allclose(gust[:, 6000:-6000], expected[:, 6000:-6000])
+        assert np.max(np.abs(gust)) < 10
+
     def test_peaking_equalizer(self):
         waveform, sample_rate = io.read(self.data_path)
         center_freq = 1500
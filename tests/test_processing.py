@@ -30,6 +30,26 @@ def test_resample():
     print(waveform.shape)
     print(y_8k.shape)
 
+    t = np.arange(16000) / 16000
+    waveform = np.sin(2 * np.pi * 440 * t)
+    y_hat = processing.resample(waveform, 16000, 14400, res_type="polyphase")
+    expected = np.sin(2 * np.pi * 440 * np.arange(14400) / 14400)
+    assert y_hat.shape == (14400,)
+    assert np.allclose(y_hat[100:-100], expected[100:-100], atol=1e-4)
+
+
+def test_streaming_resampler():
+    waveforms = np.random.randn(2, 20011).astype(np.float32)
+    expected = processing.resample(waveforms, 44100, 16000, res_type="polyphase")
+    stream = processing.StreamingResampler(44100, 16000)
+    blocks = [stream(block) for block in np.array_split(waveforms, 13, axis=-1)]
+    y_hat = np.concatenate(blocks + [stream.flush()], axis=-1)
+    assert y_hat.shape == expected.shape and y_hat.dtype == np.float32
+    assert np.allclose(y_hat, expected, atol=1e-5)
+
+    y_hat = processing.resample(waveforms.T, 48000, 16000, "polyphase", axis=0)
+    assert y_hat.shape == (6671, 2)
+
 
 def test_rescale():
     root_path = sys.path[0]
@@ -55,17 +75,81 @@ def test_trim():
     print(wav_trimmed.shape)
 
 
+def test_trim_indices():
+    waveforms = np.zeros([3, 6000])
+    waveforms[0, 2000:4000] = 0.5
+    waveforms[1, 1000:] = 0.5
+    waveforms[2] = np.random.randn(6000) * 0.1
+    lengths = np.array([6000, 3000, 6000])
+    indices = processing.trim_indices(waveforms, lengths, top_db=10)
+    assert indices.shape == (3, 2)
+    for waveform, length, index in zip(waveforms, lengths, indices):
+        _, expected = processing.trim(waveform[:length], top_db=10)
+        assert np.array_equal(index, expected)
+    assert indices[1, 1] == 3000
+
+
 def test_split():
     waveforms = np.array([0.01] * 2048 + [0.6] * 2048 + [-0.01] * 2048 + [0.5] * 2048)
     indices = processing.split(waveforms, top_db=10)
     print(indices.shape)
 
 
+def test_streaming_vad():
+    rng = np.random.default_rng(0)
+    waveform = rng.standard_normal(16000 * 30) * 0.001
+    for start, stop in [(2.0, 5.0), (5.2, 6.0), (10.0, 10.1), (20.0, 30.0)]:
+        n = int((stop - start) * 16000)
+        waveform[int(start * 16000) :][:n] += rng.standard_normal(n) * 0.1
+    vad = processing.StreamingVAD(sample_rate=16000)
+    segments = np.concatenate([vad(waveform), vad.flush()])
+    # The short pause is bridged, the short burst is dropped, the open segment is closed
+    assert np.array_equal(segments, [[32000, 96000], [320000, 480000]])
+
+    blocks = np.array_split(waveform, 37)
+    chunked = np.concatenate([vad(block) for block in blocks] + [vad.flush()])
+    assert np.array_equal(chunked, segments)
+
+    # Speech from the first sample is found once the level drops
+    waveform = rng.standard_normal(16000 * 10) * 0.001
+    for start, stop in [(0.0, 3.0), (6.0, 8.0)]:
+        n = int((stop - start) * 16000)
+        waveform[int(start * 16000) :][:n] += rng.standard_normal(n) * 0.1
+    blocks = np.array_split(waveform, 23)
+    segments = np.concatenate([vad(block) for block in blocks] + [vad.flush()])
+    assert np.array_equal(segments, [[0, 48000], [96000, 128000]])
+
+
 def test_sliding_window_cmn():
     waveform = np.random.random([1, 20, 10])
     after_CMN = processing.sliding_window_cmn(waveform, 500, 200)
     print(after_CMN)
 
+    import mindspore.dataset.audio as msaudio
+
+    feats = np.random.randn(3, 120, 8)
+    for args in [(30, 10, False, False), (30, 10, True, True), (7, 40, False, True)]:
+        expected = msaudio.SlidingWindowCmn(*args)(feats)
+        assert np.allclose(processing.sliding_window_cmn(feats, *args), expected)
+
+    lengths = np.array([120, 50, 9])
+    after_CMN = processing.sliding_window_cmn(
+        feats, 30, 10, norm_vars=True, lengths=lengths
+    )
+    for feat, length, normalized in zip(feats, lengths, after_CMN):
+        expected = processing.sliding_window_cmn(feat[:length], 30, 10, norm_vars=True)
+        assert np.allclose(normalized[:length], expected)
+        assert not normalized[length:].any()
+
+    stream = processing.StreamingCMN(30, 10, norm_vars=True)
+    blocks = [stream(feats[0, :0])]
+    blocks += [stream(block) for block in np.array_split(feats[0], 17)]
+    blocks += [stream(feats[0, :0])]
+    streamed = np.concatenate(blocks + [stream.flush()])
+    assert np.allclose(
+        streamed, processing.sliding_window_cmn(feats[0], 30, 10, norm_vars=True)
+    )
+
 
 def test_invert_channels():
     waveform = np.array([1, 2, 3])
@@ -154,10 +238,13 @@ if __name__ == "__main__":
     test_normalize()
     test_unitarize()
     test_resample()
+    test_streaming_resampler()
     test_rescale()
     test_stereo_to_mono()
     test_trim()
+    test_trim_indices()
     test_split()
+    test_streaming_vad()
     test_sliding_window_cmn()
     test_invert_channels()
     test_loop()
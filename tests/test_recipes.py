@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(".")
+
+
+def test_voxceleb_input_normalization():
+    pytest.importorskip("wget")
+    sys.path.append(os.path.join("recipes", "VoxCeleb"))
+    from spec_augment import InputNormalization
+
+    feats = np.random.rand(4, 50, 6).astype(np.float32)
+    lengths = np.array([1.0, 0.5, 1.0, 0.8])
+    for mean_norm in (True, False):
+        for std_norm in (True, False):
+            normalize = InputNormalization(
+                mean_norm=mean_norm, std_norm=std_norm, norm_type="sentence"
+            )
+            normalized = normalize.construct(feats, lengths)
+            for feat, length, out in zip(feats, lengths, normalized):
+                valid = feat[: int(round(length * 50))]
+                mean = valid.mean(axis=0) if mean_norm else 0.0
+                std = valid.std(axis=0) if std_norm else 1.0
+                assert np.allclose(out, (feat - mean) / std, atol=1e-5)